@@ -1,18 +1,19 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import time
-import threading
 import os
 from datetime import datetime, timedelta
 
-from twitch_bot import TwitchBot
-from data_manager import DataManager
-from utils import format_time, get_emoji_status
+from event_bus import event_bus
+from farming_supervisor import ACTIVE_STATES, FarmingSupervisor
+from data_manager import create_data_manager
+from utils import format_time, get_emoji_status, send_discord_webhook, send_webhook_log
 from notification_manager import notification_manager
 from user_preferences import user_preferences
 from channel_manager import channel_manager
 from onboarding_tutorial import tutorial_manager
+from scheduler import get_schedule_runner, start_schedule_runner, stop_schedule_runner
+from channel_prober import get_channel_prober, start_channel_prober, stop_channel_prober
 
 # Page configuration
 st.set_page_config(
@@ -26,87 +27,82 @@ st.set_page_config(
 user_preferences.apply_theme()
 
 # Initialize session state variables if they don't exist
-if 'bot_running' not in st.session_state:
-    st.session_state.bot_running = False
-if 'active_bot' not in st.session_state:
-    st.session_state.active_bot = None
-if 'farming_thread' not in st.session_state:
-    st.session_state.farming_thread = None
 if 'channels' not in st.session_state:
     st.session_state.channels = []
 if 'selected_channel' not in st.session_state:
     st.session_state.selected_channel = None
-if 'start_time' not in st.session_state:
-    st.session_state.start_time = None
-if 'points_gained' not in st.session_state:
-    st.session_state.points_gained = 0
-if 'log_messages' not in st.session_state:
-    st.session_state.log_messages = []
-if 'data_manager' not in st.session_state:
-    st.session_state.data_manager = DataManager()
 
+# The data manager and the farming supervisor outlive reruns and browser reloads, one per server
+@st.cache_resource
+def get_data_manager():
+    return create_data_manager()
 
-# Custom function to update the UI while bot is running
-def bot_worker():
-    while st.session_state.bot_running:
-        # Update the UI periodically
-        time.sleep(10)
-        points_gained = st.session_state.active_bot.get_gained_points()
-        if points_gained > 0:
-            prev_points = st.session_state.points_gained
-            st.session_state.points_gained += points_gained
-            
-            # Update channel statistics in channel manager
-            channel_manager.update_channel_stats(
-                st.session_state.selected_channel, 
-                points_gained=points_gained, 
-                online=True
-            )
-            
-            # Check for milestones
-            notification_manager.check_milestone(
-                st.session_state.selected_channel, 
-                st.session_state.points_gained
-            )
-            
-            # Check for achievement unlocks
-            if st.session_state.points_gained >= 5000:
-                user_preferences.unlock_achievement("Point Collector")
-            
-            if st.session_state.points_gained >= 100000:
-                user_preferences.unlock_achievement("Twitch Master")
-            
-        # Check log messages
-        log_message = st.session_state.active_bot.get_latest_log()
-        if log_message:
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            formatted_log = f"[{timestamp}] {log_message}"
-            
-            # Add to local log messages
-            st.session_state.log_messages.append(formatted_log)
-            
-            # Send to Discord webhook
-            send_webhook_log(formatted_log)
-            
-            # Keep only the most recent 100 messages
-            if len(st.session_state.log_messages) > 100:
-                st.session_state.log_messages = st.session_state.log_messages[-100:]
-            
+@st.cache_resource
+def get_farming_supervisor():
+    # The bot's events (points, bonuses, stream status) go straight to the managers
+    data_manager = get_data_manager()
+    for manager in (data_manager, channel_manager, notification_manager, user_preferences):
+        manager.subscribe(event_bus)
+    
+    supervisor = FarmingSupervisor(event_bus)
+    supervisor.add_listener(farming_update_handler(data_manager))
+    return supervisor
+
+# Handles the farming worker's state changes and log lines on the supervisor's reader thread,
+# so it must not use st.session_state
+def farming_update_handler(data_manager):
+    def handle(kind, data, status):
+        channel = status["channel"]
+        # Stats changed by an update are saved with one write
+        with channel_manager.batch():
+            if kind == "state" and data["state"] == "farming":
+                # Record session start in data manager
+                data_manager.start_session(channel)
+                
+                # Update channel statistics
+                channel_manager.update_channel_stats(channel, online=True)
+                
+                # Send notification
+                notification_manager.send_in_app(f"Started farming on {channel}", "success")
             
+            elif kind == "state" and data.get("started_at"):
+                # Record session end with statistics
+                duration = (datetime.now() - data["started_at"]).total_seconds() / 60
+                data_manager.end_session(channel, duration, status["points_gained"])
                 
-            # Send in-app notification for bonus claims
-            if "bonus" in log_message.lower():
-                notification_manager.notify_bonus_claimed(
-                    st.session_state.selected_channel, 
-                    points_gained
+                # Send notification
+                notification_manager.send_in_app(
+                    f"Stopped farming on {channel}. Earned {status['points_gained']} points.", 
+                    "warning"
                 )
                 
-            # Check for stream offline mentions
-            if "offline" in log_message.lower():
-                channel_manager.update_channel_stats(
-                    st.session_state.selected_channel, 
-                    online=False
-                )
+                # Update channel stats with offline status
+                channel_manager.update_channel_stats(channel, online=False)
+                
+                # Check for Marathon Farmer achievement
+                if data_manager.get_total_watchtime() >= 24:  # 24 hours
+                    user_preferences.unlock_achievement("Marathon Farmer")
+            
+            if kind == "state" and data["state"] == "error":
+                notification_manager.send_in_app(f"Farming on {channel} failed: {status['error']}", "error")
+            
+            elif kind == "log":
+                # Send to Discord webhook
+                send_webhook_log(f"[{data['time'].strftime('%H:%M:%S')}] {data['message']}")
+    return handle
+
+st.session_state.data_manager = get_data_manager()
+supervisor = get_farming_supervisor()
+
+# Rates, recommendations and schedules use the measured points per hour
+channel_manager.set_point_rate_source(st.session_state.data_manager)
+
+# The bot runs in the supervisor's worker process; reruns only read its status
+farming_status = supervisor.snapshot()
+st.session_state.bot_running = farming_status["state"] in ACTIVE_STATES
+st.session_state.start_time = farming_status["started_at"]
+st.session_state.points_gained = farming_status["points_gained"]
+st.session_state.log_messages = supervisor.get_logs()
 
 # Function to start farming
 def start_farming():
@@ -126,27 +122,13 @@ def start_farming():
             st.error("Please enter your Twitch credentials.")
             return
         
-        st.session_state.active_bot = TwitchBot(username, password)
-        success = st.session_state.active_bot.login()
-        
-        if not success:
-            st.error("Failed to login to Twitch. Check your credentials.")
-            return
-            
-        st.session_state.bot_running = True
-        st.session_state.start_time = datetime.now()
-        st.session_state.points_gained = 0
+        # Login and farming happen in the worker process; the session is recorded once it is farming
+        supervisor.start(username, password, st.session_state.selected_channel)
         
         # Add log message
         timestamp = datetime.now().strftime('%H:%M:%S')
         log_message = f"[{timestamp}] Started farming on channel: {st.session_state.selected_channel}"
-        st.session_state.log_messages.append(log_message)
-        
-        # Send notification
-        notification_manager.send_in_app(
-            f"Started farming on {st.session_state.selected_channel}", 
-            "success"
-        )
+        supervisor.add_log(log_message)
         
         # Send to Discord webhook if enabled
         if st.session_state.enable_discord_logging and st.session_state.discord_webhook_url:
@@ -155,23 +137,6 @@ def start_farming():
                 webhook_url=st.session_state.discord_webhook_url
             )
         
-        # Start the bot in a separate thread
-        st.session_state.active_bot.start_farming(st.session_state.selected_channel)
-        
-        # Start worker thread to update UI
-        st.session_state.farming_thread = threading.Thread(target=bot_worker)
-        st.session_state.farming_thread.daemon = True
-        st.session_state.farming_thread.start()
-        
-        # Record session start in data manager
-        st.session_state.data_manager.start_session(st.session_state.selected_channel)
-        
-        # Update channel statistics
-        channel_manager.update_channel_stats(
-            st.session_state.selected_channel,
-            online=True
-        )
-        
         # Check if this is a new channel for achievements
         channels = st.session_state.data_manager.get_channel_stats()
         if len(channels) >= 3:
@@ -182,12 +147,16 @@ def start_farming():
         if 0 <= current_hour < 5:
             user_preferences.unlock_achievement("Night Owl")
         
-        st.success(f"Started farming on {st.session_state.selected_channel}")
-        time.sleep(1)
-        st.rerun()
+        st.success(f"Starting to farm {st.session_state.selected_channel}")
     except Exception as e:
         st.error(f"Error starting the bot: {str(e)}")
 
+# Function to switch the running bot to the selected channel
+def switch_farming():
+    supervisor.switch(st.session_state.selected_channel)
+    timestamp = datetime.now().strftime('%H:%M:%S')
+    supervisor.add_log(f"[{timestamp}] Switching to channel: {st.session_state.selected_channel}")
+
 # Function to stop farming
 def stop_farming():
     if not st.session_state.bot_running:
@@ -195,35 +164,14 @@ def stop_farming():
         return
         
     try:
-        st.session_state.bot_running = False
-        
-        if st.session_state.active_bot:
-            st.session_state.active_bot.stop_farming()
-            
-        # Record session end with statistics
-        duration = (datetime.now() - st.session_state.start_time).total_seconds() / 60
-        st.session_state.data_manager.end_session(
-            st.session_state.selected_channel,
-            duration,
-            st.session_state.points_gained
-        )
+        # The worker reports the final points, and the session is recorded, once the bot has stopped
+        supervisor.stop()
+        channel = farming_status["channel"]
         
         # Add log message
         timestamp = datetime.now().strftime('%H:%M:%S')
-        log_message = f"[{timestamp}] Stopped farming on channel: {st.session_state.selected_channel}"
-        st.session_state.log_messages.append(log_message)
-        
-        # Send notification
-        notification_manager.send_in_app(
-            f"Stopped farming on {st.session_state.selected_channel}. Earned {st.session_state.points_gained} points.", 
-            "warning"
-        )
-        
-        # Update channel stats with offline status
-        channel_manager.update_channel_stats(
-            st.session_state.selected_channel,
-            online=False
-        )
+        log_message = f"[{timestamp}] Stopped farming on channel: {channel}"
+        supervisor.add_log(log_message)
         
         # Send to Discord webhook if enabled
         if st.session_state.enable_discord_logging and st.session_state.discord_webhook_url:
@@ -232,23 +180,7 @@ def stop_farming():
                 webhook_url=st.session_state.discord_webhook_url
             )
         
-        # Check for Marathon Farmer achievement
-        total_time = st.session_state.data_manager.get_total_watchtime()
-        if total_time >= 24:  # 24 hours
-            user_preferences.unlock_achievement("Marathon Farmer")
-            
-        # Check for Bonus Hunter achievement
-        if "Bonus Hunter" in st.session_state:
-            bonus_claims = st.session_state.get("bonus_claims", 0)
-            if bonus_claims >= 10:
-                user_preferences.unlock_achievement("Bonus Hunter")
-        
-        st.success(f"Stopped farming on {st.session_state.selected_channel}")
-        
-        # Reset active bot
-        st.session_state.active_bot = None
-        time.sleep(1)
-        st.rerun()
+        st.success(f"Stopping farming on {channel}")
     except Exception as e:
         st.error(f"Error stopping the bot: {str(e)}")
 
@@ -315,20 +247,81 @@ with col1:
     
     # Bot controls
     if st.session_state.bot_running:
-        st.error("Bot Status: Running")
+        if farming_status["state"] == "starting":
+            st.warning(f"Bot Status: Logging in to farm {farming_status['channel']}...")
+        else:
+            st.error("Bot Status: Running")
         st.button("Stop Farming", on_click=stop_farming)
+        if st.session_state.selected_channel and st.session_state.selected_channel != farming_status["channel"]:
+            st.button(f"Switch to {st.session_state.selected_channel}", on_click=switch_farming)
     else:
+        if farming_status["state"] == "error":
+            st.error(f"Last farming attempt failed: {farming_status['error']}")
         st.success("Bot Status: Ready")
         st.button("Start Farming", on_click=start_farming)
     
+    # Scheduled farming
+    with st.expander("Scheduled Farming"):
+        channel_manager.render_channel_scheduling()
+        
+        runner = get_schedule_runner()
+        follow = st.toggle("Follow saved schedules", value=runner is not None,
+                           help="Start and stop farming automatically at the scheduled times")
+        schedule_query = st.text_input("Only farm scheduled channels matching",
+                                       value=runner.query or "" if runner else "",
+                                       placeholder="live AND NOT tag:late",
+                                       help="A channel query; leave empty to farm every scheduled channel")
+        if follow and runner is None:
+            if st.session_state.twitch_username and st.session_state.twitch_password:
+                runner = start_schedule_runner(st.session_state.twitch_username,
+                                               st.session_state.twitch_password,
+                                               channel_manager, supervisor,
+                                               query=schedule_query or None)
+            else:
+                st.error("Please enter your Twitch credentials.")
+        elif not follow and runner is not None:
+            stop_schedule_runner()
+            runner = None
+        
+        if runner is not None:
+            runner.query = schedule_query or None
+            if runner.active:
+                st.write("Farming now: " + ", ".join(sorted(runner.active)))
+            change = channel_manager.get_next_schedule_change()
+            if change:
+                when, started, stopped = change
+                st.caption(f"Next change at {when.strftime('%a %H:%M')}: "
+                           f"starting {', '.join(sorted(started)) or 'none'}, "
+                           f"stopping {', '.join(sorted(stopped)) or 'none'}")
+    
+    with st.expander("Live Status"):
+        prober = get_channel_prober()
+        probing = st.toggle("Check tracked channels in the background", value=prober is not None,
+                            help="Checks which tracked channels are live every minute, without a browser")
+        if probing and prober is None:
+            prober = start_channel_prober(channel_manager)
+        elif not probing and prober is not None:
+            stop_channel_prober()
+        
+        live = sorted(channel_manager.live_channels & set(channel_manager.channel_data["channels"]))
+        st.write("Live: " + (", ".join(live) or "none"))
+        
+        # When the others usually go live, going by past weeks of probes
+        for channel in sorted(set(channel_manager.channel_data["channels"]) - set(live)):
+            window = channel_manager.next_live_window(channel)
+            if window:
+                start, end, probability = window
+                st.caption(f"{channel}: likely live {start.strftime('%a %H:%M')}–{end.strftime('%H:%M')} "
+                           f"({probability:.0%})")
+    
     # Current session stats
     if st.session_state.bot_running:
         st.subheader("Current Session")
         
-        elapsed_time = datetime.now() - st.session_state.start_time
+        elapsed_time = datetime.now() - (st.session_state.start_time or datetime.now())
         elapsed_formatted = format_time(elapsed_time.total_seconds())
         
-        st.metric("Channel", st.session_state.selected_channel)
+        st.metric("Channel", farming_status["channel"])
         st.metric("Duration", elapsed_formatted)
         st.metric("Points Gained", st.session_state.points_gained)
 
@@ -357,7 +350,7 @@ with col2:
         
         # Card 2: Active Channel
         with status_cols[1]:
-            channel = st.session_state.selected_channel if st.session_state.selected_channel else "None"
+            channel = farming_status["channel"] if st.session_state.bot_running else "None"
             st.info(f"Active Channel: {channel}")
         
         # Card 3: Session Duration
@@ -425,7 +418,7 @@ with col2:
             st.info("No activity logged yet.")
         
         if st.button("Clear Log"):
-            st.session_state.log_messages = []
+            supervisor.clear_logs()
             st.rerun()
     
     # Tab 3: Detailed Statistics
@@ -433,26 +426,36 @@ with col2:
         st.subheader("Detailed Farming Statistics")
         
         if st.session_state.data_manager.has_data():
-            # Show session history
-            sessions = st.session_state.data_manager.get_all_sessions()
-            if sessions:
-                session_df = pd.DataFrame(sessions)
-                session_df['end_time'] = pd.to_datetime(session_df['end_time'])
-                session_df['start_time'] = pd.to_datetime(session_df['start_time'])
-                session_df = session_df.sort_values('end_time', ascending=False)
-                
+            # Show session history one page at a time, newest first
+            total_sessions = st.session_state.data_manager.count_sessions()
+            page_size = 50
+            page_count = max((total_sessions + page_size - 1) // page_size, 1)
+            page = st.number_input(
+                "Page",
+                min_value=1,
+                max_value=page_count,
+                value=1,
+                step=1,
+                help=f"{total_sessions} sessions, {page_size} per page"
+            ) - 1
+            
+            # Typed columns sliced from the session table, no per-row dicts or date parsing
+            session_df = st.session_state.data_manager.sessions_page_frame(page, page_size)
+            if not session_df.empty:
                 st.dataframe(
                     session_df[['channel', 'start_time', 'end_time', 'duration', 'points']],
                     use_container_width=True
                 )
-                
+            
+            # The charts come from the rollups, which outlive the retained sessions
+            daily_stats = st.session_state.data_manager.get_daily_stats()
+            if daily_stats:
                 # Show points gained over time
                 st.subheader("Points Gained Over Time")
                 
-                # Prepare data for time series
-                time_df = session_df.copy()
-                time_df['date'] = time_df['end_time'].dt.date
-                time_series = time_df.groupby('date')['points'].sum().reset_index()
+                # Prepare data for time series from the per-day aggregates
+                daily_df = pd.DataFrame(daily_stats)
+                time_series = daily_df[['date', 'points']].copy()
                 time_series['cumulative_points'] = time_series['points'].cumsum()
                 
                 # Create time series chart
@@ -470,7 +473,6 @@ with col2:
                 # Show daily farming chart
                 st.subheader("Daily Farming Activity")
                 
-                daily_df = time_df.groupby('date')['duration'].sum().reset_index()
                 daily_df['duration_hours'] = daily_df['duration'] / 60  # Convert to hours
                 
                 fig4 = px.bar(
@@ -482,6 +484,21 @@ with col2:
                     color_discrete_sequence=['#9146FF']
                 )
                 st.plotly_chart(fig4, use_container_width=True)
+                
+                # Show points by hour of day
+                st.subheader("Farming by Hour of Day")
+                
+                hourly_df = pd.DataFrame(st.session_state.data_manager.get_hourly_stats())
+                
+                fig5 = px.bar(
+                    hourly_df,
+                    x='hour',
+                    y='points',
+                    title='Points Earned by Hour of Day',
+                    labels={'hour': 'Hour', 'points': 'Points Earned'},
+                    color_discrete_sequence=['#9146FF']
+                )
+                st.plotly_chart(fig5, use_container_width=True)
         else:
             st.info("Start farming to see your detailed statistics!")
     
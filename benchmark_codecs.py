@@ -0,0 +1,90 @@
+"""
+Codec Benchmark for the Twitch Auto-Farmer
+Reports load/save time and file size of the farming data file for each state codec
+
+Usage: python benchmark_codecs.py [session counts...]   (default: 1000 100000 1000000)
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from persistence import JsonCodec, atomic_write, get_codec, msgpack, read_file
+from session_table import SessionTable
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+def make_data(count, channels=50):
+    """Build farming data shaped like a DataManager snapshot with `count` sessions"""
+    rng = np.random.default_rng(42)
+    start = np.datetime64("2024-01-01T00:00:00", "ns") + np.sort(
+        rng.integers(0, 365 * 24 * 3600, count)).astype("timedelta64[s]")
+    duration = rng.uniform(5, 600, count).astype(np.float32)
+    end = start + (duration * 60).astype("timedelta64[s]")
+    points = rng.integers(0, 5000, count)
+    names = [f"channel{i}" for i in range(channels)]
+    
+    sessions = SessionTable.from_columns(
+        np.arange(1, count + 1), [names[i] for i in rng.integers(0, channels, count)],
+        start, end, duration, points
+    )
+    
+    return {
+        "sessions": sessions,
+        "channels": {name: {"watchtime": 0, "points": 0, "sessions": 0} for name in names},
+        "total_points": int(points.sum()),
+        "total_watchtime": float(duration.sum()),
+        "rollups": {"daily": {}, "hourly": {}},
+        "partitions": {},
+        "next_session_id": count + 1,
+        "journal_seq": 0
+    }
+
+def measure(path, data, codec, indent=None, load=None):
+    """Save and load one file; returns (save seconds, load seconds, bytes)"""
+    started = time.perf_counter()
+    atomic_write(path, data, indent=indent, codec=codec)
+    saved = time.perf_counter()
+    
+    loaded = read_file(path)
+    if load:
+        load(loaded)
+    finished = time.perf_counter()
+    
+    return saved - started, finished - saved, os.path.getsize(path)
+
+def run(sizes):
+    """Print a table of results for every codec and size"""
+    codecs = [("json", JsonCodec())]
+    if msgpack is not None:
+        codecs.append(("msgpack", get_codec("msgpack")))
+    else:
+        print("msgpack is not installed; only JSON is measured")
+    
+    print(f"{'sessions':>10} {'format':<14} {'save (s)':>10} {'load (s)':>10} {'size (MB)':>10}")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "farming_data.json")
+        
+        for count in sizes:
+            data = make_data(count)
+            rows = []
+            
+            # The original format: every session a dict, pretty-printed
+            legacy = dict(data, sessions=data["sessions"].to_dicts())
+            rows.append(("json (legacy)",) + measure(path, legacy, JsonCodec(), indent=4,
+                                                     load=lambda d: SessionTable.from_dicts(d["sessions"])))
+            del legacy
+            
+            for name, codec in codecs:
+                rows.append((name,) + measure(path, data, codec,
+                                              load=lambda d: SessionTable.from_json(d["sessions"])))
+            
+            for name, save, load, size in rows:
+                print(f"{count:>10} {name:<14} {save:>10.3f} {load:>10.3f} {size / 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
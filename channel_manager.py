@@ -3,198 +3,342 @@ Channel Manager for the Twitch Auto-Farmer
 Handles channel recommendations, scheduling, and advanced channel management
 """
 
-import os
-import json
-import random
 from datetime import datetime, time, timedelta
 import streamlit as st
 import pandas as pd
 import requests
 
+from event_bus import PointsChanged, StreamOffline, StreamOnline
+from online_history import OnlineHistory, OnlineHistoryFile
+from persistence import JsonStore
+from recommendation_engine import RecommendationEngine
+from schedule_index import ScheduleIndex
+from tag_index import QueryError, TagIndex, query
+from uptime_histogram import UptimeHistogram
+
 # Channel data file
 CHANNEL_DATA_FILE = "channel_data.json"
 
+# Online/offline probes, kept out of the channel data so a probe doesn't rewrite them all
+ONLINE_HISTORY_FILE = f"{CHANNEL_DATA_FILE}.probes"
+
 class ChannelManager:
     def __init__(self):
         """Initialize the channel manager"""
+        self.stats_version = 0  # Bumped when channels, tags or the farmed channels change
+        self.recommendations = RecommendationEngine()
+        self.tag_index = TagIndex()
+        self.live_channels = set()  # Channels whose latest probe found them online
+        self.online_history = OnlineHistoryFile(ONLINE_HISTORY_FILE)
+        self.store = JsonStore(CHANNEL_DATA_FILE, self.default_channel_data, indent=4,
+                               decode=self.decode_channel_data)
         self.channel_data = self.load_channel_data()
-        
+        self._schedule_index = None
+        self._indexed_schedules = None  # Schedules the index was compiled from
+        self._schedule_listeners = []  # Called with no arguments when a schedule changes
+        self.point_rate_source = None  # Data manager whose sessions measure each channel's point rate
+    
     def load_channel_data(self):
         """Load channel data from file"""
-        if os.path.exists(CHANNEL_DATA_FILE):
-            try:
-                with open(CHANNEL_DATA_FILE, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading channel data: {str(e)}")
-        
-        # Default data
+        return self.store.load()
+    
+    def default_channel_data(self):
+        """Default channel data"""
         return {
             "channels": {},
-            "recommendations": [],
             "schedules": {},
             "last_update": None
         }
     
+    def decode_channel_data(self, data):
+        """Load the online histories and turn saved histograms into objects"""
+        self.stats_version += 1  # Loaded or reloaded after another process saved
+        data.pop("recommendations", None)  # Cached here before the recommendation engine
+        histories = self.online_history.load()
+        for channel, stats in data["channels"].items():
+            # Histories saved in the channel data move to the probe file (dropped from it on the next save)
+            saved = stats.pop("online_history", None)
+            if saved and channel not in histories:
+                self.online_history.replace(channel, OnlineHistory.from_json(saved))
+            history = self.online_history.get(channel)
+            
+            # Channels saved before the histogram existed are counted from their probes
+            if stats.get("uptime"):
+                stats["uptime"] = UptimeHistogram.from_json(stats["uptime"])
+            else:
+                stats["uptime"] = UptimeHistogram.from_probes(history.seconds(), history.online())
+        
+        # The indexes follow the data as loaded; updates replayed on top keep them in step
+        self.tag_index.rebuild(data["channels"])
+        latest = {channel: self.online_history.get(channel).last() for channel in data["channels"]}
+        self.live_channels = {channel for channel, probe in latest.items() if probe and probe[1]}
+    
     def save_channel_data(self):
-        """Save channel data to file"""
-        try:
-            with open(CHANNEL_DATA_FILE, "w") as f:
-                json.dump(self.channel_data, f, indent=4)
-        except Exception as e:
-            print(f"Error saving channel data: {str(e)}")
+        """Save channel data to file as a whole (coalesced with other pending changes)
+        
+        Prefer self.store.update(), which keeps changes made by other processes.
+        """
+        self.store.mark_dirty()
+    
+    def set_point_rate_source(self, data_manager):
+        """Use a data manager's measured points per hour for rates, recommendations and scheduling"""
+        self.point_rate_source = data_manager
+    
+    def get_point_rate_model(self):
+        """Get the point-rate model of the data source, up to date, or None"""
+        if self.point_rate_source is None:
+            return None
+        self.point_rate_source.refresh()
+        return self.point_rate_source.point_rate_model
+    
+    def batch(self):
+        """Group channel changes so they are saved with a single write, e.g.
+            
+            with channel_manager.batch():
+                channel_manager.set_channel_schedule(channel, schedule)
+                channel_manager.add_channel_tag(channel, "weekend")
+        """
+        return self.store.batch()
     
     def update_channel_stats(self, channel, points_earned=0, online=False):
         """Update stats for a channel"""
-        if channel not in self.channel_data["channels"]:
+        self.update_many({channel: {"points_earned": points_earned, "online": online}})
+    
+    def subscribe(self, bus):
+        """Update channel stats from a bot's events as they happen"""
+        bus.subscribe(PointsChanged, self._on_points_changed)
+        bus.subscribe(StreamOffline, self._on_stream_status)
+        bus.subscribe(StreamOnline, self._on_stream_status)
+    
+    def _on_points_changed(self, event):
+        """Event handler: credit the points to the channel"""
+        self.update_channel_stats(event.channel, points_earned=event.gained, online=True)
+    
+    def _on_stream_status(self, event):
+        """Event handler: record that the channel went offline or came back"""
+        self.update_channel_stats(event.channel, online=isinstance(event, StreamOnline))
+    
+    def update_many(self, updates):
+        """Update stats for many channels with a single write
+        
+        `updates` maps channels to update_channel_stats() keyword arguments, or is
+        a list of channel names to add (e.g. an imported channel list).
+        """
+        if not isinstance(updates, dict):
+            self.add_channels(updates)
+            return
+        
+        current_time = datetime.now().isoformat()
+        model = self.get_point_rate_model()
+        measured_rates = {channel: model.rate(channel) if model else None for channel in updates}
+        
+        def apply(data):
+            for channel, kwargs in updates.items():
+                self._apply_channel_stats(data, channel, current_time, measured_rates[channel], **kwargs)
+            data["last_update"] = current_time
+        
+        # Add to the online histories (the oldest probe is dropped once one is full)
+        self.online_history.append_many({channel: kwargs.get("online", False) for channel, kwargs in updates.items()},
+                                        current_time)
+        
+        # Save updated data
+        self.store.update(apply)
+    
+    def add_channels(self, channels):
+        """Start tracking channels, without recording a probe for them"""
+        def apply(data):
+            for channel in channels:
+                self._init_channel(data, channel)
+        self.store.update(apply)
+    
+    def _init_channel(self, data, channel):
+        """Add a channel's stats to the data if it has none; returns them"""
+        if channel not in data["channels"]:
             # Initialize new channel
-            self.channel_data["channels"][channel] = {
+            data["channels"][channel] = {
                 "points_earned": 0,
                 "sessions": 0,
-                "online_history": [],
+                "uptime": UptimeHistogram(),
                 "point_rate": 0,
                 "last_online": None,
                 "tags": [],
                 "schedule": {}
             }
+            self.stats_version += 1
+        return data["channels"][channel]
+    
+    def _apply_channel_stats(self, data, channel, current_time, measured_rate, points_earned=0, online=False):
+        """Apply one channel's stats update to the data"""
+        stats = self._init_channel(data, channel)
         
         # Update stats
         if points_earned > 0:
-            self.channel_data["channels"][channel]["points_earned"] += points_earned
-            self.channel_data["channels"][channel]["sessions"] += 1
+            if not stats["sessions"]:
+                self.stats_version += 1  # Now farmed, so no longer recommended
+            stats["points_earned"] += points_earned
+            stats["sessions"] += 1
         
         # Update online status
-        current_time = datetime.now().isoformat()
-        
         if online:
-            self.channel_data["channels"][channel]["last_online"] = current_time
-            
-            # Add to online history (max 24 hours)
-            self.channel_data["channels"][channel]["online_history"].append({
-                "timestamp": current_time,
-                "online": True
-            })
+            stats["last_online"] = current_time
+            self.live_channels.add(channel)
         else:
-            # Add to online history
-            self.channel_data["channels"][channel]["online_history"].append({
-                "timestamp": current_time,
-                "online": False
-            })
-        
-        # Limit history to 100 entries
-        if len(self.channel_data["channels"][channel]["online_history"]) > 100:
-            self.channel_data["channels"][channel]["online_history"] = \
-                self.channel_data["channels"][channel]["online_history"][-100:]
-        
-        # Calculate point rate (points per hour)
-        if self.channel_data["channels"][channel]["sessions"] > 0:
-            total_points = self.channel_data["channels"][channel]["points_earned"]
-            total_sessions = self.channel_data["channels"][channel]["sessions"]
-            
-            # Estimate 50 points per hour on average if we don't have enough data
-            estimated_hours = total_sessions * 0.5  # Assume average session is 30 minutes
-            point_rate = total_points / max(estimated_hours, 1)
-            
-            self.channel_data["channels"][channel]["point_rate"] = point_rate
+            self.live_channels.discard(channel)
         
-        # Save updated data
-        self.channel_data["last_update"] = current_time
-        self.save_channel_data()
+        stats["uptime"].observe(online, current_time)
+        
+        # Calculate point rate (points per hour), measured from sessions when we have them
+        if measured_rate is not None:
+            stats["point_rate"] = round(measured_rate, 2)
+        elif stats["sessions"] > 0:
+            # Estimate 50 points per hour on average if we don't have enough data
+            estimated_hours = stats["sessions"] * 0.5  # Assume average session is 30 minutes
+            stats["point_rate"] = stats["points_earned"] / max(estimated_hours, 1)
     
     def get_channel_recommendations(self, count=3):
-        """Get recommended channels based on potential point earnings"""
-        # Update recommendations if it's been a while
-        should_update = True
-        if self.channel_data["last_update"]:
-            last_update = datetime.fromisoformat(self.channel_data["last_update"])
-            if (datetime.now() - last_update).total_seconds() < 3600:  # 1 hour
-                should_update = False
-        
-        if should_update or not self.channel_data["recommendations"]:
-            self._update_recommendations()
-        
-        # Return top recommendations
-        return self.channel_data["recommendations"][:count]
-    
-    def _update_recommendations(self):
-        """Update channel recommendations using Twitch API or top streamers list"""
-        try:
-            # In a real implementation, this would use the Twitch API
-            # For now, we'll use a list of popular channels as a fallback
-            popular_channels = [
-                "xQc", "Ninja", "pokimane", "shroud", "NICKMERCS",
-                "TimTheTatman", "DrLupo", "summit1g", "Myth", "DrDisrespect",
-                "sodapoppin", "Tfue", "Asmongold", "HasanAbi", "Ludwig",
-                "moistcr1tikal", "Mizkif", "loltyler1", "Sykkuno", "Valkyrae"
-            ]
-            
-            # Filter out channels we're already farming
-            existing_channels = list(self.channel_data["channels"].keys())
-            available_channels = [c for c in popular_channels if c not in existing_channels]
-            
-            # Randomly select channels and assign estimated point rates
-            recommendations = []
-            for channel in random.sample(available_channels, min(10, len(available_channels))):
-                point_rate = random.randint(60, 120)  # Random estimate between 60-120 points/hour
-                recommendations.append({
-                    "channel": channel,
-                    "estimated_point_rate": point_rate,
-                    "reason": "Popular streamer with active chat"
-                })
-            
-            # Sort by point rate
-            recommendations.sort(key=lambda x: x["estimated_point_rate"], reverse=True)
-            
-            # Save recommendations
-            self.channel_data["recommendations"] = recommendations
-            self.save_channel_data()
-        except Exception as e:
-            print(f"Error updating recommendations: {str(e)}")
+        """Get recommended channels we don't farm yet, based on potential point earnings
+        
+        Served from cache; recomputed once the TTL runs out or when channels, tags,
+        the farmed channels or measured sessions change.
+        """
+        self.store.refresh()
+        model = self.get_point_rate_model()
+        version = (self.stats_version, self.point_rate_source.version if model else None)
+        
+        recommendations = self.recommendations.get(
+            version, lambda: self.recommendations.recommend(self.channel_data["channels"], model))
+        return recommendations[:count]
     
     def set_channel_schedule(self, channel, schedule):
         """Set a farming schedule for a channel"""
-        if channel not in self.channel_data["channels"]:
-            self.update_channel_stats(channel)  # Initialize channel
-        
-        # Save schedule
-        self.channel_data["channels"][channel]["schedule"] = schedule
-        self.channel_data["schedules"][channel] = schedule
-        self.save_channel_data()
+        # Initializing the channel and saving the schedule is one write
+        def apply(data):
+            self._init_channel(data, channel)["schedule"] = schedule
+            data["schedules"][channel] = schedule
+        self.store.update(apply)
+        
+        for listener in list(self._schedule_listeners):
+            listener()
+    
+    def add_schedule_listener(self, listener):
+        """Call `listener()` whenever a schedule is saved"""
+        self._schedule_listeners.append(listener)
+    
+    def remove_schedule_listener(self, listener):
+        """Stop calling a schedule listener"""
+        if listener in self._schedule_listeners:
+            self._schedule_listeners.remove(listener)
+    
+    def get_schedule_index(self):
+        """Get the compiled schedule index, recompiling it only when schedules changed"""
+        schedules = self.channel_data.get("schedules", {})
+        if self._schedule_index is None or schedules != self._indexed_schedules:
+            self._schedule_index = ScheduleIndex(schedules)
+            self._indexed_schedules = {channel: dict(schedule) for channel, schedule in schedules.items()}
+        return self._schedule_index
+    
+    def get_channels_to_farm_now(self, query=None):
+        """Get channels that should be farmed now based on schedules, best measured point rate first
+        
+        An optional query (see query_channels) narrows them down, e.g. "live AND NOT tag:late".
+        """
+        self.store.refresh()
+        now = datetime.now()
+        channels = self.get_schedule_index().channels_at(now)
+        if query:
+            matching = self.query_channels(query)
+            channels = [channel for channel in channels if channel in matching]
+        
+        model = self.get_point_rate_model()
+        if model:
+            ranked = [channel for channel, _ in model.rank(channels, moment=now)]
+            measured = set(ranked)
+            channels = ranked + [channel for channel in channels if channel not in measured]
+        return channels
     
-    def get_channels_to_farm_now(self):
-        """Get channels that should be farmed now based on schedules"""
-        current_time = datetime.now()
-        current_weekday = current_time.strftime("%A").lower()
-        current_hour = current_time.hour
-        
-        channels_to_farm = []
-        for channel, schedule in self.channel_data.get("schedules", {}).items():
-            # Check if channel should be farmed on this day
-            if schedule.get(current_weekday, False):
-                # Check if channel should be farmed at this hour
-                start_hour = schedule.get("start_hour", 0)
-                end_hour = schedule.get("end_hour", 23)
-                
-                if start_hour <= current_hour <= end_hour:
-                    channels_to_farm.append(channel)
-        
-        return channels_to_farm
+    def get_next_schedule_change(self):
+        """Get (when, channels starting, channels stopping) for the next schedule change, or None"""
+        self.store.refresh()
+        return self.get_schedule_index().next_transition(datetime.now())
+    
+    def probability_live(self, channel, moment=None):
+        """Get the probability that a channel is live at a moment (now by default), or None without probes"""
+        self.store.refresh()
+        stats = self.channel_data["channels"].get(channel)
+        if not stats or not len(stats["uptime"]):
+            return None
+        return stats["uptime"].probability_live(moment)
+    
+    def next_live_window(self, channel, moment=None, threshold=0.5):
+        """Get (start, end, probability) of the next window a channel is likely live, or None"""
+        self.store.refresh()
+        stats = self.channel_data["channels"].get(channel)
+        if not stats:
+            return None
+        return stats["uptime"].next_live_window(moment, threshold)
+    
+    def get_channels_with_tag(self, tag):
+        """Get the channels with a tag, from the tag index"""
+        self.store.refresh()
+        return sorted(self.tag_index.channels(tag))
+    
+    def query_channels(self, expression):
+        """Get the channels matching a set-algebra query, from the indexes
+        
+        Terms: tag:NAME, live, offline, likely (usually live at this hour), scheduled (now),
+        channel:NAME and all, combined with AND, OR, NOT and parentheses, e.g.
+        "live AND tag:fps AND NOT tag:late".
+        Raises tag_index.QueryError for a malformed query.
+        """
+        self.store.refresh()
+        universe = set(self.channel_data["channels"])
+        
+        def resolve(term):
+            name = term.lower()
+            if name.startswith("tag:"):
+                return self.tag_index.channels(term[4:])
+            if name.startswith("channel:"):
+                return {term[8:]} & universe
+            if name == "live":
+                return self.live_channels
+            if name == "offline":
+                return universe - self.live_channels
+            if name == "scheduled":
+                return self.get_schedule_index().channels_at(datetime.now())
+            if name == "likely":
+                now = datetime.now()
+                return {channel for channel, stats in self.channel_data["channels"].items()
+                        if len(stats["uptime"]) and stats["uptime"].probability_live(now) >= 0.5}
+            if name in ("all", "*"):
+                return universe
+            return None
+        
+        return sorted(query(expression, resolve, universe))
     
     def add_channel_tag(self, channel, tag):
-        """Add a tag to a channel"""
-        if channel not in self.channel_data["channels"]:
-            self.update_channel_stats(channel)  # Initialize channel
-        
-        if tag not in self.channel_data["channels"][channel]["tags"]:
-            self.channel_data["channels"][channel]["tags"].append(tag)
-            self.save_channel_data()
+        """Add a tag to a channel, tracking the channel if needed (one write)"""
+        stats = self.channel_data["channels"].get(channel)
+        if stats is None or tag not in stats["tags"]:
+            def apply(data):
+                tags = self._init_channel(data, channel)["tags"]
+                if tag not in tags:
+                    tags.append(tag)
+                    self.tag_index.add(channel, tag)
+                    self.stats_version += 1
+            self.store.update(apply)
     
     def remove_channel_tag(self, channel, tag):
         """Remove a tag from a channel"""
         if channel in self.channel_data["channels"]:
             if tag in self.channel_data["channels"][channel]["tags"]:
-                self.channel_data["channels"][channel]["tags"].remove(tag)
-                self.save_channel_data()
+                def apply(data):
+                    tags = data["channels"].get(channel, {}).get("tags", [])
+                    if tag in tags:
+                        tags.remove(tag)
+                        self.stats_version += 1
+                    if not any(t.lower() == tag.lower() for t in tags):
+                        self.tag_index.remove(channel, tag)
+                self.store.update(apply)
     
     def render_channel_recommendations(self):
         """Render channel recommendations in Streamlit"""
@@ -220,7 +364,8 @@ class ChannelManager:
                 st.rerun()
             
             # Show reason as a tooltip/info
-            st.caption(f"💡 {rec['reason']}")
+            uptime = f" · usually live at this hour {rec['uptime']:.0%} of the time" if rec.get("uptime") is not None else ""
+            st.caption(f"💡 {rec['reason']}{uptime}")
             
             if i < len(recommendations) - 1:
                 st.markdown("---")
@@ -228,6 +373,7 @@ class ChannelManager:
     def render_channel_scheduling(self):
         """Render channel scheduling UI in Streamlit"""
         st.subheader("Advanced Scheduling")
+        self.store.refresh()
         
         # Get existing channels
         existing_channels = list(self.channel_data["channels"].keys())
@@ -308,6 +454,7 @@ class ChannelManager:
     def render_drag_drop_channels(self, active_channels):
         """Render drag and drop channel management UI in Streamlit"""
         st.subheader("Channel Management")
+        self.store.refresh()
         
         # This is just a mockup since actual drag and drop requires JavaScript
         # which is out of scope for this implementation
@@ -354,6 +501,17 @@ class ChannelManager:
         
         st.markdown("---")
         
+        # Find channels with a query over tags and live status
+        channel_query = st.text_input("Find channels", key="channel_query",
+                                      placeholder="live AND tag:fps AND NOT tag:late",
+                                      help="Combine tag:NAME, live, offline and scheduled with AND, OR, NOT and parentheses")
+        if channel_query:
+            try:
+                matches = self.query_channels(channel_query)
+                st.write(", ".join(matches) if matches else "No matching channels")
+            except QueryError as e:
+                st.error(str(e))
+        
         # Tag management
         st.subheader("Channel Tags")
         
@@ -0,0 +1,162 @@
+"""
+Channel Prober for the Twitch Auto-Farmer
+Checks whether tracked channels are live over pooled HTTP, without a browser
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Twitch serves a stream preview image while a channel is live and redirects to a
+# placeholder once it is offline, so one small request tells the two apart
+PROBE_BASE_URL = os.environ.get("PROBE_BASE_URL", "https://static-cdn.jtvnw.net")
+PROBE_PATH = "/previews-ttv/live_user_{channel}-80x45.jpg"
+
+# Requests in flight at once (also the size of the keep-alive connection pool)
+PROBE_CONCURRENCY = int(os.environ.get("PROBE_CONCURRENCY", "32"))
+
+# Seconds to wait for one response
+PROBE_TIMEOUT = float(os.environ.get("PROBE_TIMEOUT", "5"))
+
+# Seconds between rounds when probing in the background
+PROBE_INTERVAL = float(os.environ.get("PROBE_INTERVAL", "60"))
+
+# Seconds a channel is skipped after a failed probe, doubling with each failure in a row
+BACKOFF_BASE = 30
+BACKOFF_MAX = 1800
+
+class ChannelProber:
+    def __init__(self, channel_manager, base_url=None, concurrency=None, timeout=None):
+        """Create a prober that records results in the channel manager's online history"""
+        self.channel_manager = channel_manager
+        self.base_url = (base_url or PROBE_BASE_URL).rstrip("/")
+        self.concurrency = max(1, concurrency or PROBE_CONCURRENCY)
+        self.timeout = PROBE_TIMEOUT if timeout is None else timeout
+        
+        # One session shared by the workers; its pool keeps a connection per worker alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="prober")
+        
+        self._lock = threading.Lock()
+        self._failures = {}  # Channel -> failed probes in a row
+        self._retry_at = {}  # Channel -> time.monotonic() before which it is skipped
+        
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def probe(self, channel):
+        """Check one channel; returns True if live, False if offline, None if the check failed"""
+        url = self.base_url + PROBE_PATH.format(channel=channel.lower())
+        try:
+            response = self.session.get(url, timeout=self.timeout, allow_redirects=False)
+            response.close()
+        except requests.RequestException as e:
+            print(f"Error probing {channel}: {str(e)}")
+            return None
+        
+        if response.status_code == 200:
+            return True
+        if response.status_code in (301, 302, 303, 307, 308, 404):
+            return False
+        print(f"Error probing {channel}: HTTP {response.status_code}")
+        return None
+    
+    def _due(self, channel, now):
+        """Check whether a channel is out of backoff"""
+        with self._lock:
+            return self._retry_at.get(channel, 0) <= now
+    
+    def _record(self, channel, online):
+        """Update a channel's backoff after a probe"""
+        with self._lock:
+            if online is None:
+                failures = self._failures.get(channel, 0) + 1
+                self._failures[channel] = failures
+                self._retry_at[channel] = time.monotonic() + min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+            else:
+                self._failures.pop(channel, None)
+                self._retry_at.pop(channel, None)
+    
+    def probe_all(self, channels=None):
+        """Probe channels (all tracked ones by default) concurrently and save the results
+        
+        Channels backing off after failures are skipped. Returns {channel: online} for the
+        channels that were checked successfully.
+        """
+        if channels is None:
+            self.channel_manager.store.refresh()
+            channels = list(self.channel_manager.channel_data["channels"])
+        
+        now = time.monotonic()
+        due = [channel for channel in channels if self._due(channel, now)]
+        
+        results = {}
+        for channel, online in zip(due, self._executor.map(self.probe, due)):
+            self._record(channel, online)
+            if online is not None:
+                results[channel] = online
+        
+        # All results are saved with a single write
+        if results:
+            self.channel_manager.update_many({channel: {"online": online} for channel, online in results.items()})
+        return results
+    
+    def start(self, interval=None):
+        """Probe every tracked channel every `interval` seconds in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        interval = PROBE_INTERVAL if interval is None else interval
+        self._stop.clear()
+        
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.probe_all()
+                except Exception as e:
+                    print(f"Error probing channels: {str(e)}")
+                self._stop.wait(interval)
+        
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop probing in the background"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+    
+    def close(self):
+        """Stop and release the connection pool and workers"""
+        self.stop()
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+# The prober outlives Streamlit reruns, one per process
+_prober = None
+
+def start_channel_prober(channel_manager):
+    """Start probing tracked channels in the background"""
+    global _prober
+    if _prober is None:
+        _prober = ChannelProber(channel_manager)
+    _prober.start()
+    return _prober
+
+def stop_channel_prober():
+    """Stop probing tracked channels"""
+    global _prober
+    if _prober is not None:
+        _prober.close()
+        _prober = None
+
+def get_channel_prober():
+    """The running prober, or None"""
+    return _prober
@@ -1,13 +1,34 @@
+import copy
 import json
 import os
+import threading
 from datetime import datetime
 
+import numpy as np
+
+from event_bus import PointsChanged
+from persistence import JsonStore, atomic_write, file_lock, file_signature, read_file
+from point_rate_model import PointRateModel
+from session_checkpoint import SessionCheckpoint
+from session_table import SessionTable, as_ns
+
+# Number of journal entries after which the snapshot is compacted in the background
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Months of sessions to keep; older months keep only their rollups (0 keeps everything)
+RETENTION_MONTHS = int(os.environ.get("DATA_RETENTION_MONTHS", "0"))
+
 class DataManager:
-    def __init__(self, data_file=None):
+    def __init__(self, data_file=None, journal=None, retention_months=None, read_only=False):
+        """Open the data file; with read_only, nothing on disk is changed (e.g. to import it elsewhere)"""
         # Check for environment variable for data file (useful for Render.com)
         if data_file is None:
             data_file = os.environ.get("DATA_FILE_PATH", "farming_data.json")
-            
+        
+        # Journal mode appends session events instead of rewriting the whole file
+        if journal is None:
+            journal = os.environ.get("DATA_JOURNAL", "1").lower() not in ("0", "false", "no")
+        
         # Create data directory if it doesn't exist
         data_dir = os.path.dirname(data_file)
         if data_dir and not os.path.exists(data_dir):
@@ -15,45 +36,445 @@ class DataManager:
                 os.makedirs(data_dir)
             except Exception as e:
                 print(f"Warning: Could not create data directory: {str(e)}")
-                
+        
         self.data_file = data_file
+        self.journal_enabled = journal
+        self.journal_file = f"{data_file}.journal"
+        self.compacting_file = f"{data_file}.journal.compacting"
+        self.retention_months = RETENTION_MONTHS if retention_months is None else retention_months
         self.current_session = None
+        
+        self._lock = threading.RLock()
+        self._journal_seq = 0  # Sequence number of the last applied journal entry
+        self._journal_entries = 0  # Entries in the live journal file
+        self._journal_offset = 0  # Bytes of the live journal already applied
+        self._journal_id = None  # Inode of the live journal, to notice when it is rotated
+        self._compacting_seen = None  # Signature of another process's rotated journal we replayed
+        self._compacting = False
+        self.version = 0  # Bumped whenever the data changes, for caches built on it
+        self._hot_month = None  # Month held in the hot (main) data file
+        self._partition_cache = {}  # Month -> SessionTable, loaded on first use
+        self.checkpoint = SessionCheckpoint(f"{data_file}.checkpoint")
+        
+        # Snapshots go through the shared store for atomic, coalesced writes;
+        # sessions are saved as columns, so the file is written without indentation
+        self.store = JsonStore(data_file, self._default_data, indent=None, snapshot=self._snapshot)
+        self.sessions = SessionTable()
+        self.point_rate_model = PointRateModel()
         self.data = self.load_data()
+        if read_only:
+            return
+        
+        # Finish a compaction that was interrupted by a crash
+        if self.journal_enabled and os.path.exists(self.compacting_file):
+            self.compact()
+        
+        # Move sessions from past months out of the hot file
+        self._roll_partitions()
+        
+        # Close sessions left running by a process that died
+        self.recover_sessions()
+    
+    def _default_data(self):
+        """Return the empty data structure."""
+        return {
+            "sessions": [],
+            "channels": {},
+            "total_points": 0,
+            "total_watchtime": 0,  # in minutes
+            "rollups": {"daily": {}, "hourly": {}},
+            "partitions": {},  # Month -> session counts of the archived partition file
+            "next_session_id": 1
+        }
     
     def load_data(self):
-        """Load data from the JSON file or create default structure."""
+        """Load data from the snapshot file and replay the journal on top of it."""
+        data = self.store.load()
+        
+        self._journal_seq = data.pop("journal_seq", 0)
+        self.data = data
+        
+        # Older files store sessions as a list of dicts rather than columns
+        sessions = data.pop("sessions", [])
+        if isinstance(sessions, list):
+            self.sessions = SessionTable.from_dicts(sessions)
+        else:
+            self.sessions = SessionTable.from_json(sessions)
+        
+        # Data written before rollups existed is rolled up once here
+        if "rollups" not in self.data:
+            self.data["rollups"] = {"daily": {}, "hourly": {}}
+            for session in self.sessions.to_dicts():
+                self._update_rollups(session["channel"], session)
+        
+        self.data.setdefault("partitions", {})
+        self.data.setdefault("next_session_id", len(self.sessions) + 1)
+        self._partition_cache = {}
+        
+        # Data written before the point-rate model existed is fitted once from its sessions
+        point_rates = data.pop("point_rates", None)
+        if point_rates:
+            self.point_rate_model = PointRateModel.from_json(point_rates)
+        else:
+            self.point_rate_model = PointRateModel.fit(
+                [self._load_partition(month) for month in self._active_months()] + [self.sessions])
+        
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._journal_id = None
+        self._compacting_seen = None
+        self.version += 1
+        
+        if self.journal_enabled:
+            # Entries left behind by an interrupted compaction come first
+            self._compacting_seen = file_signature(self.compacting_file)
+            self._replay_journal(self.compacting_file)
+            self._sync_journal(reload=False)
+        
+        return self.data
+    
+    def _replay_journal(self, path, offset=0):
+        """Apply journal entries newer than the snapshot, starting at a byte offset.
+        
+        Returns the number of entries read and the offset after the last complete line.
+        """
+        if not os.path.exists(path):
+            return 0, offset
+        
+        count = 0
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    return json.load(f)
-            else:
-                return {
-                    "sessions": [],
-                    "channels": {},
-                    "total_points": 0,
-                    "total_watchtime": 0  # in minutes
-                }
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Still being appended by another process
+                    offset += len(line)
+                    
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn line from a crash mid-append
+                        print(f"Warning: Skipping corrupt journal entry in {path}")
+                        continue
+                    
+                    count += 1
+                    if entry.get("seq", 0) <= self._journal_seq:
+                        continue  # Already part of the snapshot
+                    
+                    self._apply_event(entry)
+                    self._journal_seq = entry["seq"]
         except Exception as e:
-            print(f"Error loading data: {str(e)}")
-            return {
-                "sessions": [],
-                "channels": {},
-                "total_points": 0,
-                "total_watchtime": 0
+            print(f"Error replaying journal: {str(e)}")
+        
+        return count, offset
+    
+    def _sync_journal(self, reload=True):
+        """Apply entries other processes appended to the journal since we last read it.
+        
+        Costs a few stat() calls when nothing changed. If another process compacted
+        the data in the meantime, everything is reloaded from the new snapshot instead.
+        """
+        try:
+            journal_id = os.stat(self.journal_file).st_ino
+        except FileNotFoundError:
+            journal_id = None
+        
+        if reload and (file_signature(self.data_file) != self.store.signature or
+                       (not self._compacting and
+                        file_signature(self.compacting_file) not in (None, self._compacting_seen)) or
+                       (self._journal_id is not None and journal_id != self._journal_id)):
+            self.load_data()
+            return
+        
+        if journal_id is None:
+            return
+        
+        self._journal_id = journal_id
+        count, self._journal_offset = self._replay_journal(self.journal_file, self._journal_offset)
+        self._journal_entries += count
+    
+    def refresh(self):
+        """Pick up sessions recorded by other processes sharing the data file."""
+        if self.journal_enabled:
+            with self._lock:
+                self._sync_journal()
+    
+    def _apply_event(self, event):
+        """Apply a session event to the in-memory data."""
+        self.version += 1
+        if event["event"] == "start":
+            self._init_channel(event["channel"])
+        elif event["event"] == "end":
+            session = event["session"]
+            channel = event.get("channel", session["channel"])
+            self._init_channel(channel)
+            
+            # Add to sessions table
+            self.sessions.append(session)
+            self.data["next_session_id"] = max(self.data["next_session_id"], session["id"] + 1)
+            
+            # Update channel statistics
+            self.data["channels"][channel]["watchtime"] += session["duration"]
+            self.data["channels"][channel]["points"] += session["points"]
+            self.data["channels"][channel]["sessions"] += 1
+            
+            # Update totals
+            self.data["total_points"] += session["points"]
+            self.data["total_watchtime"] += session["duration"]
+            
+            self._update_rollups(channel, session)
+            if session.get("end_time"):
+                self.point_rate_model.update(channel, session["end_time"], session["duration"], session["points"])
+    
+    def _update_rollups(self, channel, session):
+        """Add a finished session to the per-day and per-hour-of-day rollups."""
+        if not session.get("end_time"):
+            return
+        
+        # Bucket by end time, e.g. "2025-04-26T13:05:00" -> day "2025-04-26", hour "13"
+        end_time = session["end_time"]
+        buckets = (
+            self.data["rollups"]["daily"].setdefault(end_time[:10], {}),
+            self.data["rollups"]["hourly"].setdefault(str(int(end_time[11:13])), {})
+        )
+        
+        for bucket in buckets:
+            stats = bucket.setdefault(channel, {"points": 0, "minutes": 0, "sessions": 0})
+            stats["points"] += session["points"]
+            stats["minutes"] += session["duration"]
+            stats["sessions"] += 1
+    
+    def _init_channel(self, channel):
+        """Initialize channel if not exists."""
+        if channel not in self.data["channels"]:
+            self.data["channels"][channel] = {
+                "watchtime": 0,  # in minutes
+                "points": 0,
+                "sessions": 0
             }
     
+    def _record(self, event):
+        """Apply an event and persist it."""
+        if not self.journal_enabled:
+            with self._lock:
+                self._apply_event(event)
+            self.save_data()
+        else:
+            self._append_journal(event)
+        
+        # The first event of a new month moves last month's sessions to their partition,
+        # as does a session that started before the current month
+        session = event.get("session")
+        if (self._hot_month != np.datetime64(datetime.now(), "M") or
+                (session and np.datetime64(session["start_time"], "M") < self._hot_month)):
+            self._roll_partitions()
+    
+    def _append_journal(self, event):
+        """Apply an event and append it to the journal."""
+        # The file lock orders appends from all processes; catching up first keeps seq unique
+        with self._lock, file_lock(self.data_file):
+            self._sync_journal()
+            
+            # Another session ended first and took this id
+            session = event.get("session")
+            if session and session["id"] < self.data["next_session_id"]:
+                session["id"] = self.data["next_session_id"]
+            
+            self._apply_event(event)
+            
+            self._journal_seq += 1
+            entry = dict(event, seq=self._journal_seq)
+            
+            try:
+                # One line per event keeps each write constant-time
+                with open(self.journal_file, 'ab') as f:
+                    line = json.dumps(entry).encode() + b"\n"
+                    if os.fstat(f.fileno()).st_size > self._journal_offset:
+                        line = b"\n" + line  # End a line torn by a crashed writer
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._journal_offset = f.tell()
+                    self._journal_id = os.fstat(f.fileno()).st_ino
+                self._journal_entries += 1
+            except Exception as e:
+                print(f"Error writing journal: {str(e)}")
+            
+            if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+                self.compact(background=True)
+    
+    def _snapshot(self):
+        """Take a point-in-time copy of the data for writing."""
+        with self._lock:
+            snapshot = dict(self.data)
+            snapshot["sessions"] = self.sessions.copy()
+            snapshot["channels"] = {c: dict(s) for c, s in self.data["channels"].items()}
+            snapshot["rollups"] = copy.deepcopy(self.data["rollups"])
+            snapshot["partitions"] = copy.deepcopy(self.data["partitions"])
+            snapshot["point_rates"] = self.point_rate_model.to_json()
+            snapshot["journal_seq"] = self._journal_seq
+            return snapshot
+    
     def save_data(self):
-        """Save data to the JSON file."""
+        """Save data to the JSON file (coalesced with other pending changes)."""
+        self.store.mark_dirty()
+    
+    def compact(self, background=False):
+        """Fold the journal into a fresh snapshot."""
+        with self._lock, file_lock(self.data_file):
+            if self._compacting:
+                return
+            
+            # The snapshot must cover every entry in the journal we rotate
+            self._sync_journal()
+            self._compacting = True
+            
+            # Rotate the journal so new events keep appending while we write; a leftover
+            # file from a crash (or another process's compaction) is kept until a snapshot covers it
+            if os.path.exists(self.journal_file) and not os.path.exists(self.compacting_file):
+                os.replace(self.journal_file, self.compacting_file)
+                self._journal_entries = 0
+                self._journal_offset = 0
+                self._journal_id = None
+            
+            snapshot = self._snapshot()
+        
+        if background:
+            threading.Thread(target=self._finish_compaction, args=(snapshot,), daemon=True).start()
+        else:
+            self._finish_compaction(snapshot)
+    
+    def _finish_compaction(self, snapshot):
+        """Write the compacted snapshot and drop the rotated journal."""
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.data, f, indent=2)
+            with file_lock(self.data_file):
+                self.store.write(snapshot)
+                if os.path.exists(self.compacting_file):
+                    os.remove(self.compacting_file)
         except Exception as e:
-            print(f"Error saving data: {str(e)}")
+            print(f"Error compacting data: {str(e)}")
+        finally:
+            self._compacting = False
+    
+    def _partition_file(self, month):
+        """Path of the archive file for a month, e.g. farming_data.2025-03.json."""
+        root, ext = os.path.splitext(self.data_file)
+        return f"{root}.{month}{ext or '.json'}"
+    
+    def _load_partition(self, month):
+        """Load an archived month, reading its file only the first time it is needed."""
+        with self._lock:
+            table = self._partition_cache.get(month)
+            if table is not None:
+                return table
+            
+            table = SessionTable()
+            path = self._partition_file(month)
+            if os.path.exists(path):
+                try:
+                    table = SessionTable.from_json(read_file(path)["sessions"])
+                except Exception as e:
+                    print(f"Error loading partition {path}: {str(e)}")
+            
+            self._partition_cache[month] = table
+            return table
+    
+    def _roll_partitions(self):
+        """Move sessions from past months into monthly partition files and apply retention."""
+        current = np.datetime64(datetime.now(), "M")
+        
+        if not self.journal_enabled:
+            with self._lock:
+                changed = self._roll_hot_file(current)
+            if changed:
+                self.save_data()
+            return
+        
+        # Other processes must not append between the rollover and the compaction that saves it
+        with self._lock, file_lock(self.data_file):
+            self._sync_journal()
+            if self._roll_hot_file(current):
+                # The hot file no longer holds the archived sessions
+                self.compact()
+    
+    def _roll_hot_file(self, current):
+        """Archive hot sessions from before the current month; returns True if anything changed."""
+        self._hot_month = current
+        months = self.sessions.months()
+        old = months < current
+        
+        if old.any():
+            for month in np.unique(months[old]):
+                self._archive_month(str(month), self.sessions.take(np.flatnonzero(months == month)))
+            self.sessions = self.sessions.take(np.flatnonzero(~old))
+            self.version += 1
+        
+        retired = self._apply_retention(current)
+        return bool(old.any() or retired)
+    
+    def _archive_month(self, month, rows):
+        """Merge rows into a month's partition file."""
+        if self.retention_months and np.datetime64(month, "M") < self._hot_month - self.retention_months:
+            return  # Past retention: the rollups already cover these sessions
+        
+        existing = self._load_partition(month)
+        if len(existing):
+            # Rows left in both places by a crash mid-rollover are only kept once
+            keep = ~np.isin(existing.column("id"), rows.column("id"))
+            rows = SessionTable.concat([existing.take(np.flatnonzero(keep)), rows])
+        
+        atomic_write(self._partition_file(month), {"month": month, "sessions": rows}, indent=None)
+        self._partition_cache[month] = rows
+        self.data["partitions"][month] = {
+            "sessions": len(rows),
+            "channels": rows.channel_counts(),
+            "retired": False
+        }
+    
+    def _apply_retention(self, current):
+        """Drop session rows of partitions older than the retention window, keeping their rollups."""
+        if not self.retention_months:
+            return False
+        
+        retired = False
+        cutoff = current - self.retention_months
+        for month, info in self.data["partitions"].items():
+            if info.get("retired") or np.datetime64(month, "M") >= cutoff:
+                continue
+            
+            path = self._partition_file(month)
+            if os.path.exists(path):
+                os.remove(path)
+            self._partition_cache.pop(month, None)
+            info["retired"] = True
+            retired = True
+        
+        return retired
+    
+    def _active_months(self):
+        """Archived months whose sessions are still kept, oldest first."""
+        return sorted(m for m, info in self.data["partitions"].items() if not info.get("retired"))
+    
+    def _tables_between(self, start=None, end=None):
+        """Session tables that can hold sessions started in [start, end), oldest first."""
+        start_ns = as_ns(start) if start is not None else None
+        end_ns = as_ns(end) if end is not None else None
+        
+        tables = []
+        for month in self._active_months():
+            month_start = np.datetime64(month, "M")
+            month_begin = month_start.astype("datetime64[ns]").astype(np.int64)
+            month_end = (month_start + 1).astype("datetime64[ns]").astype(np.int64)
+            if (start_ns is None or month_end > start_ns) and (end_ns is None or month_begin < end_ns):
+                tables.append(self._load_partition(month))
+        
+        tables.append(self.sessions)
+        return tables
     
     def start_session(self, channel):
         """Start a new farming session."""
         self.current_session = {
-            "id": len(self.data["sessions"]) + 1,
+            "id": self.data["next_session_id"],
             "channel": channel,
             "start_time": datetime.now().isoformat(),
             "end_time": None,
@@ -61,46 +482,60 @@ class DataManager:
             "points": 0
         }
         
-        # Initialize channel if not exists
-        if channel not in self.data["channels"]:
-            self.data["channels"][channel] = {
-                "watchtime": 0,  # in minutes
-                "points": 0,
-                "sessions": 0
-            }
-        
-        self.save_data()
+        self._record({"event": "start", "channel": channel})
+        self.checkpoint.start(self.current_session)
     
-    def end_session(self, channel, duration, points):
+    def update_session(self, points):
+        """Record the points earned so far in the current session for the next checkpoint."""
+        if self.current_session:
+            self.current_session["points"] = points
+            self.checkpoint.update(points)
+    
+    def subscribe(self, bus):
+        """Keep the current session's points up to date from a bot's events."""
+        bus.subscribe(PointsChanged, self._on_points_changed)
+    
+    def _on_points_changed(self, event):
+        """Event handler: record the session's points if they belong to the current session"""
+        if self.current_session and self.current_session["channel"] == event.channel:
+            self.update_session(event.session_points)
+    
+    def end_session(self, channel, duration, points, end_time=None):
         """End the current farming session and update statistics."""
         if not self.current_session:
             return
         
         # Update current session
-        self.current_session["end_time"] = datetime.now().isoformat()
+        self.current_session["end_time"] = end_time or datetime.now().isoformat()
         self.current_session["duration"] = round(duration, 2)
         self.current_session["points"] = points
         
-        # Add to sessions list
-        self.data["sessions"].append(self.current_session)
-        
-        # Update channel statistics
-        self.data["channels"][channel]["watchtime"] += duration
-        self.data["channels"][channel]["points"] += points
-        self.data["channels"][channel]["sessions"] += 1
-        
-        # Update totals
-        self.data["total_points"] += points
-        self.data["total_watchtime"] += duration
-        
-        # Save data
-        self.save_data()
+        self._record({"event": "end", "channel": channel, "session": self.current_session})
+        self.checkpoint.clear()
         
         # Reset current session
         self.current_session = None
     
+    def recover_sessions(self):
+        """Close sessions orphaned by a restart, using their last checkpoint."""
+        for orphan in self.checkpoint.recover():
+            print(f"Recovering session on {orphan['channel']} from checkpoint at {orphan['checkpoint_time']}")
+            
+            # The id may have been reused while the process was down, so take a fresh one
+            session = {
+                "id": self.data["next_session_id"],
+                "channel": orphan["channel"],
+                "start_time": orphan["start_time"],
+                "end_time": orphan["checkpoint_time"],
+                "duration": round(orphan["duration"], 2),
+                "points": orphan["points"]
+            }
+            self._record({"event": "start", "channel": session["channel"]})
+            self._record({"event": "end", "channel": session["channel"], "session": session})
+    
     def get_channel_stats(self):
         """Get statistics for all channels."""
+        self.refresh()
         result = []
         
         for channel, stats in self.data["channels"].items():
@@ -113,22 +548,166 @@ class DataManager:
         
         return result
     
+    def _sum_rollup(self, key, value, bucket, channel=None):
+        """Sum one rollup bucket across channels (or for a single channel)."""
+        result = {key: value, "points": 0, "duration": 0, "sessions": 0}
+        for name, stats in bucket.items():
+            if channel is None or name == channel:
+                result["points"] += stats["points"]
+                result["duration"] += stats["minutes"]
+                result["sessions"] += stats["sessions"]
+        return result
+    
+    def get_daily_stats(self, channel=None):
+        """Get points, minutes and sessions farmed per day, oldest first."""
+        self.refresh()
+        daily = self.data["rollups"]["daily"]
+        return [self._sum_rollup("date", date, daily[date], channel) for date in sorted(daily)
+                if channel is None or channel in daily[date]]
+    
+    def get_hourly_stats(self, channel=None):
+        """Get points, minutes and sessions farmed per hour of day (0-23)."""
+        self.refresh()
+        hourly = self.data["rollups"]["hourly"]
+        return [self._sum_rollup("hour", hour, hourly.get(str(hour), {}), channel)
+                for hour in range(24)]
+    
+    def get_point_rates(self, moment=None):
+        """Get measured points per hour per channel at a moment (now by default), best first."""
+        self.refresh()
+        return self.point_rate_model.rank(moment=moment)
+    
     def get_total_points(self):
         """Get the total points earned."""
+        self.refresh()
         return self.data["total_points"]
     
     def get_total_watchtime(self):
         """Get the total watchtime in hours."""
+        self.refresh()
         return round(self.data["total_watchtime"] / 60, 2)  # Convert to hours
     
     def get_total_sessions(self):
         """Get the total number of sessions."""
-        return len(self.data["sessions"])
+        self.refresh()
+        return sum(stats["sessions"] for stats in self.data["channels"].values())
     
     def get_all_sessions(self):
-        """Get all farming sessions."""
-        return self.data["sessions"]
+        """Get all farming sessions (loads every archived month)."""
+        return self.get_sessions_between()
+    
+    def sessions_frame(self, start=None, end=None, channel=None):
+        """Get farming sessions as a DataFrame backed by the session columns.
+        
+        While everything fits in the hot file the frame views the columns without
+        copying; a time window or channel selects just those rows through the
+        start time index, loading only the archived months it touches.
+        """
+        self.refresh()
+        with self._lock:
+            tables = self._tables_between(start, end)
+            if len(tables) == 1 and start is None and end is None and channel is None:
+                return self.sessions.frame()
+            return SessionTable.concat([t.take(t.between(start, end, channel)) for t in tables]).frame()
+    
+    def get_sessions_between(self, start=None, end=None, channel=None):
+        """Get sessions that started in [start, end), oldest first."""
+        self.refresh()
+        with self._lock:
+            sessions = []
+            for table in self._tables_between(start, end):
+                sessions.extend(table.to_dicts(table.between(start, end, channel)))
+            return sessions
+    
+    def get_sessions_page(self, page=0, page_size=50, channel=None):
+        """Get one page of sessions, newest first, loading only the months it spans."""
+        self.refresh()
+        with self._lock:
+            return [session for table, positions in self._page_rows(page, page_size, channel)
+                    for session in table.to_dicts(positions)]
+    
+    def sessions_page_frame(self, page=0, page_size=50, channel=None):
+        """Get one page of sessions, newest first, as a DataFrame sliced from the session columns."""
+        self.refresh()
+        with self._lock:
+            parts = self._page_rows(page, page_size, channel)
+            if len(parts) == 1:
+                table, positions = parts[0]
+                return table.frame(positions)
+            return SessionTable.concat([table.take(positions) for table, positions in parts]).frame()
+    
+    def _page_rows(self, page, page_size, channel):
+        """Get (table, row positions) pairs making up one page, newest first (call with the lock held)."""
+        offset = page * page_size
+        parts = []
+        found = 0
+        
+        # The hot file holds the newest sessions, then archived months newest first
+        for month in [None] + self._active_months()[::-1]:
+            if month is None:
+                table = self.sessions
+                count = table.count(channel)
+            else:
+                table = None
+                info = self.data["partitions"][month]
+                count = info["sessions"] if channel is None else info["channels"].get(channel, 0)
+            
+            if offset >= count:
+                offset -= count
+                continue
+            
+            if table is None:
+                table = self._load_partition(month)
+            positions = table.newest(offset, page_size - found, channel)
+            parts.append((table, positions))
+            found += len(positions)
+            offset = 0
+            
+            if found >= page_size:
+                break
+        
+        return parts
+    
+    def iter_sessions(self, page_size=100, channel=None):
+        """Iterate over sessions newest first, loading one page at a time."""
+        page = 0
+        while True:
+            sessions = self.get_sessions_page(page, page_size, channel)
+            if not sessions:
+                return
+            yield from sessions
+            page += 1
+    
+    def count_sessions(self, channel=None):
+        """Get the number of stored (not retired) sessions, overall or for one channel."""
+        self.refresh()
+        count = self.sessions.count(channel)
+        for month in self._active_months():
+            info = self.data["partitions"][month]
+            count += info["sessions"] if channel is None else info["channels"].get(channel, 0)
+        return count
     
     def has_data(self):
         """Check if there is any farming data."""
-        return len(self.data["sessions"]) > 0
+        return self.get_total_sessions() > 0
+
+def create_data_manager(data_file=None):
+    """Create the data manager for the configured storage backend."""
+    if data_file is None:
+        data_file = os.environ.get("DATA_FILE_PATH", "farming_data.json")
+    
+    # Use SQLite for sqlite:/// paths or when DATA_BACKEND=sqlite
+    backend = os.environ.get("DATA_BACKEND", "json").lower()
+    if data_file.startswith("sqlite:///") or backend == "sqlite":
+        from sqlite_data_manager import SQLiteDataManager
+        
+        if data_file.startswith("sqlite:///"):
+            db_file = data_file[len("sqlite:///"):]
+        else:
+            db_file = os.path.splitext(data_file)[0] + ".db"
+        
+        # Existing JSON data next to a new database is imported once
+        json_file = os.path.splitext(db_file)[0] + ".json"
+        return SQLiteDataManager(db_file, import_from=json_file)
+    
+    return DataManager(data_file)
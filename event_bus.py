@@ -0,0 +1,78 @@
+"""
+Event Bus for the Twitch Auto-Farmer
+In-process publish/subscribe of typed farming events, so managers react as things happen instead of polling
+"""
+
+import threading
+
+class FarmingEvent:
+    """Base of every farming event; subscribing to it receives them all"""
+    def __init__(self, channel):
+        self.channel = channel
+    
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in vars(self).items())
+        return f"{type(self).__name__}({fields})"
+
+class PointsChanged(FarmingEvent):
+    """The channel points balance went up by `gained`; `session_points` is the total since farming started"""
+    def __init__(self, channel, gained, balance, session_points):
+        super().__init__(channel)
+        self.gained = gained
+        self.balance = balance
+        self.session_points = session_points
+
+class BonusClaimed(FarmingEvent):
+    """A bonus chest was claimed"""
+    def __init__(self, channel, points):
+        super().__init__(channel)
+        self.points = points
+
+class StreamOffline(FarmingEvent):
+    """The farmed stream went offline"""
+
+class StreamOnline(FarmingEvent):
+    """The farmed stream is live (again)"""
+
+class FarmingError(FarmingEvent):
+    """Farming hit an error; it carries on unless the bot stopped"""
+    def __init__(self, channel, message):
+        super().__init__(channel)
+        self.message = message
+
+class EventBus:
+    def __init__(self):
+        """Create a bus with no subscribers"""
+        self._subscribers = {}  # Event class -> handlers
+        self._lock = threading.Lock()
+    
+    def subscribe(self, event_type, handler):
+        """Call `handler(event)` for every published event of `event_type` (or a subclass)"""
+        with self._lock:
+            handlers = self._subscribers.setdefault(event_type, [])
+            if handler not in handlers:
+                handlers.append(handler)
+    
+    def unsubscribe(self, event_type, handler):
+        """Stop calling a handler"""
+        with self._lock:
+            handlers = self._subscribers.get(event_type, [])
+            if handler in handlers:
+                handlers.remove(handler)
+    
+    def publish(self, event):
+        """Call the event's handlers right away, on the publishing thread
+        
+        A failing handler is reported and does not keep the others from running.
+        """
+        with self._lock:
+            handlers = [handler for event_type in type(event).__mro__
+                        for handler in self._subscribers.get(event_type, ())]
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Error handling {type(event).__name__}: {str(e)}")
+
+# Shared by every publisher and subscriber in the process
+event_bus = EventBus()
@@ -0,0 +1,323 @@
+"""
+Farming Supervisor for the Twitch Auto-Farmer
+Runs the TwitchBot in a worker process driven by a command queue, and keeps a status snapshot for the UI
+"""
+
+import collections
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from event_bus import EventBus, FarmingEvent, PointsChanged, event_bus
+from twitch_bot import TwitchBot
+
+# Seconds between the supervisor's checks that the worker is alive, while it should be farming
+STATUS_INTERVAL = float(os.environ.get("FARMING_STATUS_INTERVAL", "1"))
+
+# Seconds before a worker that died while farming is restarted
+RESTART_DELAY = float(os.environ.get("FARMING_RESTART_DELAY", "30"))
+
+# Log lines kept for the activity log
+LOG_HISTORY = 100
+
+# States in which the worker has (or is getting) a bot farming
+ACTIVE_STATES = ("starting", "farming")
+
+class _ReportingBot(TwitchBot):
+    """TwitchBot that forwards every log line to the supervisor"""
+    updates = None
+    
+    def log(self, message):
+        super().log(message)
+        self.updates.put(("log", {"channel": self.channel, "message": message, "time": datetime.now()}))
+
+def _stop_bot(bot, thread, updates):
+    """Stop a bot and wait for its farming loop to end (runs in the worker process)"""
+    try:
+        bot.stop_farming()
+    except Exception as e:
+        print(f"Error stopping bot: {str(e)}")
+    if thread is not None:
+        thread.join(timeout=5)
+    updates.put(("state", {"state": "idle", "channel": bot.channel}))
+
+def _start_bot(username, password, channel, commands, updates, events, run_id):
+    """Log in and start farming a channel; returns (bot, thread), or (None, None) on failure"""
+    updates.put(("state", {"state": "starting", "channel": channel}))
+    try:
+        bot = _ReportingBot(username, password, events=events)
+        bot.run_id = run_id
+        if not bot.login():
+            bot.stop_farming()
+            updates.put(("state", {"state": "error", "channel": channel,
+                                   "error": "Failed to login to Twitch. Check your credentials."}))
+            return None, None
+    except Exception as e:
+        updates.put(("state", {"state": "error", "channel": channel, "error": str(e)}))
+        return None, None
+    
+    # start_farming loops until stop_farming(), so it gets a thread of its own that
+    # tells the worker when the loop gives up by itself (e.g. the page never loaded)
+    def farm():
+        bot.start_farming(channel)
+        commands.put(("finished", run_id))
+    
+    thread = threading.Thread(target=farm, daemon=True)
+    thread.start()
+    updates.put(("state", {"state": "farming", "channel": channel}))
+    return bot, thread
+
+def farming_worker(commands, updates):
+    """Worker process: run commands on the bot and forward its events, log lines and state changes
+    
+    Commands are ("start", username, password, channel), ("switch", channel), ("stop",)
+    and ("shutdown",). The worker sleeps until a command arrives.
+    """
+    _ReportingBot.updates = updates
+    bot = thread = None
+    credentials = None
+    run_ids = itertools.count(1)  # Tell bots apart; id() is reused once a stopped bot is freed
+    
+    # The bot's events go to the supervisor, which publishes them in the UI process
+    events = EventBus()
+    events.subscribe(FarmingEvent, lambda event: updates.put(("event", event)))
+    
+    while True:
+        command = commands.get()
+        try:
+            if command[0] == "finished":
+                # Only the running bot's loop ending matters; a stopped bot's is expected
+                if bot is None or command[1] != bot.run_id:
+                    continue
+                _stop_bot(bot, None, updates)
+                bot = thread = None
+            elif bot is not None:
+                _stop_bot(bot, thread, updates)
+                bot = thread = None
+            
+            if command[0] == "start":
+                credentials = command[1:3]
+                bot, thread = _start_bot(*credentials, command[3], commands, updates, events, next(run_ids))
+            elif command[0] == "switch" and credentials:
+                bot, thread = _start_bot(*credentials, command[1], commands, updates, events, next(run_ids))
+            elif command[0] == "shutdown":
+                return
+        except Exception as e:
+            print(f"Error in farming worker: {str(e)}")
+            updates.put(("state", {"state": "error", "channel": bot.channel if bot else None, "error": str(e)}))
+
+class FarmingSupervisor:
+    def __init__(self, events=None):
+        """Create a supervisor that publishes the bot's events on `events` (the shared bus by default)
+
+        The worker process starts with the first command.
+        """
+        self.events = events or event_bus
+        self._context = multiprocessing.get_context("spawn")
+        self._commands = None
+        self._updates = None
+        self._process = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._wanted = None  # The last start command, replayed if the worker dies while farming
+        
+        self.logs = collections.deque(maxlen=LOG_HISTORY)  # Formatted activity log lines
+        self.status = {
+            "state": "idle",
+            "channel": None,
+            "started_at": None,
+            "points_gained": 0,
+            "last_log": "",
+            "error": None,
+            "restarts": 0
+        }
+    
+    def add_listener(self, listener):
+        """Call listener(kind, data, status) for every state change and log line, on the reader thread"""
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        """Stop calling a listener"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def start(self, username, password, channel):
+        """Start farming a channel, stopping whatever is being farmed"""
+        with self._lock:
+            self._wanted = ("start", username, password, channel)
+        self._send(self._wanted)
+    
+    def switch(self, channel):
+        """Farm another channel with the same account"""
+        with self._lock:
+            if self._wanted is None:
+                return
+            self._wanted = self._wanted[:3] + (channel,)
+        self._send(("switch", channel))
+    
+    def stop(self):
+        """Stop farming; the worker process keeps running for the next start"""
+        with self._lock:
+            self._wanted = None
+        self._send(("stop",))
+    
+    def shutdown(self):
+        """Stop farming and end the worker process"""
+        with self._lock:
+            self._wanted = None
+            process = self._process
+        if process is not None and process.is_alive():
+            self._commands.put(("shutdown",))
+            process.join(timeout=30)
+    
+    def snapshot(self):
+        """Copy of the current status; cheap enough to call on every rerun"""
+        with self._lock:
+            return dict(self.status)
+    
+    @property
+    def running(self):
+        """Whether a bot is farming or being started"""
+        return self.status["state"] in ACTIVE_STATES
+    
+    @property
+    def wanted_channel(self):
+        """Channel the last start or switch asked for, until it is stopped or fails to start"""
+        with self._lock:
+            return self._wanted[3] if self._wanted else None
+    
+    def add_log(self, message):
+        """Add a line of the UI's own to the activity log"""
+        with self._lock:
+            self.logs.append(message)
+    
+    def get_logs(self):
+        """Activity log lines, oldest first"""
+        with self._lock:
+            return list(self.logs)
+    
+    def clear_logs(self):
+        """Empty the activity log"""
+        with self._lock:
+            self.logs.clear()
+    
+    def _send(self, command):
+        """Queue a command for the worker, starting it if needed"""
+        self._check_worker()  # Report a crash the reader hasn't noticed yet
+        self._ensure_worker()
+        self._commands.put(command)
+    
+    def _ensure_worker(self):
+        """Start the worker process and the reader thread if they are not running"""
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                return
+            if self._updates is not None:
+                self._updates.put(("wake", None))  # Move the reader on to the new queue
+            self._commands = self._context.Queue()
+            self._updates = self._context.Queue()
+            self._process = self._context.Process(target=farming_worker, args=(self._commands, self._updates),
+                                                  daemon=True, name="farming-worker")
+            self._process.start()
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read, daemon=True, name="farming-supervisor")
+                self._reader.start()
+    
+    def _read(self):
+        """Reader thread: apply the worker's updates to the status and watch the worker's health
+        
+        Nothing needs watching while nothing should be farming, so then it just waits for updates.
+        """
+        while True:
+            with self._lock:
+                updates = self._updates
+                timeout = STATUS_INTERVAL if self._wanted is not None else None
+            try:
+                kind, data = updates.get(timeout=timeout)
+            except queue.Empty:
+                self._check_worker()
+                continue
+            except (EOFError, OSError):
+                time.sleep(STATUS_INTERVAL)
+                continue
+            
+            if kind == "wake":
+                continue
+            
+            with self._lock:
+                self._apply(kind, data)
+                status = dict(self.status)
+            
+            # The bot's events reach the managers subscribed in this process straight away
+            if kind == "event":
+                self.events.publish(data)
+                continue
+            
+            for listener in list(self._listeners):
+                try:
+                    listener(kind, data, status)
+                except Exception as e:
+                    print(f"Error handling farming update: {str(e)}")
+    
+    def _apply(self, kind, data):
+        """Fold an update into the status (call with the lock held)"""
+        if kind == "state":
+            if data["state"] == "starting":
+                self.status.update(channel=data["channel"], started_at=None, points_gained=0, error=None)
+            elif data["state"] == "farming":
+                self.status["started_at"] = datetime.now()
+            elif data["state"] == "error":
+                self.status["error"] = data.get("error")
+                self._wanted = None
+            
+            # A session ends with the bot; listeners get its start time along with the update
+            if data["state"] in ("idle", "error"):
+                data["started_at"], self.status["started_at"] = self.status["started_at"], None
+            self.status["state"] = data["state"]
+        elif kind == "event":
+            if isinstance(data, PointsChanged):
+                self.status["points_gained"] = data.session_points
+        elif kind == "log":
+            self.status["last_log"] = data["message"]
+            self.logs.append(f"[{data['time'].strftime('%H:%M:%S')}] {data['message']}")
+    
+    def _check_worker(self):
+        """Restart a worker that died while it should have been farming"""
+        with self._lock:
+            if self._process is None or self._process.is_alive():
+                return
+            wanted = self._wanted
+            crashed = self.status["state"] in ACTIVE_STATES
+            if crashed:
+                data = {"state": "error", "channel": self.status["channel"],
+                        "error": f"Farming worker exited with code {self._process.exitcode}"}
+                self._apply("state", data)
+                self._wanted = wanted  # Still wanted; the error is not the bot's
+                status = dict(self.status)
+            self._process = None
+        
+        if crashed:
+            for listener in list(self._listeners):
+                try:
+                    listener("state", data, status)
+                except Exception as e:
+                    print(f"Error handling farming update: {str(e)}")
+        
+        if wanted is not None:
+            print(f"Farming worker died, restarting in {RESTART_DELAY:.0f}s")
+            timer = threading.Timer(RESTART_DELAY, self._restart, args=(wanted,))
+            timer.daemon = True
+            timer.start()
+    
+    def _restart(self, wanted):
+        """Timer thread: start a new worker, unless farming was stopped, changed or restarted meanwhile"""
+        with self._lock:
+            if self._wanted != wanted or (self._process is not None and self._process.is_alive()):
+                return
+            self.status["restarts"] += 1
+        self._send(wanted)
@@ -0,0 +1,249 @@
+"""
+Log Pipeline for the Twitch Auto-Farmer
+Fans farming log messages out to sinks (Discord webhook, rotating file, stdout), each with
+a bounded queue that drops the oldest messages under backpressure
+"""
+
+import abc
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from notification_dispatcher import dispatcher as notification_dispatcher
+from rate_limit import TokenBucket
+
+# Discord webhook of the webhook sink, which is left out while this is unset
+DISCORD_WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK_URL")
+
+# Comma-separated sinks for farming logs: webhook, file, stdout
+LOG_SINKS = os.environ.get("LOG_SINKS", "webhook")
+
+# Rotating log file used by the file sink
+LOG_FILE = os.environ.get("LOG_FILE", "farming.log")
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Messages each sink buffers before the oldest are dropped
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "1000"))
+
+# Webhook requests allowed per minute, and seconds to wait for more messages to share a request
+LOG_WEBHOOK_RATE = float(os.environ.get("LOG_WEBHOOK_RATE", "6"))
+LOG_BATCH_DELAY = float(os.environ.get("LOG_BATCH_DELAY", "5"))
+
+# Discord accepts up to 10 embeds per message
+EMBEDS_PER_REQUEST = 10
+
+EASTERN = ZoneInfo("America/New_York")
+
+class LogSink(abc.ABC):
+    batch_size = 100  # Messages written at once
+    linger = 0  # Seconds to wait for a fuller batch
+    
+    def __init__(self, queue_size=None):
+        """Create a sink; its writer thread starts with the first message"""
+        self.queue = collections.deque(maxlen=queue_size or LOG_QUEUE_SIZE)
+        self.dropped = 0  # Messages pushed out by newer ones
+        self._busy = False
+        self._wakeup = threading.Condition()
+        self._thread = None
+    
+    def put(self, entry):
+        """Queue a message; the oldest one is dropped if the queue is full"""
+        with self._wakeup:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._wakeup.notify_all()
+    
+    def requeue(self, batch):
+        """Put a batch that could not be written back in front, as far as there is room"""
+        with self._wakeup:
+            room = self.queue.maxlen - len(self.queue)
+            if room < len(batch):
+                self.dropped += len(batch) - room
+            # The batch is older than anything queued, so its oldest messages go first
+            for entry in reversed(batch[len(batch) - room:] if room else []):
+                self.queue.appendleft(entry)
+    
+    def flush(self, timeout=None):
+        """Wait until every queued message is written; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._wakeup:
+            while self.queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(remaining if remaining is not None else 0.1)
+        return True
+    
+    def ready_in(self):
+        """Seconds until the sink may write again"""
+        return 0
+    
+    def _run(self):
+        """Writer thread: write batches as messages arrive"""
+        while True:
+            with self._wakeup:
+                while not self.queue:
+                    self._wakeup.wait()
+                
+                # Give a burst of messages a moment to fill the batch
+                deadline = time.monotonic() + self.linger
+                while len(self.queue) < self.batch_size and time.monotonic() < deadline:
+                    self._wakeup.wait(deadline - time.monotonic())
+            
+            delay = self.ready_in()
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            
+            with self._wakeup:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+                self._busy = True
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"Error writing logs to {type(self).__name__}: {str(e)}")
+            finally:
+                with self._wakeup:
+                    self._busy = False
+                    self._wakeup.notify_all()
+    
+    @abc.abstractmethod
+    def write(self, batch):
+        """Write a batch of entries"""
+
+def format_entry(entry):
+    """One log line: "[HH:MM:SS] message" in local time"""
+    return f"[{entry['time'].astimezone().strftime('%H:%M:%S')}] {entry['message']}"
+
+class StdoutSink(LogSink):
+    def write(self, batch):
+        """Print the batch"""
+        sys.stdout.write("".join(format_entry(entry) + "\n" for entry in batch))
+        sys.stdout.flush()
+
+class FileSink(LogSink):
+    def __init__(self, path=None, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS, queue_size=None):
+        """Append to a log file that is rotated once it reaches `max_bytes`"""
+        super().__init__(queue_size)
+        self.handler = logging.handlers.RotatingFileHandler(path or LOG_FILE, maxBytes=max_bytes,
+                                                            backupCount=backups, encoding="utf-8")
+    
+    def write(self, batch):
+        """Append the batch to the file"""
+        for entry in batch:
+            self.handler.emit(logging.makeLogRecord({"msg": format_entry(entry)}))
+        self.handler.flush()
+
+class WebhookSink(LogSink):
+    batch_size = EMBEDS_PER_REQUEST
+    linger = LOG_BATCH_DELAY
+    
+    def __init__(self, url=None, requests_per_minute=None, queue_size=None, dispatcher=None):
+        """Post batches of up to 10 messages to a Discord webhook, within a request budget
+        
+        Requests go out through the notification dispatcher, which retries them.
+        """
+        super().__init__(queue_size)
+        self.url = url or DISCORD_WEBHOOK_URL
+        rate = (LOG_WEBHOOK_RATE if requests_per_minute is None else requests_per_minute) / 60
+        self.bucket = TokenBucket(rate, capacity=max(1, round(rate * 60 / 2)))
+        self.dispatcher = dispatcher or notification_dispatcher
+        self.requests = 0  # Requests sent, handy for measuring batching
+    
+    def ready_in(self):
+        """Seconds until the token bucket allows a request"""
+        return self.bucket.wait_time()
+    
+    def payload(self, batch):
+        """The webhook message for a batch: one embed per log line"""
+        embeds = []
+        for entry in batch:
+            formatted_time = entry["time"].astimezone(EASTERN).strftime("%I:%M:%S %p EST")
+            embeds.append({
+                "title": "📊 Channel Points Analytics",
+                "description": f"```diff\n+ {formatted_time}\n{entry['message']}```",
+                "color": 0xF0C43F,
+                "timestamp": entry["time"].isoformat(),
+                "footer": {
+                    "text": "Twitch Channel Points Pro™ Enterprise Edition",
+                    "icon_url": "https://static-cdn.jtvnw.net/custom-reward-images/default-4.png"
+                },
+                "thumbnail": {
+                    "url": "https://static-cdn.jtvnw.net/points-packages/points-100000.png"
+                }
+            })
+        return {
+            "username": "Twitch Channel Points Pro",
+            "avatar_url": "https://static-cdn.jtvnw.net/points-packages/points-500.png",
+            "embeds": embeds
+        }
+    
+    def write(self, batch):
+        """Hand a batch to the dispatcher once the request budget allows"""
+        if not self.bucket.try_acquire():
+            self.requeue(batch)
+            return
+        
+        self.requests += 1
+        self.dispatcher.submit("webhook", {"url": self.url, "json": self.payload(batch)})
+    
+    def flush(self, timeout=None):
+        """Wait until every queued message is queued with the dispatcher and delivered"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not super().flush(timeout):
+            return False
+        return self.dispatcher.flush(None if deadline is None else max(0, deadline - time.monotonic()))
+
+class LogPipeline:
+    def __init__(self, sinks=None):
+        """Create a pipeline writing every message to each of `sinks`"""
+        self.sinks = list(sinks or [])
+        self._webhooks = {}  # URL -> sink for messages sent to a specific webhook
+        self._lock = threading.Lock()
+    
+    def log(self, message):
+        """Queue a message for every sink; never blocks on a sink"""
+        entry = {"message": message, "time": datetime.now(timezone.utc)}
+        for sink in self.sinks:
+            sink.put(dict(entry))
+    
+    def send_to_webhook(self, message, webhook_url):
+        """Queue a message for one Discord webhook (batched and rate-limited like the webhook sink)"""
+        with self._lock:
+            sink = self._webhooks.get(webhook_url)
+            if sink is None:
+                sink = self._webhooks[webhook_url] = WebhookSink(webhook_url)
+        sink.put({"message": message, "time": datetime.now(timezone.utc)})
+    
+    def flush(self, timeout=None):
+        """Wait for every sink to write what it has queued"""
+        sinks = self.sinks + list(self._webhooks.values())
+        return all(sink.flush(timeout) for sink in sinks)
+
+def create_log_pipeline(sinks=None):
+    """Build a pipeline from sink names, LOG_SINKS by default"""
+    factories = {"webhook": WebhookSink, "file": FileSink, "stdout": StdoutSink}
+    names = [name.strip().lower() for name in (sinks or LOG_SINKS).split(",") if name.strip()]
+    pipeline_sinks = []
+    for name in names:
+        if name == "webhook" and not DISCORD_WEBHOOK_URL:
+            continue
+        if name in factories:
+            pipeline_sinks.append(factories[name]())
+        else:
+            print(f"Warning: Unknown log sink {name}")
+    return LogPipeline(pipeline_sinks)
+
+# Shared by every log sender in the process
+log_pipeline = create_log_pipeline()
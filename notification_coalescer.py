@@ -0,0 +1,88 @@
+"""
+Notification Coalescer for the Twitch Auto-Farmer
+Delivers the first event of a kind per channel at once and merges the rest of a burst into a digest
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# Seconds during which repeats of an event are merged into one digest
+NOTIFICATION_COALESCE_WINDOW = float(os.environ.get("NOTIFICATION_COALESCE_WINDOW", "600"))
+
+class NotificationCoalescer:
+    def __init__(self, window=None):
+        """Create a coalescer; its timer thread starts with the first event"""
+        self.window = NOTIFICATION_COALESCE_WINDOW if window is None else window
+        self.suppressed = 0  # Events merged into digests instead of being delivered
+        self._windows = {}  # Key -> open window: merged count and points, how to deliver the digest
+        self._due = []  # Heap of (end time, seq, key)
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+    
+    def emit(self, key, message, deliver, summarize, points=0):
+        """Deliver an event, or merge it into the digest if one with the same key was delivered recently
+        
+        `deliver(message)` sends a message; `summarize(count, points, minutes)` words the
+        digest of the events merged while the window was open. Returns True if the event
+        was delivered straight away.
+        """
+        with self._wakeup:
+            window = self._windows.get(key)
+            if window is not None:
+                window["count"] += 1
+                window["points"] += points
+                window["deliver"], window["summarize"] = deliver, summarize
+                self.suppressed += 1
+                return False
+            
+            self._open(key, {"count": 0, "points": 0, "deliver": deliver, "summarize": summarize})
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="notification-coalescer")
+                self._thread.start()
+        
+        deliver(message)
+        return True
+    
+    def flush(self):
+        """Deliver the digests of every open window now and close them"""
+        with self._wakeup:
+            windows, self._windows, self._due = self._windows, {}, []
+        for window in windows.values():
+            self._deliver_digest(window)
+    
+    def _open(self, key, window):
+        """Start a window for a key (call with the lock held)"""
+        self._windows[key] = window
+        heapq.heappush(self._due, (time.monotonic() + self.window, next(self._seq), key))
+        self._wakeup.notify()
+    
+    def _deliver_digest(self, window):
+        """Send the digest of a window's merged events, if there were any"""
+        if not window["count"]:
+            return
+        minutes = max(1, round(self.window / 60))
+        try:
+            window["deliver"](window["summarize"](window["count"], window["points"], minutes))
+        except Exception as e:
+            print(f"Error sending notification digest: {str(e)}")
+    
+    def _run(self):
+        """Timer thread: close windows as they end, sending their digests"""
+        while True:
+            with self._wakeup:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    self._wakeup.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                _, _, key = heapq.heappop(self._due)
+                window = self._windows.pop(key, None)
+                
+                # A burst that is still going keeps its window open, so it gets one digest per window
+                if window is not None and window["count"]:
+                    self._open(key, {"count": 0, "points": 0, "deliver": window["deliver"],
+                                     "summarize": window["summarize"]})
+            
+            if window is not None:
+                self._deliver_digest(window)
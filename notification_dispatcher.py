@@ -0,0 +1,164 @@
+"""
+Notification Dispatcher for the Twitch Auto-Farmer
+Delivers SMS and webhook notifications from a background queue with retries
+"""
+
+import collections
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds to wait for a provider to answer
+DISPATCH_TIMEOUT = float(os.environ.get("DISPATCH_TIMEOUT", "10"))
+
+# Deliveries tried per notification before it goes to the dead-letter list
+DISPATCH_MAX_ATTEMPTS = int(os.environ.get("DISPATCH_MAX_ATTEMPTS", "5"))
+
+# Worker threads delivering notifications
+DISPATCH_WORKERS = int(os.environ.get("DISPATCH_WORKERS", "2"))
+
+# Seconds before the first retry, doubling with each failed attempt up to the maximum
+RETRY_BASE = 2
+RETRY_MAX = 300
+
+# Failed notifications kept for inspection
+DEAD_LETTER_SIZE = 100
+
+class PermanentError(Exception):
+    """Raised by a handler when retrying cannot help (e.g. a rejected request)"""
+
+class RetryLater(Exception):
+    """Raised by a handler when the provider asked to be retried after `delay` seconds"""
+    def __init__(self, message, delay):
+        super().__init__(message)
+        self.delay = delay
+
+class NotificationDispatcher:
+    def __init__(self, workers=None, max_attempts=None, timeout=None):
+        """Create a dispatcher; its workers start with the first notification"""
+        self.workers = max(1, workers or DISPATCH_WORKERS)
+        self.max_attempts = max(1, max_attempts or DISPATCH_MAX_ATTEMPTS)
+        self.timeout = DISPATCH_TIMEOUT if timeout is None else timeout
+        self.handlers = {}  # Kind -> handler(payload), raising on failure
+        self.dead_letters = collections.deque(maxlen=DEAD_LETTER_SIZE)
+        self.delivered = 0
+        
+        # Keep-alive connections shared by every webhook delivery
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self._queue = []  # Heap of (due time, seq, job)
+        self._seq = itertools.count()
+        self._busy = 0  # Jobs being delivered right now
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._running = True
+        
+        self.register("webhook", self.post_json)
+    
+    def register(self, kind, handler):
+        """Deliver notifications of a kind with `handler(payload)`"""
+        self.handlers[kind] = handler
+    
+    def submit(self, kind, payload):
+        """Queue a notification and return straight away"""
+        job = {"kind": kind, "payload": payload, "attempts": 0, "error": None}
+        with self._wakeup:
+            heapq.heappush(self._queue, (time.monotonic(), next(self._seq), job))
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True, name=f"dispatch-{len(self._threads)}")
+                self._threads.append(thread)
+                thread.start()
+            self._wakeup.notify()
+    
+    def post_json(self, payload):
+        """Webhook handler: POST payload["json"] to payload["url"]"""
+        try:
+            response = self.session.post(payload["url"], json=payload["json"], timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ConnectionError(str(e))
+        
+        if response.status_code == 429:
+            raise RetryLater("HTTP 429", float(response.headers.get("Retry-After", RETRY_BASE)))
+        if 400 <= response.status_code < 500:
+            raise PermanentError(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+    
+    def pending(self):
+        """Number of notifications queued or being delivered"""
+        with self._wakeup:
+            return len(self._queue) + self._busy
+    
+    def flush(self, timeout=None):
+        """Wait until the queue is empty; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._wakeup:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(remaining)
+        return True
+    
+    def stop(self):
+        """Stop the workers; notifications still queued are dropped"""
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify_all()
+        self.session.close()
+    
+    def _work(self):
+        """Worker thread: deliver due notifications, sleeping until the next one is due"""
+        while True:
+            with self._wakeup:
+                while self._running and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._wakeup.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if not self._running:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                self._busy += 1
+            
+            retry_in = self._deliver(job)
+            
+            with self._wakeup:
+                self._busy -= 1
+                if retry_in is not None:
+                    heapq.heappush(self._queue, (time.monotonic() + retry_in, next(self._seq), job))
+                self._wakeup.notify_all()
+    
+    def _deliver(self, job):
+        """Try a notification once; returns seconds until the next try, or None when done"""
+        job["attempts"] += 1
+        try:
+            handler = self.handlers.get(job["kind"])
+            if handler is None:
+                raise PermanentError(f"No handler for {job['kind']} notifications")
+            handler(job["payload"])
+            with self._wakeup:
+                self.delivered += 1
+            return None
+        except PermanentError as e:
+            job["error"] = str(e)
+        except RetryLater as e:
+            job["error"] = str(e)
+            if job["attempts"] < self.max_attempts:
+                return e.delay
+        except Exception as e:
+            job["error"] = str(e)
+            if job["attempts"] < self.max_attempts:
+                return min(RETRY_BASE * 2 ** (job["attempts"] - 1), RETRY_MAX)
+        
+        print(f"Error sending {job['kind']} notification after {job['attempts']} attempts: {job['error']}")
+        self.dead_letters.append(dict(job, failed_at=datetime.now().isoformat()))
+        return None
+
+# Shared by every notification sender in the process
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,91 @@
+"""
+Notification History for the Twitch Auto-Farmer
+Append-only SQLite log of sent notifications with newest-first paged reads
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Database holding the notification history
+NOTIFICATION_HISTORY_FILE = os.environ.get("NOTIFICATION_HISTORY_FILE", "notification_history.db")
+
+# Notifications kept; older ones are trimmed in bulk every TRIM_INTERVAL appends
+NOTIFICATION_HISTORY_LIMIT = int(os.environ.get("NOTIFICATION_HISTORY_LIMIT", "50000"))
+TRIM_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    level TEXT NOT NULL DEFAULT 'info',
+    timestamp TEXT NOT NULL
+);
+"""
+
+class NotificationHistory:
+    def __init__(self, db_file=None, limit=None):
+        """Open (and create if needed) the history database"""
+        self.db_file = db_file or NOTIFICATION_HISTORY_FILE
+        self.limit = NOTIFICATION_HISTORY_LIMIT if limit is None else limit
+        self._appended = 0  # Appends since the last trim
+        self._lock = threading.RLock()
+        
+        # WAL lets the web and worker processes read while the other appends
+        self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+    
+    def add(self, type, message, level="info", timestamp=None):
+        """Append a notification; costs one row insert however long the history is"""
+        timestamp = timestamp or datetime.now().isoformat()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO notifications (type, message, level, timestamp) VALUES (?, ?, ?, ?)",
+                (type, message, level, timestamp)
+            )
+            self._appended += 1
+            if self.limit and self._appended >= TRIM_INTERVAL:
+                self._trim()
+    
+    def extend(self, notifications):
+        """Append notifications given oldest first, in one transaction"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO notifications (type, message, level, timestamp) VALUES (?, ?, ?, ?)",
+                [(n["type"], n["message"], n.get("level", "info"), n["timestamp"]) for n in notifications]
+            )
+            if self.limit:
+                self._trim()
+    
+    def _trim(self):
+        """Drop notifications beyond the limit (call with the lock held)"""
+        self.conn.execute(
+            "DELETE FROM notifications WHERE id <= (SELECT MAX(id) FROM notifications) - ?",
+            (self.limit,)
+        )
+        self._appended = 0
+    
+    def get_page(self, page=0, page_size=10):
+        """Get one page of notifications, newest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, type, message, level, timestamp FROM notifications "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                (page_size, page * page_size)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def count(self):
+        """Get the number of stored notifications"""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+    
+    def clear(self):
+        """Delete every notification"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM notifications")
+            self._appended = 0
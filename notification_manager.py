@@ -4,14 +4,27 @@ Handles SMS notifications through Twilio and in-app notifications
 """
 
 import os
-import json
+import threading
 from datetime import datetime
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
 import streamlit as st
 
+from event_bus import BonusClaimed, PointsChanged, StreamOffline
+from notification_coalescer import NotificationCoalescer
+from notification_dispatcher import PermanentError, dispatcher
+from notification_history import NotificationHistory
+from persistence import JsonStore
+from rate_limit import TokenBucket
+
 # Notification settings file
 NOTIFICATION_SETTINGS_FILE = "notification_settings.json"
 
+# SMS allowed per hour on average, and how many can go out back to back
+SMS_PER_HOUR = float(os.environ.get("SMS_PER_HOUR", "10"))
+SMS_BURST = int(os.environ.get("SMS_BURST", "3"))
+
 class NotificationManager:
     def __init__(self):
         """Initialize the notification manager"""
@@ -25,18 +38,29 @@ class NotificationManager:
         print(f"Auth Token present: {bool(self.twilio_token)}")
         print(f"Phone Number present: {bool(self.twilio_phone)}")
         
+        self.store = JsonStore(NOTIFICATION_SETTINGS_FILE, self.default_settings, indent=4)
         self.settings = self.load_settings()
         
+        # History lives in its own append-only store so notifications never rewrite the settings
+        self.history = NotificationHistory()
+        self._migrate_history()
+        
+        # SMS goes out from the dispatcher's workers so callers never wait on Twilio
+        self._client = None
+        self._client_lock = threading.Lock()
+        dispatcher.register("sms", self._deliver_sms)
+        
+        # Repeated events per channel are merged into digests, and SMS spending is capped
+        self.coalescer = NotificationCoalescer()
+        self.sms_bucket = TokenBucket(SMS_PER_HOUR / 3600, SMS_BURST)
+        self.sms_held_back = 0  # SMS skipped by the rate limit since the last one sent
+        
     def load_settings(self):
         """Load notification settings from file"""
-        if os.path.exists(NOTIFICATION_SETTINGS_FILE):
-            try:
-                with open(NOTIFICATION_SETTINGS_FILE, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading notification settings: {str(e)}")
-        
-        # Default settings
+        return self.store.load()
+    
+    def default_settings(self):
+        """Default notification settings"""
         return {
             "enabled": False,
             "phone_number": "",
@@ -45,20 +69,32 @@ class NotificationManager:
             "notify_on_bonus": True,
             "milestone_interval": 1000,  # Points
             "last_milestone": {},  # Per channel milestone tracking
-            "in_app_notifications": True,
-            "notification_history": []
+            "in_app_notifications": True
         }
     
+    def _migrate_history(self):
+        """Move history kept in the settings file by older versions into the history store"""
+        history = self.settings.get("notification_history")
+        if history is None:
+            return
+        if history and not self.history.count():
+            # Stored newest first; the store appends oldest first
+            self.history.extend(reversed(history))
+        self.store.update(lambda data: data.pop("notification_history", None))
+    
     def save_settings(self):
-        """Save notification settings to file"""
-        try:
-            with open(NOTIFICATION_SETTINGS_FILE, "w") as f:
-                json.dump(self.settings, f, indent=4)
-        except Exception as e:
-            print(f"Error saving notification settings: {str(e)}")
+        """Save notification settings to file as a whole (coalesced with other pending changes)
+
+        Prefer self.store.update(), which keeps changes made by other processes.
+        """
+        self.store.mark_dirty()
     
-    def send_sms(self, message):
-        """Send an SMS notification using Twilio"""
+    def send_sms(self, message, rate_limited=True):
+        """Queue an SMS notification through Twilio; returns True if it was queued
+
+        Beyond SMS_PER_HOUR the message is skipped (it is still in the in-app history) and
+        the next SMS mentions how many were held back.
+        """
         if not self.settings.get("enabled", False) or not self.settings.get("phone_number"):
             return False
         
@@ -66,22 +102,43 @@ class NotificationManager:
             print("Twilio credentials not configured")
             return False
         
+        if rate_limited and not self.sms_bucket.try_acquire():
+            self.sms_held_back += 1
+            print(f"SMS rate limit reached, holding back: {message}")
+            return False
+        
+        if self.sms_held_back:
+            message = f"{message}\n(+{self.sms_held_back} more notifications in the app)"
+            self.sms_held_back = 0
+        
+        dispatcher.submit("sms", {"body": message, "to": self.settings["phone_number"]})
+        return True
+    
+    def _twilio_client(self):
+        """Twilio client reused for every SMS, with pooled connections and a timeout"""
+        with self._client_lock:
+            if self._client is None:
+                http_client = TwilioHttpClient(pool_connections=True, timeout=dispatcher.timeout)
+                self._client = Client(self.twilio_sid, self.twilio_token, http_client=http_client)
+            return self._client
+    
+    def _deliver_sms(self, payload):
+        """Dispatcher handler: send one queued SMS"""
         try:
-            client = Client(self.twilio_sid, self.twilio_token)
-            message = client.messages.create(
-                body=message,
+            message = self._twilio_client().messages.create(
+                body=payload["body"],
                 from_=self.twilio_phone,
-                to=self.settings["phone_number"]
+                to=payload["to"]
             )
-            print(f"SMS sent with SID: {message.sid}")
-            
-            # Add to notification history
-            self.add_to_history("sms", message)
-            
-            return True
-        except Exception as e:
-            print(f"Error sending SMS: {str(e)}")
-            return False
+        except TwilioRestException as e:
+            # Rejected requests (bad number, bad credentials) fail the same way every time
+            if 400 <= e.status < 500 and e.status != 429:
+                raise PermanentError(str(e))
+            raise
+        print(f"SMS sent with SID: {message.sid}")
+        
+        # Add to notification history
+        self.add_to_history("sms", payload["body"])
     
     def send_in_app(self, message, level="info"):
         """Send an in-app notification (will be shown in the UI)"""
@@ -93,42 +150,29 @@ class NotificationManager:
     
     def add_to_history(self, type, message, level="info"):
         """Add a notification to the history"""
-        notification = {
-            "type": type,
-            "message": message,
-            "level": level,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Add to beginning of list (newest first)
-        self.settings["notification_history"].insert(0, notification)
-        
-        # Limit history to 100 items
-        if len(self.settings["notification_history"]) > 100:
-            self.settings["notification_history"] = self.settings["notification_history"][:100]
-        
-        # Save updated settings
-        self.save_settings()
+        try:
+            self.history.add(type, message, level)
+        except Exception as e:
+            print(f"Error saving notification history: {str(e)}")
     
     def check_milestone(self, channel, current_points):
         """Check if a point milestone has been reached and send notification if needed"""
+        self.store.refresh()
         if not self.settings.get("notify_on_milestone", True):
             return
         
-        # Initialize channel tracking if not exists
-        if channel not in self.settings["last_milestone"]:
-            self.settings["last_milestone"][channel] = 0
-        
         # Get last milestone for this channel
-        last_milestone = self.settings["last_milestone"][channel]
+        last_milestone = self.settings["last_milestone"].get(channel, 0)
         milestone_interval = self.settings.get("milestone_interval", 1000)
         
         # Check if milestone reached
         current_milestone = (current_points // milestone_interval) * milestone_interval
         if current_milestone > last_milestone:
             # Update last milestone
-            self.settings["last_milestone"][channel] = current_milestone
-            self.save_settings()
+            def apply(data):
+                milestones = data["last_milestone"]
+                milestones[channel] = max(milestones.get(channel, 0), current_milestone)
+            self.store.update(apply)
             
             # Send notifications
             message = f"🎉 Milestone reached! You've earned {current_milestone} points on {channel}!"
@@ -149,24 +193,43 @@ class NotificationManager:
         if not self.settings.get("notify_on_offline", True):
             return
         
-        message = f"📴 The stream for {channel} has gone offline."
-        
-        # Send SMS if enabled
-        if self.settings.get("enabled", False):
-            self.send_sms(message)
+        def deliver(message):
+            # Send SMS if enabled
+            if self.settings.get("enabled", False):
+                self.send_sms(message)
+            
+            # Send in-app notification
+            self.send_in_app(message, "warning")
         
-        # Send in-app notification
-        self.send_in_app(message, "warning")
+        # A flapping stream sends the first offline at once and a digest of the rest
+        self.coalescer.emit(
+            ("offline", channel),
+            f"📴 The stream for {channel} has gone offline.",
+            deliver,
+            lambda count, points, minutes:
+                f"📴 {channel} went offline {count} more time{'s' if count > 1 else ''} in the last {minutes} min."
+        )
     
     def notify_bonus_claimed(self, channel, points):
         """Send notification when bonus points are claimed"""
         if not self.settings.get("notify_on_bonus", True):
             return
         
-        message = f"💰 Claimed {points} bonus points on {channel}!"
-        
-        # Only send as in-app notification to avoid SMS spam
-        self.send_in_app(message, "info")
+        # Only send as in-app notification to avoid SMS spam; bursts become one digest
+        self.coalescer.emit(
+            ("bonus", channel),
+            f"💰 Claimed {points} bonus points on {channel}!",
+            lambda message: self.send_in_app(message, "info"),
+            lambda count, total, minutes:
+                f"💰 {count} more bonus{'es' if count > 1 else ''}, +{total} pts on {channel} in the last {minutes} min.",
+            points=points
+        )
+    
+    def subscribe(self, bus):
+        """Send notifications for a bot's events as they happen"""
+        bus.subscribe(PointsChanged, lambda event: self.check_milestone(event.channel, event.session_points))
+        bus.subscribe(BonusClaimed, lambda event: self.notify_bonus_claimed(event.channel, event.points))
+        bus.subscribe(StreamOffline, lambda event: self.notify_stream_offline(event.channel))
     
     def render_settings_ui(self):
         """Render the notification settings UI in Streamlit"""
@@ -213,16 +276,20 @@ class NotificationManager:
         # Save button
         if st.button("Save Notification Settings"):
             # Update settings
-            self.settings["enabled"] = enabled
-            self.settings["phone_number"] = phone
-            self.settings["notify_on_milestone"] = notify_milestone
-            self.settings["notify_on_offline"] = notify_offline
-            self.settings["notify_on_bonus"] = notify_bonus
-            self.settings["in_app_notifications"] = in_app
-            self.settings["milestone_interval"] = milestone_interval
+            changes = {
+                "enabled": enabled,
+                "phone_number": phone,
+                "notify_on_milestone": notify_milestone,
+                "notify_on_offline": notify_offline,
+                "notify_on_bonus": notify_bonus,
+                "in_app_notifications": in_app,
+                "milestone_interval": milestone_interval
+            }
             
-            # Save settings
-            self.save_settings()
+            # Save settings, only writing the file if something changed
+            changes = {key: value for key, value in changes.items() if self.settings.get(key) != value}
+            if changes:
+                self.store.update(lambda data: data.update(changes))
             
             # Show success message
             st.success("Notification settings saved!")
@@ -230,7 +297,8 @@ class NotificationManager:
             # Test notification
             if enabled and phone:
                 if st.button("Send Test SMS"):
-                    success = self.send_sms("This is a test notification from your Twitch Auto-Farmer!")
+                    success = self.send_sms("This is a test notification from your Twitch Auto-Farmer!",
+                                            rate_limited=False)
                     if success:
                         st.success("Test SMS sent successfully!")
                     else:
@@ -241,12 +309,26 @@ class NotificationManager:
         st.subheader("Notification History")
         
         # Check if there are any notifications
-        if not self.settings.get("notification_history", []):
+        total = self.history.count()
+        if not total:
             st.info("No notifications yet.")
             return
         
+        # Show the history one page at a time, newest first
+        page_size = 10
+        page_count = (total + page_size - 1) // page_size
+        page = st.number_input(
+            "Page",
+            min_value=1,
+            max_value=page_count,
+            value=1,
+            step=1,
+            key="notification_history_page",
+            help=f"{total} notifications, {page_size} per page"
+        ) - 1
+        
         # Display notifications
-        for notification in self.settings.get("notification_history", [])[:10]:  # Show last 10
+        for notification in self.history.get_page(page, page_size):
             timestamp = datetime.fromisoformat(notification["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
             message = notification["message"]
             level = notification["level"]
@@ -264,8 +346,7 @@ class NotificationManager:
         
         # Show button to clear history
         if st.button("Clear Notification History"):
-            self.settings["notification_history"] = []
-            self.save_settings()
+            self.history.clear()
             st.success("Notification history cleared!")
             st.rerun()
 
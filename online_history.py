@@ -0,0 +1,261 @@
+"""
+Online History for the Twitch Auto-Farmer
+Fixed-size ring buffer of a channel's online/offline probes, kept in a binary file updated slot by slot
+"""
+
+import base64
+import fcntl
+import os
+import struct
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Probes kept per channel (a week of one-a-minute probes by default)
+ONLINE_HISTORY_CAPACITY = int(os.environ.get("ONLINE_HISTORY_CAPACITY", "10080"))
+
+# Region header: magic, capacity, next slot, probe count, writes so far, channel; followed
+# by the capacity's uint32 seconds and then its online flags (one byte each)
+HEADER = struct.Struct("<4sIIIQ64s")
+MAGIC = b"TWOH"
+
+# Timestamps are stored as uint32 seconds of the (naive, local) wall-clock time, like session_table
+EPOCH = datetime(1970, 1, 1)
+
+def _to_seconds(timestamp):
+    """Convert a datetime or ISO timestamp string to epoch seconds"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return int((timestamp - EPOCH).total_seconds())
+
+class OnlineHistory:
+    def __init__(self, capacity=None):
+        """Create an empty history holding the newest `capacity` probes"""
+        self.capacity = max(1, ONLINE_HISTORY_CAPACITY if capacity is None else capacity)
+        self._seconds = np.zeros(self.capacity, dtype=np.uint32)
+        self._online = np.zeros(self.capacity, dtype=bool)
+        self._head = 0  # Slot the next probe is written to
+        self._count = 0
+    
+    def __len__(self):
+        return self._count
+    
+    def append(self, online, timestamp=None):
+        """Record a probe, overwriting the oldest one when full"""
+        self._seconds[self._head] = _to_seconds(timestamp or datetime.now())
+        self._online[self._head] = bool(online)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+    
+    def _order(self):
+        """Slot positions from oldest to newest"""
+        start = (self._head - self._count) % self.capacity
+        return (start + np.arange(self._count)) % self.capacity
+    
+    def seconds(self):
+        """Probe times as epoch seconds, oldest first"""
+        return self._seconds[self._order()]
+    
+    def online(self):
+        """Probe results, oldest first"""
+        return self._online[self._order()]
+    
+    def last(self):
+        """The newest probe as (datetime, online), or None"""
+        if not self._count:
+            return None
+        slot = (self._head - 1) % self.capacity
+        return EPOCH + timedelta(seconds=int(self._seconds[slot])), bool(self._online[slot])
+    
+    def __iter__(self):
+        """Probes as {"timestamp", "online"} dicts, oldest first"""
+        for seconds, online in zip(self.seconds().tolist(), self.online().tolist()):
+            yield {"timestamp": (EPOCH + timedelta(seconds=seconds)).isoformat(), "online": online}
+    
+    def to_json(self):
+        """Get a compact representation for saving: little-endian seconds and bit-packed flags"""
+        return {
+            "seconds": base64.b64encode(self.seconds().astype("<u4").tobytes()).decode("ascii"),
+            "online": base64.b64encode(np.packbits(self.online()).tobytes()).decode("ascii")
+        }
+    
+    def to_arrays(self):
+        """Like to_json(), but with NumPy arrays for binary codecs"""
+        return {"seconds": self.seconds(), "online": np.packbits(self.online())}
+    
+    @classmethod
+    def from_json(cls, data, capacity=None):
+        """Rebuild a history from to_json()/to_arrays() output or a legacy list of probe dicts"""
+        if isinstance(data, list):
+            seconds = np.array([_to_seconds(p["timestamp"]) for p in data], dtype=np.uint32)
+            online = np.array([bool(p["online"]) for p in data], dtype=bool)
+        else:
+            seconds, online = data["seconds"], data["online"]
+            if isinstance(seconds, str):
+                seconds = np.frombuffer(base64.b64decode(seconds), dtype="<u4")
+                online = np.frombuffer(base64.b64decode(online), dtype=np.uint8)
+            online = np.unpackbits(np.asarray(online, dtype=np.uint8), count=len(seconds)).astype(bool)
+        
+        # Keep the newest probes that fit the configured capacity
+        history = cls(capacity)
+        n = min(len(seconds), history.capacity)
+        history._seconds[:n] = seconds[len(seconds) - n:]
+        history._online[:n] = online[len(online) - n:]
+        history._head = n % history.capacity
+        history._count = n
+        return history
+
+class OnlineHistoryFile:
+    def __init__(self, path, capacity=None):
+        """Open the probe file holding every channel's ring buffer, one fixed-size region each
+        
+        A probe overwrites one slot and its region's header in place, so recording a
+        probe costs a few bytes of I/O however long the history is.
+        """
+        self.path = path
+        self.capacity = max(1, ONLINE_HISTORY_CAPACITY if capacity is None else capacity)
+        self.histories = {}  # Channel -> OnlineHistory, as last read or written
+        self._offsets = {}  # Channel -> offset of its region in the file
+        self._writes = {}  # Channel -> its region's write counter, as last read or written
+        self._lock = threading.Lock()
+    
+    def _open(self):
+        """Open the file, creating it if needed"""
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+    
+    def _region_size(self, capacity):
+        return HEADER.size + capacity * 5
+    
+    def _read_region(self, fd, offset):
+        """Read a region; returns (channel, history, size, writes), with no channel for a freed region"""
+        raw = os.pread(fd, HEADER.size, offset)
+        if len(raw) < HEADER.size:
+            return None, None, 0, 0
+        magic, capacity, head, count, writes, channel = HEADER.unpack(raw)
+        size = self._region_size(capacity)
+        if magic != MAGIC or not capacity:
+            return None, None, size if capacity else 0, 0
+        
+        body = os.pread(fd, capacity * 5, offset + HEADER.size)
+        if len(body) < capacity * 5:
+            return None, None, 0, 0  # Torn by a crash while the region was being added
+        history = OnlineHistory(capacity)
+        history._seconds[:] = np.frombuffer(body, dtype="<u4", count=capacity)
+        history._online[:] = np.frombuffer(body, dtype=bool, offset=capacity * 4)
+        history._head = head % capacity
+        history._count = min(count, capacity)
+        return channel.rstrip(b"\0").decode("utf-8", "replace"), history, size, writes
+    
+    def _write_region(self, fd, offset, channel, history, writes):
+        """Write a whole region"""
+        header = HEADER.pack(MAGIC, history.capacity, history._head, history._count, writes,
+                             channel.encode("utf-8")[:64])
+        os.pwrite(fd, header + history._seconds.astype("<u4").tobytes() + history._online.tobytes(), offset)
+        self._writes[channel] = writes
+    
+    def _add_region(self, fd, channel, history, writes=0):
+        """Append a region for a channel at the end of the file (call with the file locked)"""
+        offset = os.fstat(fd).st_size
+        self._write_region(fd, offset, channel, history, writes)
+        self._offsets[channel] = offset
+        self.histories[channel] = history
+    
+    def load(self):
+        """Read every channel's ring buffer from the file; returns {channel: OnlineHistory}"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return self.histories
+            try:
+                fd = self._open()
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    self._scan(fd)
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f"Error loading {self.path}: {str(e)}")
+            return self.histories
+    
+    def _scan(self, fd):
+        """Read every region (call with the file locked)"""
+        self.histories, self._offsets, self._writes = {}, {}, {}
+        resized = []
+        offset, end = 0, os.fstat(fd).st_size
+        while offset < end:
+            channel, history, size, writes = self._read_region(fd, offset)
+            if not size:
+                break
+            if channel is not None:
+                self.histories[channel] = history
+                self._offsets[channel] = offset
+                self._writes[channel] = writes
+                if history.capacity != self.capacity:
+                    resized.append((channel, offset))
+            offset += size
+        
+        # ONLINE_HISTORY_CAPACITY changed: free those regions and add ones of the new size
+        for channel, offset in resized:
+            os.pwrite(fd, bytes(len(MAGIC)), offset)
+            history = OnlineHistory.from_json(self.histories[channel].to_arrays(), self.capacity)
+            self._add_region(fd, channel, history, self._writes[channel] + 1)
+    
+    def get(self, channel):
+        """Get a channel's ring buffer (empty for a channel without probes)"""
+        with self._lock:
+            return self.histories.get(channel) or OnlineHistory(self.capacity)
+    
+    def replace(self, channel, history):
+        """Store a whole history for a channel, e.g. one migrated from channel_data.json"""
+        history = OnlineHistory.from_json(history.to_arrays(), self.capacity)
+        with self._lock:
+            try:
+                fd = self._open()
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    if channel in self._offsets:
+                        offset = self._offsets[channel]
+                        writes = HEADER.unpack(os.pread(fd, HEADER.size, offset))[4] + 1
+                        self._write_region(fd, offset, channel, history, writes)
+                        self.histories[channel] = history
+                    else:
+                        self._add_region(fd, channel, history)
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f"Error saving {self.path}: {str(e)}")
+    
+    def append_many(self, probes, timestamp=None):
+        """Record a probe ({channel: online}) for many channels, writing one slot each"""
+        seconds = _to_seconds(timestamp or datetime.now())
+        with self._lock:
+            try:
+                fd = self._open()
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    for channel, online in probes.items():
+                        # Another process may have added or moved the region since we read the file
+                        offset = self._offsets.get(channel)
+                        if offset is None or os.pread(fd, len(MAGIC), offset) != MAGIC:
+                            self._scan(fd)
+                            offset = self._offsets.get(channel)
+                        if offset is None:
+                            self._add_region(fd, channel, OnlineHistory(self.capacity))
+                            offset = self._offsets[channel]
+                        
+                        # ...or written to it; head and count alone repeat once the ring is full
+                        history = self.histories[channel]
+                        _, capacity, _, _, writes, _ = HEADER.unpack(os.pread(fd, HEADER.size, offset))
+                        if writes != self._writes[channel]:
+                            history = self.histories[channel] = self._read_region(fd, offset)[1]
+                        
+                        slot = history._head
+                        history.append(online, timestamp)
+                        os.pwrite(fd, struct.pack("<I", seconds), offset + HEADER.size + slot * 4)
+                        os.pwrite(fd, bytes([bool(online)]), offset + HEADER.size + capacity * 4 + slot)
+                        os.pwrite(fd, struct.pack("<IIQ", history._head, history._count, writes + 1), offset + 8)
+                        self._writes[channel] = writes + 1
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f"Error saving {self.path}: {str(e)}")
@@ -0,0 +1,425 @@
+"""
+Persistence layer for the Twitch Auto-Farmer
+Provides crash-safe state files with coalesced (debounced) writes shared by all managers,
+safe to share between processes (the web and worker processes)
+"""
+
+import atexit
+import contextlib
+import copy
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Seconds to wait for more changes before writing a dirty store
+FLUSH_DELAY = float(os.environ.get("STATE_FLUSH_DELAY", "1.0"))
+
+# Maximum seconds a change may stay in memory before it is written
+MAX_STALENESS = float(os.environ.get("STATE_MAX_STALENESS", "5.0"))
+
+# Format state files are written in: json or msgpack (both are always readable)
+STATE_CODEC = os.environ.get("STATE_CODEC", "json").lower()
+
+# All open stores, flushed at interpreter shutdown
+_stores = weakref.WeakSet()
+
+# Path -> FileLock, so every store and manager in the process shares one lock per file
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+# Process umask, read once (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _encode_default(value):
+    """Encode objects the json module doesn't know (columnar tables, NumPy values)"""
+    if hasattr(value, "to_json"):
+        return value.to_json()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class JsonCodec:
+    """Plain JSON, readable by hand and by older versions of the app"""
+    name = "json"
+    
+    def dumps(self, data, indent=None):
+        return json.dumps(data, indent=indent, default=_encode_default).encode("utf-8")
+    
+    def loads(self, raw):
+        return json.loads(raw)
+
+class MsgpackCodec:
+    """Binary msgpack; NumPy columns are stored as raw little-endian buffers"""
+    name = "msgpack"
+    MAGIC = b"\xc1TWMP"  # 0xc1 is never used by msgpack or valid at the start of JSON
+    NDARRAY = 1  # msgpack extension type for NumPy arrays
+    
+    def _default(self, value):
+        if hasattr(value, "to_arrays"):
+            return value.to_arrays()
+        if isinstance(value, np.ndarray):
+            array = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+            return msgpack.ExtType(self.NDARRAY, msgpack.packb([array.dtype.str, list(array.shape)]) +
+                                   array.tobytes())
+        if isinstance(value, np.generic):
+            return value.item()
+        return _encode_default(value)
+    
+    def _ext_hook(self, code, payload):
+        if code != self.NDARRAY:
+            return msgpack.ExtType(code, payload)
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(payload)
+        dtype, shape = unpacker.unpack()
+        return np.frombuffer(payload, dtype=dtype, offset=unpacker.tell()).reshape(shape)
+    
+    def dumps(self, data, indent=None):
+        return self.MAGIC + msgpack.packb(data, default=self._default, use_bin_type=True)
+    
+    def loads(self, raw):
+        return msgpack.unpackb(raw[len(self.MAGIC):], ext_hook=self._ext_hook, raw=False,
+                               strict_map_key=False)
+
+def get_codec(name=None):
+    """Get the codec for a format name, falling back to JSON if msgpack isn't installed"""
+    return _get_codec((name or STATE_CODEC).lower())
+
+@functools.lru_cache(maxsize=None)
+def _get_codec(name):
+    if name == "msgpack":
+        if msgpack is not None:
+            return MsgpackCodec()
+        print("Warning: msgpack is not installed, saving state as JSON")
+    elif name != "json":
+        print(f"Warning: Unknown state codec {name}, saving state as JSON")
+    return JsonCodec()
+
+def detect_codec(raw):
+    """Get the codec a file's contents were written with"""
+    if raw.startswith(MsgpackCodec.MAGIC):
+        if msgpack is None:
+            raise ValueError("File is in msgpack format but msgpack is not installed")
+        return MsgpackCodec()
+    return JsonCodec()
+
+def read_file(path):
+    """Read a state file written with any codec"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    return detect_codec(raw).loads(raw)
+
+def file_signature(path):
+    """Identify a file's current contents; changes whenever the file is replaced, None if missing"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class FileLock:
+    """Exclusive lock across threads and processes, held on a `<path>.lock` sidecar file
+
+    The sidecar is never replaced, unlike the data file, so the lock survives atomic writes.
+    It is reentrant within a thread; readers don't take it.
+    """
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+    
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except Exception:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+    
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            os.close(self._fd)  # Closing the file releases the flock
+            self._fd = None
+        self._lock.release()
+
+def file_lock(path):
+    """Get the process-wide lock for a data file"""
+    path = os.path.abspath(path)
+    with _file_locks_guard:
+        if path not in _file_locks:
+            _file_locks[path] = FileLock(path)
+        return _file_locks[path]
+
+def _file_mode(path):
+    """Permissions for a rewritten file: the existing file's, or what open() would give a new one"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def atomic_write(path, data, indent=4, codec=None):
+    """Write a state file to a temp file and rename it over the target so readers never see a torn file"""
+    raw = (codec or get_codec()).dumps(data, indent=indent)
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        # mkstemp creates the file 0600 and the rename would keep that mode
+        os.fchmod(fd, _file_mode(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class JsonStore:
+    def __init__(self, path, default, indent=4, flush_delay=None, max_staleness=None, snapshot=None,
+                 codec=None, decode=None):
+        """Create a file-backed store; `default` is a callable returning the initial data
+
+        Files are read in whatever format they were written in and saved with `codec`
+        (STATE_CODEC by default), so changing the codec migrates a file on its next write.
+        """
+        self.path = path
+        self.default = default
+        self.indent = indent
+        self.codec = codec or get_codec()
+        self.snapshot = snapshot  # Optional callable returning a copy of the data to write
+        self.decode = decode  # Optional callable converting freshly read data in place (e.g. to objects)
+        self.flush_delay = FLUSH_DELAY if flush_delay is None else flush_delay
+        self.max_staleness = MAX_STALENESS if max_staleness is None else max_staleness
+        
+        self.lock = threading.RLock()
+        self._write_lock = threading.RLock()
+        self._wakeup = threading.Condition(self.lock)
+        self._dirty_since = None  # When the oldest unwritten change was made
+        self._last_change = None  # When the newest unwritten change was made
+        self._flusher = None
+        self._pending = []  # Changes made with update() that are not written yet
+        self._overwrite = False  # Changes made with mark_dirty() overwrite the file as a whole
+        self._batch_depth = 0  # Nesting of open batch() blocks
+        self._batch_changed = False  # Changes made inside them, written when the outermost one ends
+        self.writes = 0  # Number of files written, handy for measuring coalescing
+        self.signature = None  # file_signature() of the file as last read or written
+        self.version = 0  # Bumped on every change or reload, for caches built on the data
+        
+        self.data = None
+        _stores.add(self)
+    
+    def _read(self):
+        """Read the file; returns the data (None if missing or unreadable) and its signature"""
+        try:
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+                try:
+                    raw = f.read()
+                    return detect_codec(raw).loads(raw), signature
+                except Exception as e:
+                    print(f"Error loading {self.path}: {str(e)}")
+                    return None, signature
+        except FileNotFoundError:
+            return None, None
+        except Exception as e:
+            print(f"Error loading {self.path}: {str(e)}")
+            return None, None
+    
+    def load(self):
+        """Load the data from disk, falling back to the default"""
+        with self.lock:
+            self.data, self.signature = self._read()
+            if self.data is None:
+                self.data = self.default()
+            if self.decode:
+                self.decode(self.data)
+            self.version += 1
+            return self.data
+    
+    def refresh(self):
+        """Reload the data if another process wrote the file; returns True if it changed
+
+        Only costs a stat() when nothing changed and never takes the file lock, so
+        readers don't wait on each other or on writers.
+        """
+        if file_signature(self.path) == self.signature:
+            return False
+        with self.lock:
+            return self._reload()
+    
+    def _reload(self):
+        """Re-read the file and replay unwritten changes on top of it (call with the lock held)"""
+        data, signature = self._read()
+        if signature == self.signature:
+            return False
+        if data is None:
+            data = self.default()
+        if self.decode:
+            self.decode(data)
+        
+        for fn in self._pending:
+            fn(data)
+        
+        # Update in place so managers holding a reference to the data see the new contents
+        self.data.clear()
+        self.data.update(data)
+        self.signature = signature
+        self.version += 1
+        return True
+    
+    def update(self, fn):
+        """Apply a change to the data and schedule a write
+
+        `fn(data)` mutates the data in place. It is kept until the write and replayed on
+        the file's contents if another process wrote it meanwhile, so no update is lost.
+        """
+        with self.lock:
+            fn(self.data)
+            self._pending.append(fn)
+        self._touch()
+    
+    def mark_dirty(self):
+        """Record that the data changed as a whole; it is written as is after a short quiet period"""
+        with self.lock:
+            self._overwrite = True
+        self._touch()
+    
+    @contextlib.contextmanager
+    def batch(self):
+        """Group changes made in the block so they are written once, when the outermost block ends"""
+        with self.lock:
+            self._batch_depth += 1
+        try:
+            yield self.data
+        finally:
+            with self.lock:
+                self._batch_depth -= 1
+                changed = not self._batch_depth and self._batch_changed
+                if changed:
+                    self._batch_changed = False
+            if changed:
+                self._touch()
+    
+    def _touch(self):
+        """Schedule a write of the changed data"""
+        with self.lock:
+            self.version += 1
+            if self._batch_depth:
+                self._batch_changed = True
+                return
+            
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_change = now
+            
+            if self.flush_delay > 0:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self._flusher.start()
+                self._wakeup.notify()
+                return
+        
+        # Coalescing disabled, write straight away
+        self.flush()
+    
+    def _flush_loop(self):
+        """Background thread that writes the store once changes settle"""
+        while True:
+            with self.lock:
+                while self._dirty_since is None or self._batch_depth:
+                    self._wakeup.wait()
+                
+                # Wait for a quiet period, but never past the staleness limit
+                now = time.monotonic()
+                deadline = min(self._last_change + self.flush_delay,
+                               self._dirty_since + self.max_staleness)
+                if now < deadline:
+                    self._wakeup.wait(deadline - now)
+                    continue
+            
+            self.flush()
+    
+    def _serialize(self):
+        """Take a copy of the data that is safe to write outside the lock"""
+        if self.snapshot:
+            return self.snapshot()
+        
+        # Managers mutate their dicts from other threads, so retry if one changes mid-copy
+        for _ in range(3):
+            try:
+                return copy.deepcopy(self.data)
+            except RuntimeError:
+                time.sleep(0)
+        return copy.deepcopy(self.data)
+    
+    def flush(self):
+        """Write the data now if it has unwritten changes"""
+        with self.lock:
+            if self._dirty_since is None:
+                return
+        
+        # Holding the write lock keeps an older snapshot from overwriting a newer one,
+        # and the file lock keeps other processes from writing between our read and write
+        with self._write_lock, file_lock(self.path):
+            with self.lock:
+                if self._dirty_since is None:
+                    return
+                
+                # Another process wrote the file since we read it: replay our changes on its data
+                if (not self.snapshot and not self._overwrite and
+                        file_signature(self.path) != self.signature):
+                    self._reload()
+                
+                snapshot = self._serialize()
+                pending, self._pending = self._pending, []
+                overwrite, self._overwrite = self._overwrite, False
+                self._dirty_since = None
+                self._last_change = None
+            
+            try:
+                self.write(snapshot)
+            except Exception as e:
+                print(f"Error saving {self.path}: {str(e)}")
+                
+                # Keep the changes pending so the next flush tries again
+                with self.lock:
+                    self._pending = pending + self._pending
+                    self._overwrite = self._overwrite or overwrite
+                    if self._dirty_since is None:
+                        self._dirty_since = self._last_change = time.monotonic()
+    
+    def write(self, data):
+        """Atomically write the given data to the store's file"""
+        with self._write_lock, file_lock(self.path):
+            atomic_write(self.path, data, indent=self.indent, codec=self.codec)
+            self.signature = file_signature(self.path)
+            self.writes += 1
+
+def flush_all():
+    """Write every store with pending changes"""
+    for store in list(_stores):
+        store.flush()
+
+atexit.register(flush_all)
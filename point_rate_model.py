@@ -0,0 +1,240 @@
+"""
+Point Rate Model for the Twitch Auto-Farmer
+Estimates each channel's points per hour, overall and per hour of the week, from finished sessions
+"""
+
+import base64
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Weight of one hour of new data in the moving averages
+POINT_RATE_ALPHA = float(os.environ.get("POINT_RATE_ALPHA", "0.2"))
+
+# Hours of data in an hour-of-week bucket before it is trusted over the channel's overall rate
+PRIOR_HOURS = 1.0
+
+HOURS_PER_WEEK = 7 * 24
+NS_PER_HOUR = 3600 * 10**9
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+NAT = np.iinfo(np.int64).min  # Missing end time
+
+def hour_of_week(moment):
+    """Hour of the week of a datetime, Monday 00:00 being 0"""
+    return moment.weekday() * 24 + moment.hour
+
+def _pieces(end_ns, duration_hours):
+    """Split sessions into the hours of the week they overlap
+    
+    Sessions are placed by end time and duration, which is what was actually farmed.
+    Returns per piece: session position, hour of week and hours overlapped.
+    """
+    end = np.asarray(end_ns, dtype=np.int64)
+    start = end - (duration_hours * NS_PER_HOUR).astype(np.int64)
+    first, last = start // NS_PER_HOUR, (end - 1) // NS_PER_HOUR
+    counts = last - first + 1
+    
+    session = np.repeat(np.arange(len(end)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first[session] + offsets
+    
+    lo = np.maximum(start[session], hour * NS_PER_HOUR)
+    hi = np.minimum(end[session], (hour + 1) * NS_PER_HOUR)
+    overlap = (hi - lo) / NS_PER_HOUR
+    
+    how = ((hour // 24 + EPOCH_WEEKDAY) % 7) * 24 + hour % 24
+    return session, how, overlap
+
+def _ewma_groups(groups, order, values, weights, alpha):
+    """Time-weighted EWMA of values within groups, in the given order, fully vectorized
+    
+    Each value moves its group's average by 1 - (1 - alpha) ** weight; the first value
+    of a group sets it. Returns (group keys, averages, total weights).
+    """
+    sort = np.lexsort((order, groups))
+    groups, values, weights = groups[sort], values[sort], weights[sort]
+    
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    keep = np.log1p(-alpha) * weights  # log of the fraction each update keeps of the old average
+    gain = -np.expm1(keep)
+    gain[starts] = 1.0
+    keep[starts] = 0.0
+    
+    # Each value's weight in the final average is its gain times what later updates keep
+    cumulative = np.cumsum(keep)
+    ends = np.r_[starts[1:], len(groups)] - 1
+    group_end = np.repeat(cumulative[ends], np.diff(np.r_[starts, len(groups)]))
+    contribution = gain * np.exp(group_end - cumulative) * values
+    
+    return groups[starts], np.add.reduceat(contribution, starts), np.add.reduceat(weights, starts)
+
+class PointRateModel:
+    def __init__(self, alpha=None):
+        """Create an empty model"""
+        self.alpha = POINT_RATE_ALPHA if alpha is None else alpha
+        self.channels = []
+        self._codes = {}
+        self.overall = np.zeros(0, dtype=np.float32)  # Points per hour per channel
+        self.overall_hours = np.zeros(0, dtype=np.float32)  # Hours of data behind it
+        self.hourly = np.zeros((0, HOURS_PER_WEEK), dtype=np.float32)  # Per channel and hour of week
+        self.hourly_hours = np.zeros((0, HOURS_PER_WEEK), dtype=np.float32)
+    
+    def channel_code(self, channel):
+        """Row of a channel, adding it if needed"""
+        code = self._codes.get(channel)
+        if code is None:
+            code = self._codes[channel] = len(self.channels)
+            self.channels.append(channel)
+        return code
+    
+    def _grow(self):
+        """Add rows for channels added since the arrays were last sized"""
+        extra = len(self.channels) - len(self.overall)
+        if extra > 0:
+            self.overall = np.r_[self.overall, np.zeros(extra, dtype=np.float32)]
+            self.overall_hours = np.r_[self.overall_hours, np.zeros(extra, dtype=np.float32)]
+            self.hourly = np.vstack([self.hourly, np.zeros((extra, HOURS_PER_WEEK), dtype=np.float32)])
+            self.hourly_hours = np.vstack([self.hourly_hours, np.zeros((extra, HOURS_PER_WEEK), dtype=np.float32)])
+    
+    @classmethod
+    def fit(cls, tables, alpha=None):
+        """Build a model from SessionTables in one vectorized pass"""
+        model = cls(alpha)
+        model.extend(tables)
+        return model
+    
+    def extend(self, tables):
+        """Add the finished sessions of SessionTables, newer than everything added so far"""
+        codes, end_ns, duration, points = [], [], [], []
+        for table in tables:
+            if not len(table):
+                continue
+            remap = np.array([self.channel_code(c) for c in table.channels], dtype=np.int64)
+            codes.append(remap[table.column("channel")])
+            end_ns.append(table.column("end_time"))
+            duration.append(table.column("duration"))
+            points.append(table.column("points"))
+        
+        if codes:
+            self._apply(np.concatenate(codes), np.concatenate(end_ns),
+                        np.concatenate(duration), np.concatenate(points))
+    
+    def update(self, channel, end_time, duration, points):
+        """Add one finished session (duration in minutes)"""
+        end_ns = np.datetime64(end_time, "ns").astype(np.int64)
+        self._apply(np.array([self.channel_code(channel)]), np.array([end_ns]),
+                    np.array([duration]), np.array([points]))
+    
+    def _apply(self, codes, end_ns, duration, points):
+        """Fold sessions into the averages, as if added one by one in end-time order"""
+        self._grow()
+        
+        hours = np.asarray(duration, dtype=np.float64) / 60
+        end_ns = np.asarray(end_ns, dtype=np.int64)
+        valid = (hours > 0) & (end_ns != NAT)
+        codes = np.asarray(codes, dtype=np.int64)[valid]
+        end_ns = end_ns[valid]
+        hours = hours[valid]
+        rate = np.asarray(points, dtype=np.float64)[valid] / hours
+        if not len(codes):
+            return
+        
+        # Overall: one update per session, weighted by its length
+        self._fold(self.overall, self.overall_hours, codes, end_ns, rate, hours)
+        
+        # Per hour of week: one update per hour the session overlapped
+        session, how, overlap = _pieces(end_ns, hours)
+        self._fold(self.hourly.reshape(-1), self.hourly_hours.reshape(-1),
+                   codes[session] * HOURS_PER_WEEK + how, end_ns[session], rate[session], overlap)
+    
+    def _fold(self, averages, hours, groups, order, values, weights):
+        """Continue the averages of the given groups with new values (arrays updated in place)"""
+        # Groups with data start from their current average
+        seeded = np.unique(groups)
+        seeded = seeded[hours[seeded] > 0]
+        
+        keys, new, total = _ewma_groups(
+            np.r_[seeded, groups], np.r_[np.full(len(seeded), NAT), order],
+            np.r_[averages[seeded], values], np.r_[np.zeros(len(seeded)), weights], self.alpha
+        )
+        averages[keys] = new
+        hours[keys] += total
+    
+    def rates(self, moment=None):
+        """Predicted points per hour of every channel at a moment (now by default)
+        
+        Blends the channel's rate at that hour of the week with its overall rate,
+        trusting the hourly one more as its hours of data grow.
+        """
+        self._grow()
+        how = hour_of_week(moment or datetime.now())
+        hours = self.hourly_hours[:, how]
+        return (self.hourly[:, how] * hours + self.overall * PRIOR_HOURS) / (hours + PRIOR_HOURS)
+    
+    def rate(self, channel, moment=None):
+        """Predicted points per hour of one channel, or None without data"""
+        code = self._codes.get(channel)
+        if code is None or code >= len(self.overall_hours) or not self.overall_hours[code]:
+            return None
+        return float(self.rates(moment)[code])
+    
+    def rates_for(self, channels, moment=None):
+        """Predicted points per hour of the given channels, and which of them have data"""
+        codes = np.array([self._codes.get(channel, -1) for channel in channels], dtype=np.int64)
+        known = codes >= 0
+        rates = np.zeros(len(codes))
+        measured = np.zeros(len(codes), dtype=bool)
+        if known.any():
+            rates[known] = self.rates(moment)[codes[known]]
+            measured[known] = self.overall_hours[codes[known]] > 0
+        return rates, measured
+    
+    def rank(self, channels=None, moment=None):
+        """(channel, points per hour) pairs, best first, for channels with data"""
+        rates = self.rates(moment)
+        order = np.argsort(-rates, kind="stable")
+        wanted = None if channels is None else set(channels)
+        return [(self.channels[i], float(rates[i])) for i in order
+                if self.overall_hours[i] and (wanted is None or self.channels[i] in wanted)]
+    
+    def to_json(self):
+        """Get a compact representation for saving (base64 float32 arrays)"""
+        self._grow()
+        def pack(array):
+            return base64.b64encode(np.ascontiguousarray(array, dtype="<f4").tobytes()).decode("ascii")
+        return {
+            "channels": list(self.channels),
+            "overall": pack(self.overall),
+            "overall_hours": pack(self.overall_hours),
+            "hourly": pack(self.hourly),
+            "hourly_hours": pack(self.hourly_hours)
+        }
+    
+    def copy(self):
+        """Copy of the model for saving while it keeps being updated"""
+        self._grow()
+        model = PointRateModel(self.alpha)
+        model.channels = list(self.channels)
+        model._codes = dict(self._codes)
+        model.overall, model.overall_hours = self.overall.copy(), self.overall_hours.copy()
+        model.hourly, model.hourly_hours = self.hourly.copy(), self.hourly_hours.copy()
+        return model
+    
+    @classmethod
+    def from_json(cls, data, alpha=None):
+        """Rebuild a model from to_json() output"""
+        def unpack(value, shape):
+            if isinstance(value, str):
+                value = np.frombuffer(base64.b64decode(value), dtype="<f4")
+            return np.array(value, dtype=np.float32).reshape(shape)
+        
+        model = cls(alpha)
+        model.channels = list(data["channels"])
+        model._codes = {channel: code for code, channel in enumerate(model.channels)}
+        n = len(model.channels)
+        model.overall = unpack(data["overall"], (n,))
+        model.overall_hours = unpack(data["overall_hours"], (n,))
+        model.hourly = unpack(data["hourly"], (n, HOURS_PER_WEEK))
+        model.hourly_hours = unpack(data["hourly_hours"], (n, HOURS_PER_WEEK))
+        return model
@@ -0,0 +1,59 @@
+"""
+Rate Limiting for the Twitch Auto-Farmer
+Token bucket shared by senders that talk to rate-limited services
+"""
+
+import threading
+import time
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """Allow `rate` tokens per second on average, in bursts of up to `capacity`"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0  # Set when the service itself asked us to wait
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        """Add the tokens earned since the last refill (call with the lock held)"""
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+    
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` can be taken (0 if they can be taken now)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            paused = max(self._paused_until - now, 0)
+            missing = max(tokens - self.tokens, 0)
+            return paused + (missing / self.rate if self.rate > 0 else float("inf") if missing else 0)
+    
+    def try_acquire(self, tokens=1):
+        """Take `tokens` if available now; returns True if they were taken"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+    
+    def acquire(self, tokens=1, timeout=None):
+        """Wait for and take `tokens`; returns False if that would take longer than `timeout`"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(tokens):
+            delay = self.wait_time(tokens)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+        return True
+    
+    def pause(self, seconds):
+        """Take no tokens for `seconds` and start empty afterwards (e.g. after a 429 with Retry-After)"""
+        with self._lock:
+            self.tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
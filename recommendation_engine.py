@@ -0,0 +1,143 @@
+"""
+Recommendation Engine for the Twitch Auto-Farmer
+Scores every known channel by measured point rate, uptime and tags, and caches the result
+"""
+
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Seconds recommendations are served from cache before they are recomputed
+RECOMMENDATION_TTL = float(os.environ.get("RECOMMENDATION_TTL", "3600"))
+
+# Points per hour assumed for a channel before anything has been measured
+DEFAULT_POINT_RATE = 60
+
+# Suggested to new users, and scored like any other channel without data
+POPULAR_CHANNELS = [
+    "xQc", "Ninja", "pokimane", "shroud", "NICKMERCS",
+    "TimTheTatman", "DrLupo", "summit1g", "Myth", "DrDisrespect",
+    "sodapoppin", "Tfue", "Asmongold", "HasanAbi", "Ludwig",
+    "moistcr1tikal", "Mizkif", "loltyler1", "Sykkuno", "Valkyrae"
+]
+
+def score_channels(rates, measured, uptime, probed, tags):
+    """Score channels in one pass over arrays
+    
+    rates/measured: measured points per hour and whether there is any data.
+    uptime/probed: probability the channel is live now and whether it was ever probed.
+    tags: boolean matrix of channels by tags.
+    
+    Unmeasured channels are estimated from measured channels sharing their tags, else
+    from the median measured channel. Returns (estimated rates, source, scores) where
+    source is 0 for measured, 1 for estimated from tags and 2 for the median.
+    """
+    typical = float(np.median(rates[measured])) if measured.any() else DEFAULT_POINT_RATE
+    
+    # Average measured rate of each tag, then of each channel's tags that have one
+    tag_counts = tags[measured].sum(axis=0)
+    tag_rates = np.divide(rates[measured] @ tags[measured], tag_counts,
+                          out=np.zeros(tags.shape[1]), where=tag_counts > 0)
+    rated_tags = tags & (tag_counts > 0)
+    rated_counts = rated_tags.sum(axis=1)
+    by_tags = np.divide(rated_tags @ tag_rates, rated_counts,
+                        out=np.zeros(len(rates)), where=rated_counts > 0)
+    
+    source = np.where(measured, 0, np.where(rated_counts > 0, 1, 2))
+    estimated = np.choose(source, [rates, by_tags, np.full(len(rates), typical)])
+    
+    # Points only come in while the channel is live
+    typical_uptime = float(np.median(uptime[probed])) if probed.any() else 1.0
+    expected_uptime = np.where(probed, uptime, typical_uptime)
+    return estimated, source, estimated * expected_uptime
+
+class RecommendationEngine:
+    def __init__(self, ttl=None):
+        """Create an engine that recomputes at most once per `ttl` seconds"""
+        self.ttl = RECOMMENDATION_TTL if ttl is None else ttl
+        self._recommendations = None
+        self._version = None  # Data version the cached recommendations were computed from
+        self._expires = 0
+    
+    def get(self, version, compute):
+        """Cached recommendations, recomputed with compute() once expired or when the version changed"""
+        now = time.monotonic()
+        if self._recommendations is None or version != self._version or now >= self._expires:
+            self._recommendations = compute()
+            self._version = version
+            self._expires = now + self.ttl
+        return self._recommendations
+    
+    def invalidate(self):
+        """Recompute on the next request"""
+        self._recommendations = None
+    
+    def recommend(self, channels, model=None, moment=None):
+        """Rank the channels we don't farm yet, best first
+        
+        Candidates are tracked channels (channel_data["channels"]) without farming sessions,
+        then the popular channels. Farmed channels are only scored as the reference their
+        estimates come from. Ties are broken by how many tags a channel shares with the
+        farmed ones; popular channels we know nothing about all tie, and come in list order
+        as a plain fallback.
+        """
+        moment = moment or datetime.now()
+        names = list(dict.fromkeys(list(channels) + (model.channels if model else []) + POPULAR_CHANNELS))
+        farmed = {name for name, stats in channels.items() if stats.get("sessions")}
+        farmed.update(model.channels if model else [])
+        
+        if model:
+            rates, measured = model.rates_for(names, moment)
+        else:
+            rates, measured = np.zeros(len(names)), np.zeros(len(names), dtype=bool)
+        
+        uptime = np.zeros(len(names))
+        probed = np.zeros(len(names), dtype=bool)
+        tag_names = {}
+        tagged = []  # (row, tag column) pairs
+        for row, name in enumerate(names):
+            stats = channels.get(name)
+            if not stats:
+                continue
+            histogram = stats.get("uptime")
+            if histogram is not None and len(histogram):
+                uptime[row] = histogram.probability_live(moment)
+                probed[row] = True
+            for tag in stats.get("tags", []):
+                tagged.append((row, tag_names.setdefault(tag, len(tag_names))))
+        
+        tags = np.zeros((len(names), len(tag_names)), dtype=bool)
+        if tagged:
+            rows, columns = zip(*tagged)
+            tags[list(rows), list(columns)] = True
+        
+        estimated, source, scores = score_channels(rates, measured, uptime, probed, tags)
+        
+        # Tags shared with the farmed channels, for breaking ties
+        is_farmed = np.array([name in farmed for name in names], dtype=bool)
+        overlap = tags[:, tags[is_farmed].any(axis=0)].sum(axis=1)
+        
+        popular = set(POPULAR_CHANNELS)
+        recommendations = []
+        for i in np.lexsort((np.arange(len(names)), -overlap, -scores)):
+            if is_farmed[i]:
+                continue
+            if source[i] == 0:
+                reason = "Measured from your farming sessions"
+            elif source[i] == 1:
+                reason = "Estimated from your channels with the same tags"
+            elif names[i] in popular:
+                reason = "Popular streamer, not measured yet"
+            else:
+                reason = "Not measured yet"
+            
+            recommendations.append({
+                "channel": names[i],
+                "estimated_point_rate": int(round(estimated[i])),
+                "uptime": round(float(uptime[i]), 2) if probed[i] else None,
+                "score": round(float(scores[i]), 2),
+                "reason": reason
+            })
+        return recommendations
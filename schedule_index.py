@@ -0,0 +1,113 @@
+"""
+Schedule Index for the Twitch Auto-Farmer
+Compiles channel farming schedules into a minute-of-week index for constant-time lookups
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MINUTES_PER_DAY = 24 * 60
+SLOTS = 7 * MINUTES_PER_DAY  # Minutes in a week, Monday 00:00 first
+
+def _minutes(value):
+    """Parse "HH:MM" to minutes after midnight"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def compile_schedule(schedule):
+    """Turn a schedule dict into a boolean mask over the minutes of the week
+    
+    A schedule enables days by name and gives the daily window either as
+    "start"/"end" ("HH:MM", end exclusive) or as the inclusive "start_hour"/"end_hour".
+    A window that ends before it starts runs past midnight into the next day.
+    """
+    if "start" in schedule or "end" in schedule:
+        start = _minutes(schedule.get("start", "00:00"))
+        end = _minutes(schedule.get("end", "00:00"))
+    else:
+        start = schedule.get("start_hour", 0) * 60
+        end = (schedule.get("end_hour", 23) + 1) * 60
+    length = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+    
+    mask = np.zeros(SLOTS, dtype=bool)
+    window = np.arange(length)
+    for day, name in enumerate(DAYS):
+        if schedule.get(name, False):
+            mask[(day * MINUTES_PER_DAY + start + window) % SLOTS] = True
+    return mask
+
+def slot_of(moment):
+    """Minute-of-week slot of a datetime"""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+class ScheduleIndex:
+    def __init__(self, schedules):
+        """Compile {channel: schedule} into an index of the week's segments"""
+        self.channels = sorted(schedules)
+        matrix = np.zeros((len(self.channels), SLOTS), dtype=bool)
+        for row, channel in enumerate(self.channels):
+            matrix[row] = compile_schedule(schedules[channel])
+        
+        # A channel starts or stops at each slot that differs from the one before it (wrapping round)
+        edges = matrix != np.roll(matrix, 1, axis=1)
+        self._masks = dict(zip(self.channels, matrix))
+        self._edges = {channel: np.flatnonzero(row) for channel, row in zip(self.channels, edges)}
+        
+        # The week splits into segments where the set of scheduled channels stays the same
+        changes = np.flatnonzero(edges.any(axis=0))
+        self._starts = changes if len(changes) else np.array([0])
+        
+        # Inverted index: segment -> channels scheduled during it
+        names = np.array(self.channels, dtype=object)
+        self._segments = [frozenset(names[matrix[:, slot]]) for slot in self._starts]
+    
+    def _segment(self, slot):
+        """Index of the segment containing a slot (-1 is the last one, which wraps past Monday 00:00)"""
+        return int(np.searchsorted(self._starts, slot, side="right")) - 1
+    
+    def channels_at(self, moment=None):
+        """Channels scheduled at a moment (now by default)"""
+        return sorted(self._segments[self._segment(slot_of(moment or datetime.now()))])
+    
+    def is_scheduled(self, channel, moment=None):
+        """Check whether one channel is scheduled at a moment (now by default)"""
+        mask = self._masks.get(channel)
+        return mask is not None and bool(mask[slot_of(moment or datetime.now())])
+    
+    def next_change(self, channel, moment=None):
+        """The next time one channel starts or stops after a moment
+        
+        Returns (when, scheduled) with whether the channel is scheduled from then
+        on, or None if its schedule never changes.
+        """
+        edges = self._edges.get(channel)
+        if edges is None or not len(edges):
+            return None
+        
+        moment = moment or datetime.now()
+        slot = slot_of(moment)
+        following = edges[int(np.searchsorted(edges, slot, side="right")) % len(edges)]
+        minutes = (int(following) - slot) % SLOTS or SLOTS
+        when = moment.replace(second=0, microsecond=0) + timedelta(minutes=minutes)
+        return when, bool(self._masks[channel][following])
+    
+    def next_transition(self, moment=None):
+        """The next time the scheduled channels change after a moment
+        
+        Returns (when, started, stopped) with the sets of channels starting and
+        stopping then, or None if the schedule never changes.
+        """
+        if len(self._starts) < 2:
+            return None
+        
+        moment = moment or datetime.now()
+        slot = slot_of(moment)
+        current = self._segment(slot) % len(self._starts)
+        following = (current + 1) % len(self._starts)
+        
+        minutes = (int(self._starts[following]) - slot) % SLOTS
+        when = moment.replace(second=0, microsecond=0) + timedelta(minutes=minutes)
+        before, after = self._segments[current], self._segments[following]
+        return when, after - before, before - after
@@ -0,0 +1,258 @@
+"""
+Schedule Runner for the Twitch Auto-Farmer
+Starts and stops farming at schedule boundaries, sleeping on a timer heap in between
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+from farming_supervisor import ACTIVE_STATES
+
+# Longest sleep between checks, so wall-clock jumps (DST, NTP) and schedule
+# changes made by other processes are still noticed
+MAX_SLEEP = 60
+
+# Seconds before a channel that failed to start is tried again
+RETRY_DELAY = 300
+
+class ScheduleRunner:
+    def __init__(self, channel_manager, on_start, on_stop, query=None, is_failed=None):
+        """Create a runner; on_start(channel) returns True if farming started, on_stop(channel) stops it
+        
+        With a channel query (e.g. "live AND NOT tag:late") a scheduled channel is only
+        started while it matches, checked again every RETRY_DELAY seconds. If farming
+        starts in the background, is_failed(channel) tells whether a start that
+        on_start() accepted failed later; such channels are retried like the others.
+        """
+        self.channel_manager = channel_manager
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.query = query
+        self.is_failed = is_failed
+        
+        self.active = set()  # Channels being farmed
+        self._desired = {}  # Channel -> whether it should be farmed now
+        self._timers = []  # Heap of (timestamp, seq, channel, retry)
+        self._seq = itertools.count()  # Tie-breaker so the heap never compares channels
+        self._index = None  # Schedule index the timers were computed from
+        self._channel_locks = {}
+        
+        self._wakeup = threading.Condition()
+        self._changed = True
+        self._running = False
+        self._thread = None
+        
+        channel_manager.add_schedule_listener(self.reschedule)
+    
+    def start(self):
+        """Start following the schedules in a background thread"""
+        with self._wakeup:
+            if self._running:
+                return
+            self._running = True
+            self._changed = True
+        
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop following the schedules and stop every channel it started"""
+        with self._wakeup:
+            self._running = False
+            self._desired = {channel: False for channel in self.active}
+            self._wakeup.notify()
+        
+        for channel in list(self.active):
+            self._transition(channel)
+    
+    @property
+    def running(self):
+        return self._running
+    
+    def reschedule(self):
+        """Recompute every timer; called when a schedule changes"""
+        with self._wakeup:
+            self._changed = True
+            self._wakeup.notify()
+    
+    def next_wakeup(self):
+        """When the next timer fires, or None"""
+        with self._wakeup:
+            return datetime.fromtimestamp(self._timers[0][0]) if self._timers else None
+    
+    def _push(self, channel, when, retry=False):
+        """Add a timer for a channel (call with the condition held)
+        
+        A retry timer only re-checks the channel; the boundary timers already cover its schedule.
+        """
+        heapq.heappush(self._timers, (when.timestamp(), next(self._seq), channel, retry))
+    
+    def _rebuild(self):
+        """Recompute the timers and desired states from the schedules (call with the condition held)"""
+        self._changed = False
+        self._index = self.channel_manager.get_schedule_index()
+        self._timers = []
+        
+        now = datetime.now()
+        desired = {channel: False for channel in self.active}
+        for channel in self._index.channels:
+            desired[channel] = self._index.is_scheduled(channel, now)
+            change = self._index.next_change(channel, now)
+            if change:
+                self._push(channel, change[0])
+        
+        due = [channel for channel, want in desired.items() if want != (channel in self.active)]
+        self._desired = desired
+        return due
+    
+    def _run(self):
+        """Sleep until the next timer, then apply the transitions that are due"""
+        while True:
+            self._reconcile()
+            with self._wakeup:
+                if not self._running:
+                    return
+                
+                # Pick up schedules saved by other processes
+                self.channel_manager.store.refresh()
+                if self._changed or self.channel_manager.get_schedule_index() is not self._index:
+                    due = self._rebuild()
+                else:
+                    due = []
+                    now = time.time()
+                    while self._timers and self._timers[0][0] <= now:
+                        timestamp, _, channel, retry = heapq.heappop(self._timers)
+                        when = datetime.fromtimestamp(timestamp)
+                        
+                        self._desired[channel] = self._index.is_scheduled(channel, when)
+                        due.append(channel)
+                        
+                        # Next boundary after this one
+                        change = None if retry else self._index.next_change(channel, when)
+                        if change:
+                            self._push(channel, change[0])
+                
+                if not due:
+                    delay = self._timers[0][0] - time.time() if self._timers else MAX_SLEEP
+                    self._wakeup.wait(max(0, min(delay, MAX_SLEEP)))
+                    continue
+            
+            # Starting a bot takes a while, so each channel transitions on its own thread
+            for channel in due:
+                threading.Thread(target=self._transition, args=(channel,), daemon=True).start()
+    
+    def _matches(self, channel):
+        """Check whether a channel matches the runner's query, if it has one"""
+        if not self.query:
+            return True
+        try:
+            return channel in self.channel_manager.query_channels(self.query)
+        except Exception as e:
+            print(f"Error checking schedule query: {str(e)}")
+            return False
+    
+    def _retry_later(self, channel):
+        """Check a channel again after RETRY_DELAY, if it is still scheduled then"""
+        with self._wakeup:
+            self._push(channel, datetime.now() + timedelta(seconds=RETRY_DELAY), retry=True)
+            self._wakeup.notify()
+    
+    def _reconcile(self):
+        """Forget channels whose start failed after on_start() accepted it, and retry them"""
+        if self.is_failed is None:
+            return
+        for channel in list(self.active):
+            with self._wakeup:
+                lock = self._channel_locks.setdefault(channel, threading.Lock())
+            with lock:
+                if channel in self.active and self.is_failed(channel):
+                    self.active.discard(channel)
+                    print(f"Scheduled farming on {channel} failed to start, retrying in {RETRY_DELAY} seconds")
+                    self._retry_later(channel)
+    
+    def _transition(self, channel):
+        """Start or stop a channel to match its desired state"""
+        with self._wakeup:
+            lock = self._channel_locks.setdefault(channel, threading.Lock())
+        
+        with lock:
+            want = self._desired.get(channel, False)
+            if want and channel not in self.active:
+                if self._matches(channel) and self.on_start(channel):
+                    self.active.add(channel)
+                else:
+                    self._retry_later(channel)
+            elif not want and channel in self.active:
+                self.on_stop(channel)
+                self.active.discard(channel)
+
+class ScheduledFarming:
+    def __init__(self, username, password, supervisor):
+        """Farm channels for the schedule runner through the app's farming supervisor
+        
+        The supervisor runs one bot at a time, so a scheduled channel waits (and is
+        retried) while another channel is being farmed. Its listeners record the
+        sessions in the shared data manager and update the channel stats.
+        """
+        self.username = username
+        self.password = password
+        self.supervisor = supervisor
+    
+    def start(self, channel):
+        """Ask the worker to start farming a channel; returns False while it farms another one"""
+        status = self.supervisor.snapshot()
+        if status["state"] in ACTIVE_STATES and status["channel"] != channel:
+            print(f"Scheduled farming on {channel} waits for {status['channel']}")
+            return False
+        
+        if status["state"] in ACTIVE_STATES or self.supervisor.wanted_channel == channel:
+            return True  # Already farming (or starting) it
+        
+        self.supervisor.start(self.username, self.password, channel)
+        print(f"Scheduled farming started on {channel}")
+        return True
+    
+    def failed(self, channel):
+        """Whether the worker gave up on a channel that start() asked for (e.g. a failed login)"""
+        if self.supervisor.wanted_channel == channel:
+            return False  # Still wanted; a crashed worker is restarted by the supervisor
+        status = self.supervisor.snapshot()
+        return status["state"] == "error" and status["channel"] == channel
+    
+    def stop(self, channel):
+        """Stop farming a channel, unless the worker has moved on to another one"""
+        status = self.supervisor.snapshot()
+        if status["state"] not in ACTIVE_STATES or status["channel"] != channel:
+            return
+        
+        self.supervisor.stop()
+        print(f"Scheduled farming stopped on {channel}. Earned {status['points_gained']} points.")
+
+# The runner outlives Streamlit reruns, one per process
+_runner = None
+
+def start_schedule_runner(username, password, channel_manager, supervisor, query=None):
+    """Start following saved schedules with the given Twitch account, farming through `supervisor`"""
+    global _runner
+    if _runner is None:
+        farming = ScheduledFarming(username, password, supervisor)
+        _runner = ScheduleRunner(channel_manager, farming.start, farming.stop, query=query,
+                                 is_failed=farming.failed)
+    _runner.query = query
+    _runner.start()
+    return _runner
+
+def stop_schedule_runner():
+    """Stop following schedules and stop scheduled farming"""
+    global _runner
+    if _runner is not None:
+        _runner.stop()
+        _runner.channel_manager.remove_schedule_listener(_runner.reschedule)
+        _runner = None
+
+def get_schedule_runner():
+    """The running schedule runner, or None"""
+    return _runner
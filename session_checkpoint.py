@@ -0,0 +1,218 @@
+"""
+Session Checkpoint for the Twitch Auto-Farmer
+Periodically records the running session in a small fixed-size file so it survives restarts
+"""
+
+import fcntl
+import os
+import random
+import struct
+import threading
+import zlib
+from datetime import datetime
+
+from session_table import from_ns, to_ns
+
+# Seconds between checkpoints of the running session
+CHECKPOINT_INTERVAL = float(os.environ.get("SESSION_CHECKPOINT_INTERVAL", "30"))
+
+# A checkpoint not refreshed for this many intervals belongs to a dead process
+STALE_INTERVALS = 3
+
+# Sessions that can run at once against one data file (one slot each)
+SLOT_COUNT = 16
+
+# magic, active, pid, process token, session id, start, checkpoint time, elapsed minutes, points, channel
+RECORD = struct.Struct("<4sB3xiQqqqdq64s")
+SLOT_SIZE = RECORD.size + 4  # Record followed by its CRC32
+MAGIC = b"TWCP"
+
+# Identifies this process, so a reused PID is not mistaken for a live session
+PROCESS_TOKEN = random.getrandbits(64)
+
+def _pid_alive(pid):
+    """Check whether a process with this PID exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class SessionCheckpoint:
+    def __init__(self, path, interval=None):
+        """Open the checkpoint file for a data file"""
+        self.path = path
+        self.interval = CHECKPOINT_INTERVAL if interval is None else interval
+        self.slot = None
+        self.session = None
+        self.points = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _open(self):
+        """Open the file, creating it with empty slots if needed"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < SLOT_SIZE * SLOT_COUNT:
+            os.ftruncate(fd, SLOT_SIZE * SLOT_COUNT)
+        return fd
+    
+    def _read_slot(self, fd, slot):
+        """Read and validate one slot; returns None if empty or torn"""
+        raw = os.pread(fd, SLOT_SIZE, slot * SLOT_SIZE)
+        if len(raw) < SLOT_SIZE:
+            return None
+        
+        body, (crc,) = raw[:RECORD.size], struct.unpack("<I", raw[RECORD.size:])
+        if zlib.crc32(body) != crc:
+            return None
+        
+        magic, active, pid, token, session_id, start, checkpoint, elapsed, points, channel = RECORD.unpack(body)
+        if magic != MAGIC or not active:
+            return None
+        
+        return {
+            "slot": slot,
+            "pid": pid,
+            "token": token,
+            "id": session_id,
+            "channel": channel.rstrip(b"\0").decode("utf-8", "replace"),
+            "start_time": from_ns(start),
+            "checkpoint_time": from_ns(checkpoint),
+            "checkpoint_ns": checkpoint,
+            "duration": elapsed,
+            "points": points
+        }
+    
+    def _write_slot(self, fd, slot, record):
+        """Overwrite one slot in place"""
+        os.pwrite(fd, record + struct.pack("<I", zlib.crc32(record)), slot * SLOT_SIZE)
+        os.fdatasync(fd)
+    
+    def _is_orphan(self, record):
+        """Check whether a slot's session belongs to a process that is gone"""
+        if record["token"] == PROCESS_TOKEN:
+            return False  # Another manager in this process
+        if record["pid"] == os.getpid():
+            return True  # An earlier process that had our PID
+        
+        age = (to_ns(datetime.now().isoformat()) - record["checkpoint_ns"]) / 1e9
+        return not _pid_alive(record["pid"]) or age > self.interval * STALE_INTERVALS
+    
+    def recover(self):
+        """Claim and clear the checkpoints of sessions whose process died
+        
+        Returns the orphaned sessions (with duration and points at their last
+        checkpoint) so the caller can close them.
+        """
+        if not os.path.exists(self.path):
+            return []
+        
+        orphans = []
+        try:
+            fd = self._open()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                for slot in range(SLOT_COUNT):
+                    record = self._read_slot(fd, slot)
+                    if record and self._is_orphan(record):
+                        self._write_slot(fd, slot, RECORD.pack(MAGIC, 0, 0, 0, 0, 0, 0, 0, 0, b""))
+                        orphans.append(record)
+            finally:
+                os.close(fd)
+        except Exception as e:
+            print(f"Error recovering session checkpoints: {str(e)}")
+        
+        return orphans
+    
+    def start(self, session):
+        """Start checkpointing a running session"""
+        with self._lock:
+            self.session = dict(session)
+            self.points = session.get("points", 0)
+        
+        try:
+            fd = self._open()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # Take the first free slot (or the one we already hold)
+                self.slot = None
+                for slot in range(SLOT_COUNT):
+                    record = self._read_slot(fd, slot)
+                    if record is None or (record["token"] == PROCESS_TOKEN and record["id"] == session["id"]):
+                        self.slot = slot
+                        break
+                if self.slot is None:
+                    print("Warning: No free session checkpoint slot")
+                    return
+                
+                # Claim the slot before releasing the lock, so no other process takes it too
+                with self._lock:
+                    self._write_slot(fd, self.slot, self._record())
+            finally:
+                os.close(fd)
+        except Exception as e:
+            print(f"Error starting session checkpoint: {str(e)}")
+            return
+        
+        self._stop.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    
+    def update(self, points):
+        """Record the points earned so far; written at the next checkpoint"""
+        with self._lock:
+            self.points = points
+    
+    def _run(self):
+        """Write a checkpoint every interval until the session stops"""
+        while not self._stop.wait(self.interval):
+            self.write()
+    
+    def _record(self):
+        """Pack the running session's checkpoint record (call with self._lock held)"""
+        now = datetime.now()
+        start = datetime.fromisoformat(self.session["start_time"])
+        return RECORD.pack(
+            MAGIC, 1, os.getpid(), PROCESS_TOKEN, self.session["id"],
+            to_ns(self.session["start_time"]), to_ns(now.isoformat()),
+            (now - start).total_seconds() / 60, self.points,
+            self.session["channel"].encode("utf-8")[:64]
+        )
+    
+    def write(self):
+        """Write the running session's checkpoint now"""
+        with self._lock:
+            if self.session is None or self.slot is None:
+                return
+            
+            record = self._record()
+            
+            try:
+                fd = self._open()
+                try:
+                    self._write_slot(fd, self.slot, record)
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f"Error writing session checkpoint: {str(e)}")
+    
+    def clear(self):
+        """Stop checkpointing and free the slot once the session has been saved"""
+        self._stop.set()
+        with self._lock:
+            slot, self.slot, self.session = self.slot, None, None
+            if slot is None:
+                return
+            
+            try:
+                fd = self._open()
+                try:
+                    self._write_slot(fd, slot, RECORD.pack(MAGIC, 0, 0, 0, 0, 0, 0, 0, 0, b""))
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f"Error clearing session checkpoint: {str(e)}")
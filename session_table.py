@@ -0,0 +1,350 @@
+"""
+Session Table for the Twitch Auto-Farmer
+Holds farming sessions as typed NumPy columns with zero-copy pandas export
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Timestamps are stored as int64 nanoseconds of the (naive, local) wall-clock time
+NAT = np.iinfo(np.int64).min
+EPOCH = datetime(1970, 1, 1)
+
+COLUMNS = {
+    "id": np.int32,
+    "channel": np.int32,  # Index into SessionTable.channels
+    "start_time": np.int64,
+    "end_time": np.int64,
+    "duration": np.float32,  # in minutes
+    "points": np.int32
+}
+
+def to_ns(timestamp):
+    """Convert an ISO timestamp string (or None) to int64 nanoseconds"""
+    if not timestamp:
+        return NAT
+    return int(np.datetime64(timestamp, "ns").astype(np.int64))
+
+def as_ns(value):
+    """Convert a datetime, ISO string or int64 nanoseconds to int64 nanoseconds"""
+    if isinstance(value, datetime):
+        return to_ns(value.isoformat())
+    if isinstance(value, str):
+        return to_ns(value)
+    return int(value)
+
+def from_ns(value):
+    """Convert int64 nanoseconds back to an ISO timestamp string (or None)"""
+    if value == NAT:
+        return None
+    return (EPOCH + timedelta(microseconds=int(value) // 1000)).isoformat()
+
+class SortedIndex:
+    def __init__(self, capacity=1024):
+        """Row positions kept sorted by an int64 key, for binary search"""
+        self.keys = np.empty(capacity, dtype=np.int64)
+        self.positions = np.empty(capacity, dtype=np.int32)
+        self.size = 0
+    
+    def add(self, key, position):
+        """Add a row; O(1) when keys arrive in order, which is the normal case"""
+        if self.size == len(self.keys):
+            self.keys = np.concatenate([self.keys, np.empty(self.size, dtype=np.int64)])
+            self.positions = np.concatenate([self.positions, np.empty(self.size, dtype=np.int32)])
+        
+        n = self.size
+        if n and key < self.keys[n - 1]:
+            # Out-of-order key (overlapping sessions), shift the tail up by one
+            i = int(np.searchsorted(self.keys[:n], key, side="right"))
+            self.keys[i + 1:n + 1] = self.keys[i:n].copy()
+            self.positions[i + 1:n + 1] = self.positions[i:n].copy()
+        else:
+            i = n
+        
+        self.keys[i] = key
+        self.positions[i] = position
+        self.size += 1
+    
+    def between(self, start, end):
+        """Positions with start <= key < end, in key order"""
+        keys = self.keys[:self.size]
+        lo = np.searchsorted(keys, start, side="left") if start is not None else 0
+        hi = np.searchsorted(keys, end, side="left") if end is not None else self.size
+        return self.positions[lo:hi]
+    
+    def newest(self, offset, limit):
+        """Positions for one page, newest key first"""
+        hi = max(self.size - offset, 0)
+        lo = max(hi - limit, 0)
+        return self.positions[lo:hi][::-1]
+
+class SessionTable:
+    def __init__(self, capacity=1024):
+        """Create an empty table"""
+        self.channels = []  # Dictionary of channel names; codes index into it
+        self._channel_codes = {}
+        self._size = 0
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        
+        # Start time indexes, overall and per channel code
+        self._time_index = SortedIndex()
+        self._channel_index = {}
+    
+    def __len__(self):
+        return self._size
+    
+    def channel_code(self, channel):
+        """Get the dictionary code for a channel, adding it if needed"""
+        code = self._channel_codes.get(channel)
+        if code is None:
+            code = len(self.channels)
+            self.channels.append(channel)
+            self._channel_codes[channel] = code
+        return code
+    
+    def _reserve(self, count):
+        """Grow the column arrays (by doubling) to fit `count` more rows"""
+        needed = self._size + count
+        capacity = len(self._columns["id"])
+        if needed <= capacity:
+            return
+        
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+    
+    def append(self, session, channel=None):
+        """Append a session dict (ISO timestamps) in amortized O(1)"""
+        self._reserve(1)
+        i = self._size
+        columns = self._columns
+        columns["id"][i] = session.get("id", i + 1)
+        columns["channel"][i] = self.channel_code(channel or session["channel"])
+        columns["start_time"][i] = to_ns(session["start_time"])
+        columns["end_time"][i] = to_ns(session.get("end_time"))
+        columns["duration"][i] = session["duration"]
+        columns["points"][i] = session["points"]
+        self._size += 1
+        self._index_row(i)
+    
+    def _index_row(self, i):
+        """Add a row to the start time indexes"""
+        start = self._columns["start_time"][i]
+        code = self._columns["channel"][i]
+        self._time_index.add(start, i)
+        if code not in self._channel_index:
+            self._channel_index[code] = SortedIndex(capacity=64)
+        self._channel_index[code].add(start, i)
+    
+    def _rebuild_index(self):
+        """Build the start time indexes in bulk after loading"""
+        n = self._size
+        starts = self._columns["start_time"][:n]
+        codes = self._columns["channel"][:n]
+        order = np.argsort(starts, kind="stable").astype(np.int32)
+        
+        self._time_index = SortedIndex(capacity=max(1024, n))
+        self._time_index.keys[:n] = starts[order]
+        self._time_index.positions[:n] = order
+        self._time_index.size = n
+        
+        # Group the time-ordered rows by channel, keeping time order within each channel
+        by_channel = order[np.argsort(codes[order], kind="stable")]
+        bounds = np.searchsorted(codes[by_channel], np.arange(len(self.channels) + 1))
+        
+        self._channel_index = {}
+        for code in range(len(self.channels)):
+            channel_order = by_channel[bounds[code]:bounds[code + 1]]
+            index = SortedIndex(capacity=max(64, len(channel_order)))
+            index.keys[:len(channel_order)] = starts[channel_order]
+            index.positions[:len(channel_order)] = channel_order
+            index.size = len(channel_order)
+            self._channel_index[code] = index
+    
+    def _index_for(self, channel):
+        """Get the start time index for all sessions or for one channel"""
+        if channel is None:
+            return self._time_index
+        code = self._channel_codes.get(channel)
+        if code is None or code not in self._channel_index:
+            return SortedIndex(capacity=1)
+        return self._channel_index[code]
+    
+    def between(self, start=None, end=None, channel=None):
+        """Row positions of sessions starting in [start, end), oldest first"""
+        return self._index_for(channel).between(
+            as_ns(start) if start is not None else None,
+            as_ns(end) if end is not None else None
+        )
+    
+    def count(self, channel=None):
+        """Number of sessions overall or for one channel"""
+        return self._index_for(channel).size
+    
+    def extend(self, sessions):
+        """Append many session dicts"""
+        self._reserve(len(sessions))
+        for session in sessions:
+            self.append(session)
+    
+    def column(self, name):
+        """Get a read-only view of a column (no copy)"""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+    
+    def row(self, i):
+        """Get one session as a dict with ISO timestamps"""
+        columns = self._columns
+        return {
+            "id": int(columns["id"][i]),
+            "channel": self.channels[columns["channel"][i]],
+            "start_time": from_ns(columns["start_time"][i]),
+            "end_time": from_ns(columns["end_time"][i]),
+            "duration": round(float(columns["duration"][i]), 2),
+            "points": int(columns["points"][i])
+        }
+    
+    def newest(self, offset=0, limit=50, channel=None):
+        """Row positions of `limit` sessions after skipping `offset`, newest first"""
+        return self._index_for(channel).newest(offset, limit)
+    
+    def months(self):
+        """Start month of every row as datetime64[M]"""
+        return self._columns["start_time"][:self._size].view("datetime64[ns]").astype("datetime64[M]")
+    
+    def channel_counts(self):
+        """Number of rows per channel name"""
+        counts = np.bincount(self._columns["channel"][:self._size], minlength=len(self.channels))
+        return {channel: int(count) for channel, count in zip(self.channels, counts) if count}
+    
+    def take(self, positions):
+        """Get a new table holding just the given rows"""
+        positions = np.asarray(positions, dtype=np.int64)
+        n = len(positions)
+        table = SessionTable(capacity=max(1024, n))
+        table.channels = list(self.channels)
+        table._channel_codes = dict(self._channel_codes)
+        for name in COLUMNS:
+            table._columns[name][:n] = self._columns[name][positions]
+        table._size = n
+        table._rebuild_index()
+        return table
+    
+    @classmethod
+    def concat(cls, tables):
+        """Combine several tables into one, merging their channel dictionaries"""
+        n = sum(len(t) for t in tables)
+        table = cls(capacity=max(1024, n))
+        offset = 0
+        for part in tables:
+            size = len(part)
+            if not size:
+                continue
+            # Translate the part's channel codes into the combined dictionary
+            recode = np.asarray([table.channel_code(c) for c in part.channels], dtype=np.int32)
+            for name in COLUMNS:
+                table._columns[name][offset:offset + size] = part._columns[name][:size]
+            table._columns["channel"][offset:offset + size] = recode[part._columns["channel"][:size]]
+            offset += size
+        table._size = n
+        table._rebuild_index()
+        return table
+    
+    def to_dicts(self, positions=None):
+        """Get sessions (all, or the given row positions) as a list of dicts"""
+        if positions is None:
+            positions = range(self._size)
+        return [self.row(i) for i in positions]
+    
+    def frame(self, positions=None):
+        """Build a DataFrame over the columns without copying or re-parsing them
+        
+        Passing row positions selects a subset, which copies just those rows.
+        """
+        if positions is None:
+            columns = {name: column[:self._size] for name, column in self._columns.items()}
+        else:
+            columns = {name: column[positions] for name, column in self._columns.items()}
+        
+        return pd.DataFrame({
+            "id": columns["id"],
+            # Categorical codes are re-packed by pandas into the smallest integer type
+            "channel": pd.Categorical.from_codes(columns["channel"], categories=self.channels)
+                       if self.channels else pd.Categorical([]),
+            "start_time": columns["start_time"].view("datetime64[ns]"),
+            "end_time": columns["end_time"].view("datetime64[ns]"),
+            "duration": columns["duration"],
+            "points": columns["points"]
+        }, copy=False)
+    
+    def to_json(self):
+        """Get a compact columnar representation for saving"""
+        n = self._size
+        data = {name: self._columns[name][:n].tolist() for name in COLUMNS if name != "duration"}
+        data["duration"] = np.round(self._columns["duration"][:n].astype(np.float64), 2).tolist()
+        data["channels"] = list(self.channels)
+        return data
+    
+    def to_arrays(self):
+        """Like to_json(), but with the columns as NumPy arrays for binary codecs"""
+        n = self._size
+        data = {name: self._columns[name][:n] for name in COLUMNS}
+        data["channels"] = list(self.channels)
+        return data
+    
+    @classmethod
+    def from_json(cls, data):
+        """Rebuild a table from to_json() or to_arrays() output"""
+        table = cls(capacity=max(1024, len(data["id"])))
+        for channel in data["channels"]:
+            table.channel_code(channel)
+        n = len(data["id"])
+        for name, dtype in COLUMNS.items():
+            table._columns[name][:n] = np.asarray(data[name], dtype=dtype)
+        table._size = n
+        table._rebuild_index()
+        return table
+    
+    @classmethod
+    def from_columns(cls, ids, channels, start_times, end_times, durations, points):
+        """Build a table from parallel lists, parsing ISO timestamps in bulk"""
+        n = len(ids)
+        table = cls(capacity=max(1024, n))
+        columns = table._columns
+        columns["id"][:n] = np.asarray(ids, dtype=np.int32)
+        columns["channel"][:n] = np.asarray([table.channel_code(c) for c in channels], dtype=np.int32)
+        columns["start_time"][:n] = np.asarray(start_times, dtype="datetime64[ns]").view(np.int64)
+        columns["end_time"][:n] = np.asarray(end_times, dtype="datetime64[ns]").view(np.int64)
+        columns["duration"][:n] = np.asarray(durations, dtype=np.float32)
+        columns["points"][:n] = np.asarray(points, dtype=np.int32)
+        table._size = n
+        table._rebuild_index()
+        return table
+    
+    @classmethod
+    def from_dicts(cls, sessions):
+        """Build a table from a list of session dicts"""
+        return cls.from_columns(
+            [s.get("id", i + 1) for i, s in enumerate(sessions)],
+            [s["channel"] for s in sessions],
+            [s["start_time"] for s in sessions],
+            [s.get("end_time") for s in sessions],
+            [s["duration"] for s in sessions],
+            [s["points"] for s in sessions]
+        )
+    
+    def copy(self):
+        """Get an independent copy of the columns for saving (indexes are not copied)"""
+        table = SessionTable(capacity=max(1024, self._size))
+        table.channels = list(self.channels)
+        table._channel_codes = dict(self._channel_codes)
+        for name in COLUMNS:
+            table._columns[name][:self._size] = self._columns[name][:self._size]
+        table._size = self._size
+        return table
@@ -0,0 +1,428 @@
+"""
+SQLite Data Manager for the Twitch Auto-Farmer
+Stores farming sessions in an indexed SQLite database behind the DataManager API
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from event_bus import PointsChanged
+from point_rate_model import PointRateModel
+from session_checkpoint import SessionCheckpoint
+from session_table import SessionTable
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    channel TEXT PRIMARY KEY,
+    watchtime REAL NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    duration REAL NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_channel_start ON sessions (channel, start_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_end ON sessions (end_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (start_time);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    date TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    minutes REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, channel)
+);
+CREATE TABLE IF NOT EXISTS hourly_rollups (
+    hour INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    minutes REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, channel)
+);
+"""
+
+# Rebuild the rollup tables from the sessions table
+BACKFILL_ROLLUPS = """
+DELETE FROM daily_rollups;
+DELETE FROM hourly_rollups;
+INSERT INTO daily_rollups (date, channel, points, minutes, sessions)
+    SELECT substr(end_time, 1, 10), channel, SUM(points), SUM(duration), COUNT(*)
+    FROM sessions WHERE end_time IS NOT NULL GROUP BY 1, 2;
+INSERT INTO hourly_rollups (hour, channel, points, minutes, sessions)
+    SELECT CAST(substr(end_time, 12, 2) AS INTEGER), channel, SUM(points), SUM(duration), COUNT(*)
+    FROM sessions WHERE end_time IS NOT NULL GROUP BY 1, 2;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO {table} ({key}, channel, points, minutes, sessions) VALUES (?, ?, ?, ?, 1)
+ON CONFLICT ({key}, channel) DO UPDATE SET
+    points = points + excluded.points,
+    minutes = minutes + excluded.minutes,
+    sessions = sessions + 1
+"""
+
+class SQLiteDataManager:
+    def __init__(self, db_file=None, import_from=None, retention_months=None):
+        """Open (and create if needed) the SQLite database"""
+        if db_file is None:
+            db_file = os.environ.get("DATA_FILE_PATH", "farming_data.db")
+        if db_file.startswith("sqlite:///"):
+            db_file = db_file[len("sqlite:///"):]
+        
+        # Create data directory if it doesn't exist
+        data_dir = os.path.dirname(db_file)
+        if data_dir and not os.path.exists(data_dir):
+            try:
+                os.makedirs(data_dir)
+            except Exception as e:
+                print(f"Warning: Could not create data directory: {str(e)}")
+        
+        self.data_file = db_file
+        self.current_session = None
+        self.checkpoint = SessionCheckpoint(f"{db_file}.checkpoint")
+        self._lock = threading.RLock()
+        self._point_rate_model = PointRateModel()
+        self._point_rate_id = 0  # Last session id folded into the point-rate model
+        
+        is_new = not os.path.exists(db_file)
+        # WAL lets the web and worker processes read while the other writes;
+        # writers wait on each other for up to the timeout instead of failing
+        self.conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        
+        # Databases created before rollups existed are rolled up once here
+        if self.has_data() and not self._query("SELECT EXISTS (SELECT 1 FROM daily_rollups)")[0][0]:
+            with self._lock, self.conn:
+                self.conn.executescript(BACKFILL_ROLLUPS)
+        
+        if retention_months is None:
+            retention_months = int(os.environ.get("DATA_RETENTION_MONTHS", "0"))
+        self.retention_months = retention_months
+        
+        # One-shot import of an existing JSON data file into a fresh database
+        if is_new and import_from and (os.path.exists(import_from) or
+                                       os.path.exists(f"{import_from}.journal")):
+            self.import_json(import_from)
+        
+        self.apply_retention()
+        
+        # Close sessions left running by a process that died
+        self.recover_sessions()
+    
+    def apply_retention(self):
+        """Delete sessions older than the retention window; rollups and channel totals are kept"""
+        if not self.retention_months:
+            return 0
+        
+        # First day of the oldest month that is kept
+        now = datetime.now()
+        months = now.year * 12 + now.month - 1 - self.retention_months
+        cutoff = datetime(months // 12, months % 12 + 1, 1).isoformat()
+        
+        with self._lock, self.conn:
+            return self.conn.execute("DELETE FROM sessions WHERE start_time < ?", (cutoff,)).rowcount
+    
+    def import_json(self, json_file, force=False):
+        """Import sessions and channels from a farming_data.json file
+
+        Returns the number of sessions imported, or None if the database already has
+        sessions and `force` is not given (importing the same file twice would
+        duplicate every session).
+        """
+        if self.has_data() and not force:
+            print(f"Not importing {json_file}: {self.data_file} already has sessions (use --force)")
+            return None
+        
+        # Load through DataManager so uncompacted journal entries and archived months are
+        # included; read-only, so the source files are left exactly as they are
+        from data_manager import DataManager
+        json_data = DataManager(json_file, read_only=True)
+        data = json_data.data
+        
+        sessions = json_data.get_all_sessions()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO channels (channel, watchtime, points, sessions) "
+                "VALUES (?, ?, ?, ?)",
+                [(channel, stats["watchtime"], stats["points"], stats["sessions"])
+                 for channel, stats in data.get("channels", {}).items()]
+            )
+            self.conn.executemany(
+                "INSERT INTO sessions (channel, start_time, end_time, duration, points) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(s["channel"], s["start_time"], s["end_time"], s["duration"], s["points"])
+                 for s in sessions]
+            )
+            self.conn.executescript(BACKFILL_ROLLUPS)
+        
+        print(f"Imported {len(sessions)} sessions from {json_file}")
+        return len(sessions)
+    
+    def start_session(self, channel):
+        """Start a new farming session."""
+        self.current_session = {
+            "id": self.get_total_sessions() + 1,
+            "channel": channel,
+            "start_time": datetime.now().isoformat(),
+            "end_time": None,
+            "duration": 0,  # in minutes
+            "points": 0
+        }
+        
+        try:
+            with self._lock, self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO channels (channel) VALUES (?)", (channel,))
+        except Exception as e:
+            print(f"Error saving data: {str(e)}")
+        
+        self.checkpoint.start(self.current_session)
+    
+    def update_session(self, points):
+        """Record the points earned so far in the current session for the next checkpoint."""
+        if self.current_session:
+            self.current_session["points"] = points
+            self.checkpoint.update(points)
+    
+    def subscribe(self, bus):
+        """Keep the current session's points up to date from a bot's events."""
+        bus.subscribe(PointsChanged, self._on_points_changed)
+    
+    def _on_points_changed(self, event):
+        """Event handler: record the session's points if they belong to the current session"""
+        if self.current_session and self.current_session["channel"] == event.channel:
+            self.update_session(event.session_points)
+    
+    def end_session(self, channel, duration, points, end_time=None):
+        """End the current farming session and update statistics."""
+        if not self.current_session:
+            return
+        
+        # Update current session
+        self.current_session["end_time"] = end_time or datetime.now().isoformat()
+        self.current_session["duration"] = round(duration, 2)
+        self.current_session["points"] = points
+        
+        try:
+            with self._lock, self.conn:
+                # Channel aggregates are kept in step so totals never scan the sessions table
+                self.conn.execute("INSERT OR IGNORE INTO channels (channel) VALUES (?)", (channel,))
+                self.conn.execute(
+                    "UPDATE channels SET watchtime = watchtime + ?, points = points + ?, "
+                    "sessions = sessions + 1 WHERE channel = ?",
+                    (duration, points, channel)
+                )
+                cursor = self.conn.execute(
+                    "INSERT INTO sessions (channel, start_time, end_time, duration, points) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (channel, self.current_session["start_time"], self.current_session["end_time"],
+                     self.current_session["duration"], points)
+                )
+                self.current_session["id"] = cursor.lastrowid
+                
+                # Rollups are bucketed by end time, like the JSON backend
+                end_time = self.current_session["end_time"]
+                self.conn.execute(UPSERT_ROLLUP.format(table="daily_rollups", key="date"),
+                                  (end_time[:10], channel, points, self.current_session["duration"]))
+                self.conn.execute(UPSERT_ROLLUP.format(table="hourly_rollups", key="hour"),
+                                  (int(end_time[11:13]), channel, points, self.current_session["duration"]))
+        except Exception as e:
+            print(f"Error saving data: {str(e)}")
+        
+        self.checkpoint.clear()
+        
+        # Reset current session
+        self.current_session = None
+    
+    def recover_sessions(self):
+        """Close sessions orphaned by a restart, using their last checkpoint."""
+        for orphan in self.checkpoint.recover():
+            print(f"Recovering session on {orphan['channel']} from checkpoint at {orphan['checkpoint_time']}")
+            self.current_session = {
+                "id": orphan["id"],
+                "channel": orphan["channel"],
+                "start_time": orphan["start_time"],
+                "end_time": None,
+                "duration": 0,
+                "points": 0
+            }
+            self.end_session(orphan["channel"], orphan["duration"], orphan["points"],
+                             end_time=orphan["checkpoint_time"])
+    
+    @property
+    def version(self):
+        """Changes whenever this or another process commits, for caches built on the data"""
+        return (self._query("PRAGMA data_version")[0][0], self.conn.total_changes)
+    
+    def refresh(self):
+        """Reads always see other processes' commits, so there is nothing to reload"""
+    
+    @property
+    def point_rate_model(self):
+        """Points-per-hour model, caught up with sessions saved by any process"""
+        with self._lock:
+            rows = self._query(
+                "SELECT id, channel, start_time, end_time, duration, points FROM sessions "
+                "WHERE id > ? AND end_time IS NOT NULL ORDER BY end_time",
+                (self._point_rate_id,)
+            )
+            if rows:
+                self._point_rate_model.extend([SessionTable.from_columns(*zip(*rows))])
+                self._point_rate_id = max(row["id"] for row in rows)
+            return self._point_rate_model
+    
+    def get_point_rates(self, moment=None):
+        """Get measured points per hour per channel at a moment (now by default), best first."""
+        return self.point_rate_model.rank(moment=moment)
+    
+    def _query(self, sql, params=()):
+        """Run a read query and return all rows"""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+    
+    def get_channel_stats(self):
+        """Get statistics for all channels."""
+        rows = self._query("SELECT channel, watchtime, points, sessions FROM channels")
+        return [{
+            "channel": row["channel"],
+            "watchtime": round(row["watchtime"] / 60, 2),  # Convert to hours
+            "points": row["points"],
+            "sessions": row["sessions"]
+        } for row in rows]
+    
+    def get_daily_stats(self, channel=None):
+        """Get points, minutes and sessions farmed per day, oldest first."""
+        where, params = ("WHERE channel = ?", (channel,)) if channel is not None else ("", ())
+        rows = self._query(
+            "SELECT date, SUM(points) AS points, SUM(minutes) AS duration, SUM(sessions) AS sessions "
+            f"FROM daily_rollups {where} GROUP BY date ORDER BY date",
+            params
+        )
+        return [dict(row) for row in rows]
+    
+    def get_hourly_stats(self, channel=None):
+        """Get points, minutes and sessions farmed per hour of day (0-23)."""
+        where, params = ("WHERE channel = ?", (channel,)) if channel is not None else ("", ())
+        rows = self._query(
+            "SELECT hour, SUM(points) AS points, SUM(minutes) AS duration, SUM(sessions) AS sessions "
+            f"FROM hourly_rollups {where} GROUP BY hour",
+            params
+        )
+        by_hour = {row["hour"]: dict(row) for row in rows}
+        return [by_hour.get(hour, {"hour": hour, "points": 0, "duration": 0, "sessions": 0})
+                for hour in range(24)]
+    
+    def get_total_points(self):
+        """Get the total points earned."""
+        return self._query("SELECT COALESCE(SUM(points), 0) FROM channels")[0][0]
+    
+    def get_total_watchtime(self):
+        """Get the total watchtime in hours."""
+        total = self._query("SELECT COALESCE(SUM(watchtime), 0) FROM channels")[0][0]
+        return round(total / 60, 2)  # Convert to hours
+    
+    def get_total_sessions(self):
+        """Get the total number of sessions."""
+        return self._query("SELECT COALESCE(SUM(sessions), 0) FROM channels")[0][0]
+    
+    def get_all_sessions(self):
+        """Get all farming sessions."""
+        rows = self._query(
+            "SELECT id, channel, start_time, end_time, duration, points FROM sessions ORDER BY id"
+        )
+        return [dict(row) for row in rows]
+    
+    def _window(self, start=None, end=None, channel=None):
+        """Build the WHERE clause for a start time window and optional channel"""
+        clauses, params = [], []
+        if channel is not None:
+            clauses.append("channel = ?")
+            params.append(channel)
+        if start is not None:
+            clauses.append("start_time >= ?")
+            params.append(start.isoformat() if isinstance(start, datetime) else start)
+        if end is not None:
+            clauses.append("start_time < ?")
+            params.append(end.isoformat() if isinstance(end, datetime) else end)
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, tuple(params)
+    
+    def sessions_frame(self, start=None, end=None, channel=None):
+        """Get farming sessions as a DataFrame with typed columns."""
+        where, params = self._window(start, end, channel)
+        rows = self._query(
+            "SELECT id, channel, start_time, end_time, duration, points "
+            f"FROM sessions {where} ORDER BY start_time",
+            params
+        )
+        return SessionTable.from_columns(*zip(*rows) if rows else ([],) * 6).frame()
+    
+    def get_sessions_between(self, start=None, end=None, channel=None):
+        """Get sessions that started in [start, end), oldest first."""
+        where, params = self._window(start, end, channel)
+        rows = self._query(
+            "SELECT id, channel, start_time, end_time, duration, points "
+            f"FROM sessions {where} ORDER BY start_time",
+            params
+        )
+        return [dict(row) for row in rows]
+    
+    def get_sessions_page(self, page=0, page_size=50, channel=None):
+        """Get one page of sessions, newest first."""
+        where, params = self._window(channel=channel)
+        rows = self._query(
+            "SELECT id, channel, start_time, end_time, duration, points "
+            f"FROM sessions {where} ORDER BY start_time DESC LIMIT ? OFFSET ?",
+            params + (page_size, page * page_size)
+        )
+        return [dict(row) for row in rows]
+    
+    def sessions_page_frame(self, page=0, page_size=50, channel=None):
+        """Get one page of sessions, newest first, as a DataFrame with typed columns."""
+        where, params = self._window(channel=channel)
+        rows = self._query(
+            "SELECT id, channel, start_time, end_time, duration, points "
+            f"FROM sessions {where} ORDER BY start_time DESC LIMIT ? OFFSET ?",
+            params + (page_size, page * page_size)
+        )
+        return SessionTable.from_columns(*zip(*rows) if rows else ([],) * 6).frame()
+    
+    def iter_sessions(self, page_size=100, channel=None):
+        """Iterate over sessions newest first, loading one page at a time."""
+        page = 0
+        while True:
+            sessions = self.get_sessions_page(page, page_size, channel)
+            if not sessions:
+                return
+            yield from sessions
+            page += 1
+    
+    def count_sessions(self, channel=None):
+        """Get the number of stored (not retired) sessions, overall or for one channel."""
+        where, params = self._window(channel=channel)
+        return self._query(f"SELECT COUNT(*) FROM sessions {where}", params)[0][0]
+    
+    def has_data(self):
+        """Check if there is any farming data."""
+        return self.get_total_sessions() > 0
+
+if __name__ == "__main__":
+    # Usage: python sqlite_data_manager.py farming_data.json farming_data.db [--force]
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    if len(args) != 2:
+        print("Usage: python sqlite_data_manager.py <farming_data.json> <database.db> [--force]")
+        sys.exit(1)
+    
+    if SQLiteDataManager(args[1]).import_json(args[0], force="--force" in sys.argv) is None:
+        sys.exit(1)
@@ -0,0 +1,112 @@
+"""
+Tag Index for the Twitch Auto-Farmer
+Inverted tag -> channels index and set-algebra channel queries
+"""
+
+import re
+
+# Tokens of a query: parentheses, or runs of anything else up to whitespace or a parenthesis
+TOKEN = re.compile(r"\(|\)|[^\s()]+")
+
+class QueryError(ValueError):
+    """Raised for a channel query that cannot be parsed"""
+
+class TagIndex:
+    def __init__(self, channels=None):
+        """Create an index, optionally built from channel_data["channels"]"""
+        self._channels = {}  # Tag -> set of channels
+        if channels:
+            self.rebuild(channels)
+    
+    def rebuild(self, channels):
+        """Re-index every channel's tags"""
+        self._channels = {}
+        for channel, stats in channels.items():
+            for tag in stats.get("tags", []):
+                self.add(channel, tag)
+    
+    def add(self, channel, tag):
+        """Record that a channel has a tag"""
+        self._channels.setdefault(tag.lower(), set()).add(channel)
+    
+    def remove(self, channel, tag):
+        """Record that a channel no longer has a tag"""
+        channels = self._channels.get(tag.lower())
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self._channels[tag.lower()]
+    
+    def channels(self, tag):
+        """Channels with a tag (tags match case-insensitively)"""
+        return self._channels.get(tag.lower(), set())
+    
+    def tags(self):
+        """Every tag in use"""
+        return sorted(self._channels)
+
+def query(expression, resolve, universe):
+    """Evaluate a set-algebra query such as "live AND tag:fps AND NOT tag:late"
+    
+    Terms are resolved to sets of channels by `resolve(term)`, which returns None for
+    unknown terms. NOT binds tightest, then AND, then OR; parentheses group, and
+    terms next to each other are ANDed. NOT is taken relative to `universe`.
+    """
+    tokens = TOKEN.findall(expression)
+    position = 0
+    
+    def peek():
+        return tokens[position].upper() if position < len(tokens) else None
+    
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+    
+    def parse_or():
+        result = parse_and()
+        while peek() == "OR":
+            take()
+            result = result | parse_and()
+        return result
+    
+    def parse_and():
+        result = parse_not()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            result = result & parse_not()
+        return result
+    
+    def parse_not():
+        if peek() == "NOT":
+            take()
+            return universe - parse_not()
+        return parse_term()
+    
+    def parse_term():
+        token = peek()
+        if token is None:
+            raise QueryError(f"Unexpected end of query: {expression!r}")
+        if token == "(":
+            take()
+            result = parse_or()
+            if peek() != ")":
+                raise QueryError(f"Missing ')' in query: {expression!r}")
+            take()
+            return result
+        if token in ("AND", "OR", ")"):
+            raise QueryError(f"Unexpected {tokens[position]!r} in query: {expression!r}")
+        
+        term = take()
+        result = resolve(term)
+        if result is None:
+            raise QueryError(f"Unknown term {term!r} in query: {expression!r}")
+        return set(result)
+    
+    if not tokens:
+        return set(universe)
+    result = parse_or()
+    if position < len(tokens):
+        raise QueryError(f"Unexpected {tokens[position]!r} in query: {expression!r}")
+    return result
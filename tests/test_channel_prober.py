@@ -0,0 +1,142 @@
+"""
+Tests for the channel prober, against a stub of the preview image server
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import channel_prober
+from channel_prober import BACKOFF_BASE, ChannelProber
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse can be observed
+    
+    def do_GET(self):
+        channel = self.path.split("live_user_")[1].split("-")[0]
+        self.server.requests.append((channel, self.client_address))
+        status = self.server.responses.get(channel, 200)
+        if status == "slow":
+            time.sleep(1)
+            status = 200
+        
+        body = b"jpeg" if status == 200 else b""
+        self.send_response(status)
+        if status == 302:
+            self.send_header("Location", "/ttv-static/404_preview-80x45.jpg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class FakeStore:
+    def refresh(self):
+        return False
+
+class FakeChannelManager:
+    def __init__(self, channels=()):
+        self.store = FakeStore()
+        self.channel_data = {"channels": {channel: {} for channel in channels}}
+        self.updates = []
+    
+    def update_many(self, updates):
+        self.updates.append(updates)
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PreviewHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.responses = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_prober(server):
+    probers = []
+    
+    def make(channels=(), **kwargs):
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        prober = ChannelProber(FakeChannelManager(channels), base_url=base_url, **kwargs)
+        probers.append(prober)
+        return prober
+    
+    yield make
+    for prober in probers:
+        prober.close()
+
+def test_live_and_offline(server, make_prober):
+    server.responses = {"live": 200, "offline": 302, "gone": 404}
+    prober = make_prober(["live", "offline", "gone"])
+    
+    assert prober.probe_all() == {"live": True, "offline": False, "gone": False}
+    assert prober.channel_manager.updates == [
+        {"live": {"online": True}, "offline": {"online": False}, "gone": {"online": False}}
+    ]
+
+def test_channel_names_are_lowercased(server, make_prober):
+    prober = make_prober()
+    
+    assert prober.probe("SomeStreamer") is True
+    assert server.requests[0][0] == "somestreamer"
+
+def test_connection_is_reused(server, make_prober):
+    prober = make_prober(concurrency=1)
+    
+    for channel in ("a", "b", "c", "d"):
+        assert prober.probe(channel) is True
+    
+    # Every request came in over the same keep-alive connection
+    assert len({address for _, address in server.requests}) == 1
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_failed_probe_backs_off(server, make_prober, status):
+    server.responses = {"busy": status}
+    prober = make_prober(["busy"])
+    
+    assert prober.probe_all() == {}
+    assert prober.channel_manager.updates == []
+    assert prober._retry_at["busy"] - time.monotonic() == pytest.approx(BACKOFF_BASE, abs=1)
+    
+    # Skipped while backing off
+    prober.probe_all()
+    assert len(server.requests) == 1
+    
+    # The delay doubles with each failure in a row
+    prober._retry_at["busy"] = 0
+    prober.probe_all()
+    assert len(server.requests) == 2
+    assert prober._retry_at["busy"] - time.monotonic() == pytest.approx(2 * BACKOFF_BASE, abs=1)
+    
+    # A successful probe clears the backoff
+    server.responses = {}
+    prober._retry_at["busy"] = 0
+    assert prober.probe_all() == {"busy": True}
+    assert "busy" not in prober._retry_at
+    assert "busy" not in prober._failures
+
+def test_backoff_is_capped(server, make_prober, monkeypatch):
+    monkeypatch.setattr(channel_prober, "BACKOFF_MAX", 45)
+    server.responses = {"busy": 503}
+    prober = make_prober(["busy"])
+    
+    for _ in range(4):
+        prober._retry_at["busy"] = 0
+        prober.probe_all()
+    assert prober._retry_at["busy"] - time.monotonic() == pytest.approx(45, abs=1)
+
+def test_timeout(server, make_prober):
+    server.responses = {"slow": "slow", "live": 200}
+    prober = make_prober(["slow", "live"], timeout=0.2)
+    
+    started = time.monotonic()
+    assert prober.probe_all() == {"live": True}
+    assert time.monotonic() - started < 1
+    assert prober._failures == {"slow": 1}
@@ -0,0 +1,200 @@
+"""
+Tests for the notification dispatcher's retries, dead letters and due-time ordering, and
+for its webhook handler against a stub HTTP server
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import notification_dispatcher
+from notification_dispatcher import NotificationDispatcher, PermanentError, RetryLater
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(notification_dispatcher, "RETRY_BASE", 0.01)
+    dispatcher = NotificationDispatcher(workers=1, max_attempts=3, timeout=1)
+    yield dispatcher
+    dispatcher.stop()
+
+def failing(times, error=ConnectionError):
+    """Handler that raises `error` for the first `times` calls, recording every call"""
+    calls = []
+    
+    def handler(payload):
+        calls.append(payload)
+        if len(calls) <= times:
+            raise error("provider unavailable")
+    
+    handler.calls = calls
+    return handler
+
+def test_transient_error_is_retried(dispatcher):
+    handler = failing(2)
+    dispatcher.register("sms", handler)
+    
+    dispatcher.submit("sms", {"body": "hello"})
+    assert dispatcher.flush(timeout=5)
+    
+    assert len(handler.calls) == 3
+    assert dispatcher.delivered == 1
+    assert not dispatcher.dead_letters
+
+def test_transient_error_gives_up_after_max_attempts(dispatcher):
+    handler = failing(10)
+    dispatcher.register("sms", handler)
+    
+    dispatcher.submit("sms", {"body": "hello"})
+    assert dispatcher.flush(timeout=5)
+    
+    assert len(handler.calls) == 3
+    assert dispatcher.delivered == 0
+    [letter] = dispatcher.dead_letters
+    assert letter["attempts"] == 3
+    assert letter["error"] == "provider unavailable"
+
+def test_permanent_error_goes_straight_to_dead_letters(dispatcher):
+    handler = failing(1, error=PermanentError)
+    dispatcher.register("sms", handler)
+    
+    dispatcher.submit("sms", {"body": "hello"})
+    assert dispatcher.flush(timeout=5)
+    
+    assert len(handler.calls) == 1
+    [letter] = dispatcher.dead_letters
+    assert letter["kind"] == "sms"
+    assert letter["payload"] == {"body": "hello"}
+    assert letter["attempts"] == 1
+    assert "failed_at" in letter
+
+def test_unknown_kind_goes_to_dead_letters(dispatcher):
+    dispatcher.submit("pager", {"body": "hello"})
+    assert dispatcher.flush(timeout=5)
+    
+    [letter] = dispatcher.dead_letters
+    assert letter["attempts"] == 1
+    assert "No handler" in letter["error"]
+
+def test_jobs_are_delivered_in_due_order(dispatcher):
+    calls = []
+    delays = {"late": 0.4, "soon": 0.2}
+    
+    def handler(payload):
+        calls.append(payload)
+        # First try of a delayed job asks to be retried after its delay
+        if payload in delays and calls.count(payload) == 1:
+            raise RetryLater("HTTP 429", delays[payload])
+    
+    dispatcher.register("sms", handler)
+    with dispatcher._wakeup:
+        # Queued together, so the single worker sees them all at once
+        for payload in ("late", "soon", "first", "second"):
+            dispatcher.submit("sms", payload)
+    assert dispatcher.flush(timeout=5)
+    
+    # Due now in submission order, then the retries by due time rather than by when they failed
+    assert calls == ["late", "soon", "first", "second", "soon", "late"]
+    assert dispatcher.delivered == 4
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse can be observed
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body, self.client_address, time.monotonic()))
+        
+        # Each path answers with its listed statuses in turn, then 200
+        statuses = self.server.responses.get(self.path, [])
+        status = statuses.pop(0) if statuses else 200
+        if status == "slow":
+            time.sleep(1)
+            status = 200
+        
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0.5")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.responses = {}
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_webhook_posts_json_over_one_connection(dispatcher, server):
+    for n in range(3):
+        dispatcher.submit("webhook", {"url": f"{server.url}/hook", "json": {"n": n}})
+        assert dispatcher.flush(timeout=5)
+    
+    assert [(path, body) for path, body, _, _ in server.requests] == [
+        ("/hook", {"n": 0}), ("/hook", {"n": 1}), ("/hook", {"n": 2})
+    ]
+    # The pooled session kept the connection open between deliveries
+    assert len({client for _, _, client, _ in server.requests}) == 1
+    assert dispatcher.delivered == 3
+
+def test_webhook_rate_limit_waits_for_retry_after(dispatcher, server):
+    server.responses = {"/hook": [429]}
+    
+    dispatcher.submit("webhook", {"url": f"{server.url}/hook", "json": {}})
+    assert dispatcher.flush(timeout=5)
+    
+    first, second = server.requests
+    assert second[3] - first[3] >= 0.5
+    assert dispatcher.delivered == 1
+    assert not dispatcher.dead_letters
+
+def test_webhook_client_error_is_not_retried(dispatcher, server):
+    server.responses = {"/hook": [404]}
+    
+    dispatcher.submit("webhook", {"url": f"{server.url}/hook", "json": {}})
+    assert dispatcher.flush(timeout=5)
+    
+    assert len(server.requests) == 1
+    [letter] = dispatcher.dead_letters
+    assert letter["attempts"] == 1
+    assert letter["error"].startswith("HTTP 404")
+
+def test_webhook_server_error_is_retried(dispatcher, server):
+    server.responses = {"/flaky": [500, 503], "/down": [500] * 3}
+    
+    dispatcher.submit("webhook", {"url": f"{server.url}/flaky", "json": {}})
+    dispatcher.submit("webhook", {"url": f"{server.url}/down", "json": {}})
+    assert dispatcher.flush(timeout=5)
+    
+    paths = [path for path, _, _, _ in server.requests]
+    assert paths.count("/flaky") == 3
+    assert paths.count("/down") == 3
+    assert dispatcher.delivered == 1
+    [letter] = dispatcher.dead_letters
+    assert letter["payload"]["url"].endswith("/down")
+    assert letter["attempts"] == 3
+
+def test_webhook_timeout_is_retried(server, monkeypatch):
+    monkeypatch.setattr(notification_dispatcher, "RETRY_BASE", 0.01)
+    dispatcher = NotificationDispatcher(workers=1, max_attempts=2, timeout=0.2)
+    server.responses = {"/hook": ["slow"]}
+    
+    start = time.monotonic()
+    dispatcher.submit("webhook", {"url": f"{server.url}/hook", "json": {}})
+    assert dispatcher.flush(timeout=5)
+    dispatcher.stop()
+    
+    # The first try gave up without waiting for the slow answer, and the second got through
+    assert time.monotonic() - start < 1
+    assert len(server.requests) == 2
+    assert dispatcher.delivered == 1
@@ -8,8 +8,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from event_bus import BonusClaimed, FarmingError, PointsChanged, StreamOffline, StreamOnline, event_bus
+
+# Points a bonus claim is worth (Twitch's standard claim)
+BONUS_POINTS = 50
+
 class TwitchBot:
-    def __init__(self, username, password):
+    def __init__(self, username, password, events=None):
         self.username = username
         self.password = password
         self.driver = None
@@ -19,6 +24,9 @@ class TwitchBot:
         self.points_after = 0
         self.gained_points = 0
         self.latest_log = ""
+        self.session_points = 0  # Points gained since farming started
+        self.live = None  # Whether the stream was live at the last check
+        self.events = events or event_bus  # Bus the bot publishes its farming events on
         self.setup_driver()
         
     def setup_driver(self):
@@ -104,6 +112,8 @@ class TwitchBot:
             self.points_before = 0
             self.points_after = 0
             self.gained_points = 0
+            self.session_points = 0
+            self.live = None
             
             # Navigate to the channel
             self.log(f"Navigating to channel: {channel}")
@@ -145,15 +155,25 @@ class TwitchBot:
                     new_points = self.get_current_points()
                     if new_points > self.points_after:
                         self.points_after = new_points
-                        self.gained_points += (self.points_after - self.points_before)
+                        gained = self.points_after - self.points_before
+                        self.gained_points += gained
                         self.points_before = self.points_after
                         self.log(f"Points updated: {self.points_after}")
+                        if gained > 0:
+                            self.session_points += gained
+                            self.events.publish(PointsChanged(channel, gained, self.points_after, self.session_points))
                     
                     # Check if stream is still live
                     if self.is_stream_offline():
+                        if self.live is not False:
+                            self.live = False
+                            self.events.publish(StreamOffline(channel))
                         self.log(f"Stream appears to be offline. Refreshing...")
                         self.driver.refresh()
                         time.sleep(5)
+                    elif self.live is not True:
+                        self.live = True
+                        self.events.publish(StreamOnline(channel))
                     
                     # Move mouse and perform random actions to appear active
                     self.simulate_activity()
@@ -163,10 +183,12 @@ class TwitchBot:
                     
                 except Exception as e:
                     self.log(f"Error during farming loop: {str(e)}")
+                    self.events.publish(FarmingError(channel, str(e)))
                     time.sleep(10)
             
         except Exception as e:
             self.log(f"Error starting farming: {str(e)}")
+            self.events.publish(FarmingError(channel, str(e)))
             self.running = False
     
     def stop_farming(self):
@@ -216,6 +238,7 @@ class TwitchBot:
             if bonus_button and bonus_button.is_displayed():
                 bonus_button.click()
                 self.log("Claimed bonus points!")
+                self.events.publish(BonusClaimed(self.channel, BONUS_POINTS))
                 return True
                 
         except NoSuchElementException:
@@ -0,0 +1,137 @@
+"""
+Uptime Histogram for the Twitch Auto-Farmer
+Decaying per-hour-of-week counts of a channel's live/offline probes, for predicting when it streams
+"""
+
+import base64
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Weeks after which an observation counts half as much
+UPTIME_HALF_LIFE_WEEKS = float(os.environ.get("UPTIME_HALF_LIFE_WEEKS", "4"))
+
+# Observations worth of the channel's overall uptime mixed into each hour's estimate
+PRIOR_OBSERVATIONS = 1.0
+
+HOURS_PER_WEEK = 7 * 24
+EPOCH = datetime(1970, 1, 1)  # A Thursday; times are naive local wall-clock time like online_history
+EPOCH_WEEKDAY = 3
+
+def _to_seconds(timestamp):
+    """Convert a datetime or ISO timestamp string to epoch seconds"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return int((timestamp - EPOCH).total_seconds())
+
+def hour_of_week(seconds):
+    """Hour of the week (Monday 00:00 is 0) of epoch seconds; works on arrays too"""
+    return ((seconds // 86400 + EPOCH_WEEKDAY) % 7) * 24 + (seconds // 3600) % 24
+
+class UptimeHistogram:
+    def __init__(self, half_life_weeks=None):
+        """Create an empty histogram"""
+        half_life = UPTIME_HALF_LIFE_WEEKS if half_life_weeks is None else half_life_weeks
+        self.half_life = half_life * 7 * 86400  # In seconds
+        self.live = np.zeros(HOURS_PER_WEEK, dtype=np.float32)  # Decayed live observations per hour
+        self.total = np.zeros(HOURS_PER_WEEK, dtype=np.float32)  # Decayed observations per hour
+        self.updated = np.zeros(HOURS_PER_WEEK, dtype=np.uint32)  # Epoch seconds each hour was decayed to
+    
+    def __len__(self):
+        """Number of hours of the week with observations"""
+        return int(np.count_nonzero(self.total))
+    
+    def observe(self, online, timestamp=None):
+        """Add a probe; only its hour of the week is touched, decayed to the probe's time"""
+        seconds = _to_seconds(timestamp or datetime.now())
+        hour = hour_of_week(seconds)
+        
+        factor = 0.5 ** (max(seconds - int(self.updated[hour]), 0) / self.half_life)
+        self.live[hour] = self.live[hour] * factor + bool(online)
+        self.total[hour] = self.total[hour] * factor + 1
+        self.updated[hour] = max(seconds, int(self.updated[hour]))
+    
+    def probabilities(self):
+        """Probability of being live in each hour of the week
+        
+        Hours with few observations lean on the channel's overall uptime.
+        """
+        observed = self.total.sum()
+        overall = self.live.sum() / observed if observed else 0.0
+        return (self.live + PRIOR_OBSERVATIONS * overall) / (self.total + PRIOR_OBSERVATIONS)
+    
+    def probability_live(self, moment=None):
+        """Probability that the channel is live at a moment (now by default)"""
+        return float(self.probabilities()[hour_of_week(_to_seconds(moment or datetime.now()))])
+    
+    def next_live_window(self, moment=None, threshold=0.5):
+        """The next stretch of hours the channel is likely live, within a week from a moment
+        
+        Returns (start, end, probability) with the window's mean probability; start is
+        the moment itself if the channel is likely live already. None if no hour of the
+        week reaches the threshold.
+        """
+        moment = moment or datetime.now()
+        hour = hour_of_week(_to_seconds(moment))
+        
+        # The week ahead, starting with the current hour
+        ahead = np.roll(self.probabilities(), -hour)
+        likely = ahead >= threshold
+        if not likely.any():
+            return None
+        
+        first = int(np.argmax(likely))
+        unlikely_after = np.flatnonzero(~likely[first:])
+        length = int(unlikely_after[0]) if len(unlikely_after) else HOURS_PER_WEEK - first
+        
+        hour_start = moment.replace(minute=0, second=0, microsecond=0)
+        start = moment if first == 0 else hour_start + timedelta(hours=first)
+        end = hour_start + timedelta(hours=first + length)
+        return start, end, float(ahead[first:first + length].mean())
+    
+    @classmethod
+    def from_probes(cls, seconds, online, half_life_weeks=None):
+        """Build a histogram from probe arrays (e.g. an OnlineHistory) in one pass"""
+        histogram = cls(half_life_weeks)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        if not len(seconds):
+            return histogram
+        
+        hours = hour_of_week(seconds)
+        latest = np.zeros(HOURS_PER_WEEK, dtype=np.int64)
+        np.maximum.at(latest, hours, seconds)
+        
+        # Each probe decayed to the newest probe of its hour, as observe() would have
+        weights = 0.5 ** ((latest[hours] - seconds) / histogram.half_life)
+        histogram.live = np.bincount(hours, weights * np.asarray(online, dtype=bool),
+                                     minlength=HOURS_PER_WEEK).astype(np.float32)
+        histogram.total = np.bincount(hours, weights, minlength=HOURS_PER_WEEK).astype(np.float32)
+        histogram.updated = latest.astype(np.uint32)
+        return histogram
+    
+    def to_json(self):
+        """Get a compact representation for saving (base64 little-endian arrays)"""
+        return {
+            "live": base64.b64encode(self.live.astype("<f4").tobytes()).decode("ascii"),
+            "total": base64.b64encode(self.total.astype("<f4").tobytes()).decode("ascii"),
+            "updated": base64.b64encode(self.updated.astype("<u4").tobytes()).decode("ascii")
+        }
+    
+    def to_arrays(self):
+        """Like to_json(), but with NumPy arrays for binary codecs"""
+        return {"live": self.live, "total": self.total, "updated": self.updated}
+    
+    @classmethod
+    def from_json(cls, data, half_life_weeks=None):
+        """Rebuild a histogram from to_json()/to_arrays() output"""
+        def unpack(value, dtype):
+            if isinstance(value, str):
+                value = np.frombuffer(base64.b64decode(value), dtype=dtype)
+            return np.array(value, dtype=dtype).reshape(HOURS_PER_WEEK)
+        
+        histogram = cls(half_life_weeks)
+        histogram.live = unpack(data["live"], "<f4").astype(np.float32)
+        histogram.total = unpack(data["total"], "<f4").astype(np.float32)
+        histogram.updated = unpack(data["updated"], "<u4").astype(np.uint32)
+        return histogram
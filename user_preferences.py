@@ -3,10 +3,11 @@ User Preferences Manager for the Twitch Auto-Farmer
 Handles theme settings, UI preferences, and other user customization options
 """
 
-import os
-import json
 import streamlit as st
 
+from event_bus import BonusClaimed, PointsChanged
+from persistence import JsonStore
+
 # User preferences file
 USER_PREFERENCES_FILE = "user_preferences.json"
 
@@ -99,19 +100,16 @@ ACHIEVEMENT_BADGES = {
 class UserPreferences:
     def __init__(self):
         """Initialize the user preferences manager"""
+        self.store = JsonStore(USER_PREFERENCES_FILE, self.default_preferences, indent=4)
         self.preferences = self.load_preferences()
         self.achievements = self.check_achievements()
         
     def load_preferences(self):
         """Load user preferences from file"""
-        if os.path.exists(USER_PREFERENCES_FILE):
-            try:
-                with open(USER_PREFERENCES_FILE, "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading user preferences: {str(e)}")
-        
-        # Default preferences
+        return self.store.load()
+    
+    def default_preferences(self):
+        """Default user preferences"""
         return {
             "theme": "Default",
             "custom_theme": {
@@ -126,16 +124,16 @@ class UserPreferences:
             "show_recommendations": True,
             "animated_badges": True,
             "achievements": {},
+            "bonus_claims": 0,  # Bonus drops claimed so far, for the Bonus Hunter achievement
             "multiple_accounts": []
         }
     
     def save_preferences(self):
-        """Save user preferences to file"""
-        try:
-            with open(USER_PREFERENCES_FILE, "w") as f:
-                json.dump(self.preferences, f, indent=4)
-        except Exception as e:
-            print(f"Error saving user preferences: {str(e)}")
+        """Save user preferences to file as a whole (coalesced with other pending changes)
+
+        Prefer self.store.update(), which keeps changes made by other processes.
+        """
+        self.store.mark_dirty()
     
     def get_theme(self):
         """Get the current theme settings"""
@@ -191,16 +189,40 @@ class UserPreferences:
     
     def unlock_achievement(self, achievement_id):
         """Unlock a new achievement"""
+        self.store.refresh()
         if achievement_id not in self.preferences["achievements"]:
             # Mark as newly unlocked
-            self.preferences["achievements"][achievement_id] = {
-                "unlocked_at": "NOW",  # This would normally be a timestamp
-                "new": True
-            }
-            self.save_preferences()
+            def apply(data):
+                data["achievements"].setdefault(achievement_id, {
+                    "unlocked_at": "NOW",  # This would normally be a timestamp
+                    "new": True
+                })
+            self.store.update(apply)
             return True
         return False
     
+    def subscribe(self, bus):
+        """Unlock achievements from a bot's events as they happen"""
+        bus.subscribe(PointsChanged, self._on_points_changed)
+        bus.subscribe(BonusClaimed, self._on_bonus_claimed)
+    
+    def _on_points_changed(self, event):
+        """Event handler: point achievements, going by the points of the session"""
+        if event.session_points >= 5000:
+            self.unlock_achievement("Point Collector")
+        
+        if event.session_points >= 100000:
+            self.unlock_achievement("Twitch Master")
+    
+    def _on_bonus_claimed(self, event):
+        """Event handler: count bonus claims, across sessions and restarts, for the Bonus Hunter achievement"""
+        def apply(data):
+            data["bonus_claims"] = data.get("bonus_claims", 0) + 1
+        self.store.update(apply)
+        
+        if self.preferences.get("bonus_claims", 0) >= ACHIEVEMENT_BADGES["Bonus Hunter"]["requirement"]["value"]:
+            self.unlock_achievement("Bonus Hunter")
+    
     def render_theme_settings(self):
         """Render the theme settings UI in Streamlit"""
         st.subheader("Dashboard Appearance")
@@ -320,13 +342,17 @@ class UserPreferences:
         # Save button
         if st.button("Save Appearance Settings"):
             # Update preferences
-            self.preferences["dragdrop_enabled"] = dragdrop_enabled
-            self.preferences["show_recommendations"] = show_recommendations
-            self.preferences["animated_badges"] = animated_badges
-            self.preferences["show_tutorial"] = show_tutorial
+            changes = {
+                "theme": self.preferences["theme"],
+                "custom_theme": self.preferences.get("custom_theme"),
+                "dragdrop_enabled": dragdrop_enabled,
+                "show_recommendations": show_recommendations,
+                "animated_badges": animated_badges,
+                "show_tutorial": show_tutorial
+            }
             
             # Save preferences
-            self.save_preferences()
+            self.store.update(lambda data: data.update(changes))
             
             # Show success message
             st.success("Appearance settings saved! Refresh the page to see all changes.")
@@ -334,6 +360,7 @@ class UserPreferences:
     def render_achievements(self):
         """Render the achievements UI in Streamlit"""
         st.subheader("Achievements")
+        self.store.refresh()
         
         # Achievement stats
         unlocked = len(self.preferences.get("achievements", {}))
@@ -362,8 +389,10 @@ class UserPreferences:
                 
                 # Clear new flag when viewed
                 if is_new:
-                    self.preferences["achievements"][badge_id]["new"] = False
-                    self.save_preferences()
+                    def apply(data, badge_id=badge_id):
+                        if badge_id in data["achievements"]:
+                            data["achievements"][badge_id]["new"] = False
+                    self.store.update(apply)
             
             # Create badge UI
             opacity = "1.0" if is_unlocked else "0.4"
@@ -388,6 +417,7 @@ class UserPreferences:
     def render_multiple_accounts(self):
         """Render the multiple accounts UI in Streamlit"""
         st.subheader("Manage Multiple Accounts")
+        self.store.refresh()
         
         accounts = self.preferences.get("multiple_accounts", [])
         
@@ -409,9 +439,10 @@ class UserPreferences:
                     
                 # Delete button
                 if col3.button("Delete", key=f"delete_account_{i}"):
-                    accounts.pop(i)
-                    self.preferences["multiple_accounts"] = accounts
-                    self.save_preferences()
+                    def apply(data, username=account["username"]):
+                        data["multiple_accounts"] = [a for a in data.get("multiple_accounts", [])
+                                                     if a["username"] != username]
+                    self.store.update(apply)
                     st.success(f"Deleted account: {account['username']}")
                     st.rerun()
             
@@ -430,14 +461,17 @@ class UserPreferences:
                 
                 if not exists:
                     # Add new account
-                    accounts.append({
+                    account = {
                         "username": new_username,
                         "password": new_password
-                    })
+                    }
                     
                     # Save updated accounts
-                    self.preferences["multiple_accounts"] = accounts
-                    self.save_preferences()
+                    def apply(data):
+                        accounts = data.setdefault("multiple_accounts", [])
+                        if not any(a["username"] == account["username"] for a in accounts):
+                            accounts.append(account)
+                    self.store.update(apply)
                     
                     st.success(f"Added new account: {new_username}")
                     